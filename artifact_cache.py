@@ -0,0 +1,102 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import config
+import debug
+import evaluation_cache
+
+# The cache shared by all evaluations; None unless the user asked for one
+cache = None
+
+def open_cache(directory, size_cap, keep_best):
+    global cache
+    cache = ArtifactCache(directory, size_cap, keep_best)
+    return cache
+
+def make_key(individual):
+    """Binaries are addressed by the code PPCG generated and by how it is built"""
+    canonical = [config.Arguments.target,
+                 config.Arguments.build_cmd,
+                 evaluation_cache.machine_fingerprint(),
+                 evaluation_cache.canonical_flags(individual.cc_flags),
+                 evaluation_cache.canonical_flags(individual.cxx_flags),
+                 evaluation_cache.canonical_flags(individual.nvcc_flags),
+                 individual.code_digest]
+    return hashlib.sha1(json.dumps(canonical)).hexdigest()
+
+class ArtifactCache:
+    """A content-addressed store of built executables. The least recently used
+    executables are evicted once the store exceeds its size cap, except for
+    those of the best configurations seen so far"""
+
+    def __init__(self, directory, size_cap, keep_best):
+        self.directory = directory
+        self.size_cap  = size_cap
+        self.keep_best = keep_best
+        self.best      = []
+        self.lock      = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.exe')
+
+    def fetch(self, key, destination):
+        """Copy the executable stored under this key to the destination. Returns
+        False if there is no such executable"""
+        with self.lock:
+            if not os.path.exists(self.path(key)):
+                return False
+            # Touching the file marks it as recently used
+            os.utime(self.path(key), None)
+            shutil.copy2(self.path(key), destination)
+        return True
+
+    def store(self, key, executable):
+        with self.lock:
+            if os.path.exists(self.path(key)):
+                os.utime(self.path(key), None)
+                return
+            # Copy then rename so that other processes sharing the directory
+            # never see a partially written executable
+            handle, temporary = tempfile.mkstemp(dir=self.directory)
+            os.close(handle)
+            shutil.copy2(executable, temporary)
+            os.rename(temporary, self.path(key))
+            self.evict()
+
+    def record(self, key, execution_time):
+        """Remember the execution time of an executable so that the executables of
+        the best configurations are never evicted"""
+        with self.lock:
+            if key in [best_key for best_time, best_key in self.best]:
+                return
+            self.best.append((execution_time, key))
+            self.best.sort()
+            del self.best[self.keep_best:]
+
+    def evict(self):
+        pinned  = set(best_key + '.exe' for best_time, best_key in self.best)
+        entries = []
+        total   = 0
+        for file_name in os.listdir(self.directory):
+            the_file = os.path.join(self.directory, file_name)
+            if not file_name.endswith('.exe'):
+                continue
+            stat   = os.stat(the_file)
+            total += stat.st_size
+            if file_name not in pinned:
+                entries.append((stat.st_mtime, stat.st_size, the_file))
+        entries.sort()
+        for mtime, size, the_file in entries:
+            if total <= self.size_cap:
+                break
+            debug.verbose_message("Evicting '%s' from the artifact cache" % the_file, __name__)
+            try:
+                os.remove(the_file)
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,264 @@
+import math
+import random
+import collections
+import numpy
+import config
+import compiler_flags
+import debug
+import enums
+import individual
+import internal_exceptions
+import evaluation_cache
+import evaluation_engine
+import heuristic_search
+import constraints
+
+class GaussianProcess:
+    """Gaussian-process regression with a squared-exponential kernel. The length
+    scale is chosen from a small grid by maximising the marginal likelihood, and
+    the targets are standardised so that one noise level suits every problem"""
+
+    LENGTH_SCALES = [0.05, 0.1, 0.2, 0.4, 0.8]
+    NOISE         = 1e-3
+
+    def fit(self, X, y):
+        self.X        = X
+        self.y_mean   = y.mean()
+        self.y_std    = y.std() or 1.0
+        z             = (y - self.y_mean) / self.y_std
+        best_evidence = None
+        for length_scale in GaussianProcess.LENGTH_SCALES:
+            K = self.kernel(X, X, length_scale) + GaussianProcess.NOISE * numpy.eye(len(X))
+            try:
+                L = numpy.linalg.cholesky(K)
+            except numpy.linalg.LinAlgError:
+                continue
+            alpha    = numpy.linalg.solve(L.T, numpy.linalg.solve(L, z))
+            evidence = -0.5 * z.dot(alpha) - numpy.log(numpy.diag(L)).sum()
+            if best_evidence is None or evidence > best_evidence:
+                best_evidence     = evidence
+                self.length_scale = length_scale
+                self.L            = L
+                self.alpha        = alpha
+        assert best_evidence is not None, "The covariance matrix is singular for every length scale"
+
+    def kernel(self, A, B, length_scale):
+        # Distances are relative to the diagonal of the unit hypercube so that
+        # the length scales mean the same whatever the number of features
+        distances = (A**2).sum(1)[:, None] + (B**2).sum(1)[None, :] - 2 * A.dot(B.T)
+        return numpy.exp(-numpy.maximum(distances, 0) / (2 * length_scale**2 * A.shape[1]))
+
+    def predict(self, X):
+        """The mean and standard deviation of the posterior at each row of X"""
+        K_star   = self.kernel(X, self.X, self.length_scale)
+        mean     = K_star.dot(self.alpha)
+        v        = numpy.linalg.solve(self.L, K_star.T)
+        variance = numpy.maximum(1.0 - (v**2).sum(0), 1e-12)
+        return mean * self.y_std + self.y_mean, numpy.sqrt(variance) * self.y_std
+
+def normal_cdf(z):
+    return 0.5 * (1.0 + numpy.vectorize(math.erf)(z / math.sqrt(2.0)))
+
+def normal_pdf(z):
+    return numpy.exp(-0.5 * z**2) / math.sqrt(2.0 * math.pi)
+
+def expected_improvement(mean, std, best):
+    """The expected amount by which each prediction improves on (i.e. falls
+    below) the best value observed so far"""
+    z = (best - mean) / std
+    return (best - mean) * normal_cdf(z) + std * normal_pdf(z)
+
+class Candidate:
+    """A configuration under consideration. Individuals are only created for
+    the candidates that are proposed, so that the surrogate can screen
+    thousands of them without consuming individual IDs or workspaces"""
+
+    def __init__(self, ppcg_flags, cc_flags, cxx_flags, nvcc_flags):
+        self.ppcg_flags = ppcg_flags
+        self.cc_flags   = cc_flags
+        self.cxx_flags  = cxx_flags
+        self.nvcc_flags = nvcc_flags
+
+    def key(self):
+        return configuration_key(self)
+
+    def flag_values(self):
+        return {compiler_flags.FlagRegistry.ppcg: self.ppcg_flags,
+                compiler_flags.FlagRegistry.cc:   self.cc_flags,
+                compiler_flags.FlagRegistry.cxx:  self.cxx_flags,
+                compiler_flags.FlagRegistry.nvcc: self.nvcc_flags}
+
+    def features(self):
+        return individual.features(self.ppcg_flags, self.cc_flags, self.cxx_flags, self.nvcc_flags)
+
+    def realise(self):
+        testcase            = individual.Individual()
+        testcase.ppcg_flags = self.ppcg_flags
+        testcase.cc_flags   = self.cc_flags
+        testcase.cxx_flags  = self.cxx_flags
+        testcase.nvcc_flags = self.nvcc_flags
+        return testcase
+
+def configuration_key(configuration):
+    return tuple(tuple(evaluation_cache.canonical_flags(flags)) for flags in [configuration.ppcg_flags,
+                                                                              configuration.cc_flags,
+                                                                              configuration.cxx_flags,
+                                                                              configuration.nvcc_flags])
+
+def random_flags(the_flags):
+    return collections.OrderedDict((flag, flag.random_value()) for flag in the_flags)
+
+def random_candidate():
+    return Candidate(random_flags(compiler_flags.PPCG.optimisation_flags),
+                     random_flags(compiler_flags.CC.optimisation_flags),
+                     random_flags(compiler_flags.CXX.optimisation_flags),
+                     random_flags(compiler_flags.NVCC.optimisation_flags))
+
+def perturb(flags, rate):
+    perturbed = collections.OrderedDict()
+    for flag, value in flags.iteritems():
+        if random.random() < rate:
+            if isinstance(flag, compiler_flags.SizesFlag):
+                value = flag.permute(value)
+            else:
+                value = flag.random_value()
+        perturbed[flag] = value
+    return perturbed
+
+def neighbour(testcase, rate):
+    return Candidate(perturb(testcase.ppcg_flags, rate),
+                     perturb(testcase.cc_flags, rate),
+                     perturb(testcase.cxx_flags, rate),
+                     perturb(testcase.nvcc_flags, rate))
+
+class Bayesian(heuristic_search.SearchStrategy):
+    """Search using Bayesian optimisation. A Gaussian process models the
+    logarithm of the execution time as a function of the encoded flags, and
+    each batch is chosen to maximise the expected improvement over the fittest
+    individual so far. Batches are as large as the number of compile workers;
+    within a batch, each proposal is assumed to perform as predicted (the
+    'kriging believer') so that the rest of the batch looks elsewhere"""
+
+    # The fraction of the flags changed in neighbours of the fittest individuals
+    PERTURBATION_RATE = 0.2
+
+    def run(self):
+        self.individuals = []
+        self.evaluated   = set()
+        self.engine      = evaluation_engine.EvaluationEngine(config.Arguments.num_compile_threads)
+        try:
+            self.optimise()
+        finally:
+            self.engine.shutdown()
+
+    def optimise(self):
+        batch_size = config.Arguments.batch_size or self.engine.num_compile_threads
+        initial    = min(config.Arguments.initial_samples, config.Arguments.evaluations)
+        debug.verbose_message("Sampling %d initial configurations" % initial, __name__)
+        self.evaluate(self.distinct([random_candidate() for i in xrange(2 * initial)])[:initial])
+        while len(self.individuals) < config.Arguments.evaluations:
+            proposals = self.propose(min(batch_size, config.Arguments.evaluations - len(self.individuals)))
+            if not proposals:
+                debug.verbose_message("No candidate was left once those evaluated already or breaking a constraint were dropped", __name__)
+                break
+            self.evaluate(proposals)
+        if not self.individuals:
+            debug.warning_message("No configuration was evaluated, as every candidate broke a constraint")
+
+    def evaluate(self, candidates):
+        batch = [candidate.realise() for candidate in candidates]
+        self.engine.evaluate(batch)
+        self.individuals.extend(batch)
+        self.evaluated.update(configuration_key(testcase) for testcase in batch)
+        heuristic_search.journal_state(enums.SearchStrategy.bayesian,
+                                       evaluations=len(self.individuals),
+                                       fittest=heuristic_search.fittest_time(self.individuals))
+
+    def distinct(self, candidates):
+        """Repair candidates that break a constraint, then drop those that still
+        break one, have been evaluated or occur earlier in the list"""
+        seen   = set(self.evaluated)
+        unique = []
+        for candidate in candidates:
+            if constraints.checker and not constraints.checker.repair(candidate):
+                continue
+            key = candidate.key()
+            if key not in seen:
+                seen.add(key)
+                unique.append(candidate)
+        return unique
+
+    def candidates(self):
+        """Random configurations, to explore, and neighbours of the fittest
+        individuals, to exploit"""
+        pool    = [random_candidate() for i in xrange(config.Arguments.candidates)]
+        passed  = sorted((testcase for testcase in self.individuals if testcase.status == enums.Status.passed),
+                         key=lambda testcase: testcase.execution_time)
+        for testcase in passed[:5]:
+            pool.extend(neighbour(testcase, Bayesian.PERTURBATION_RATE) for i in xrange(config.Arguments.candidates/5))
+        return self.distinct(pool)
+
+    def observations(self):
+        """The features of every evaluated individual and the logarithm of its
+        execution time. Runs cut short by --kill-slower-runs count with the
+        lower bound on their time. Failures are modelled as twice as slow as
+        the slowest success, which steers the search away from them"""
+        times = [testcase.execution_time for testcase in self.individuals
+                 if testcase.measured() and 0 < testcase.execution_time < float("inf")]
+        if not times:
+            return None, None
+        penalty = math.log(2 * max(times))
+        X       = numpy.array([testcase.features() for testcase in self.individuals], dtype=float)
+        y       = numpy.array([math.log(testcase.execution_time)
+                               if testcase.measured() and 0 < testcase.execution_time < float("inf")
+                               else penalty for testcase in self.individuals])
+        return X, y
+
+    def propose(self, batch_size):
+        candidates = self.candidates()
+        if not candidates:
+            return []
+        X, y       = self.observations()
+        if X is None or X.shape[1] == 0:
+            # Nothing to learn from yet
+            return candidates[:batch_size]
+        X_candidates = numpy.array([candidate.features() for candidate in candidates], dtype=float)
+        # Scale every feature to [0,1] over both the observations and the candidates
+        low   = numpy.minimum(X.min(0), X_candidates.min(0))
+        span  = numpy.maximum(X.max(0), X_candidates.max(0)) - low
+        span[span == 0] = 1.0
+        X            = (X - low) / span
+        X_candidates = (X_candidates - low) / span
+        model     = GaussianProcess()
+        best      = y.min()
+        proposals = []
+        remaining = range(len(candidates))
+        while remaining and len(proposals) < batch_size:
+            model.fit(X, y)
+            mean, std = model.predict(X_candidates[remaining])
+            ei        = expected_improvement(mean, std, best)
+            chosen    = int(numpy.argmax(ei))
+            idx       = remaining.pop(chosen)
+            proposals.append(candidates[idx])
+            debug.verbose_message("Proposing a configuration with predicted time %f (+/- %f), expected improvement %g" \
+                                  % (math.exp(mean[chosen]), math.exp(mean[chosen]) * std[chosen], ei[chosen]), __name__)
+            # Believe the prediction until the measurement arrives
+            X = numpy.vstack([X, X_candidates[idx]])
+            y = numpy.append(y, mean[chosen])
+        return proposals
+
+    def summarise(self):
+        print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+        try:
+            fittest = individual.get_fittest(self.individuals)
+            debug.summary_message("The fittest individual had execution time %f seconds after %d evaluations" \
+                                  % (fittest.execution_time, len(self.individuals)))
+            debug.summary_message("To replicate, pass the following to PPCG:")
+            debug.summary_message(fittest.ppcg_cmd_line_flags, False)
+        except internal_exceptions.NoFittestException:
+            pass
+
+    def logall(self):
+        for i in self.individuals:
+            debug.summary_message(i.ppcg_cmd_line_flags, False)
+        return
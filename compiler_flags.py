@@ -1,9 +1,12 @@
 import random
+import math
+import numbers
 import config
 import re
 import os
 import collections
 import abc
+import enums
 
 class Flag:
     """A compiler flag"""
@@ -27,6 +30,17 @@ class Flag:
     def get_command_line_string(self, value):
         pass
     
+    def get_canonical_string(self, value):
+        """A string which is the same for all values that mean the same to the compiler"""
+        return self.get_command_line_string(value)
+    
+    @abc.abstractmethod
+    def features(self, value):
+        """Encode a value as a fixed number of reals for the models which
+        predict performance. A value of None, i.e. a flag that was not set,
+        encodes as zeros"""
+        pass
+    
 class EnumerationFlag(Flag):
     """Models compiler flags where it is easy to enumerate the values up front"""
     
@@ -49,47 +63,139 @@ class EnumerationFlag(Flag):
         else:
             return "%s=%s" % (self.name, value.__str__( ))
     
+    def features(self, value):
+        # Numeric values are ordered, so they keep their rank. Other values are
+        # merely different from each other, so they are one-hot encoded
+        if not self.tuneable or len(self.possible_values) < 2:
+            return []
+        ordered = all(isinstance(the_value, numbers.Number) for the_value in self.possible_values)
+        width   = 1 if ordered else len(self.possible_values)
+        if value not in self.possible_values:
+            return [0.0] * width
+        idx = self.possible_values.index(value)
+        if ordered:
+            return [idx/float(len(self.possible_values)-1)]
+        encoding      = [0.0] * width
+        encoding[idx] = 1.0
+        return encoding
+    
+class ArithmeticLadder:
+    """The values first, first+step, first+2*step, ... of which there are count"""
+    
+    def __init__(self, first, step, count):
+        self.first = first
+        self.step  = step
+        self.count = count
+    
+    def __len__(self):
+        return self.count
+    
+    def __getitem__(self, idx):
+        if not 0 <= idx < self.count:
+            raise IndexError("Ladder index %d out of range" % idx)
+        return self.value(idx)
+    
+    def value(self, idx):
+        # Also defined one past the last value, which bounds log-uniform draws
+        return self.first + idx * self.step
+    
+    def floor_index(self, value):
+        """The index of the largest value not exceeding the given one, or -1"""
+        if value < self.first:
+            return -1
+        return min(int(value - self.first) // self.step, self.count - 1)
+    
+class PowersOfTwoLadder:
+    """The powers of two 2**first_exponent, 2**(first_exponent+1), ... of which
+    there are count"""
+    
+    def __init__(self, first_exponent, count):
+        self.first_exponent = first_exponent
+        self.count          = count
+    
+    def __len__(self):
+        return self.count
+    
+    def __getitem__(self, idx):
+        if not 0 <= idx < self.count:
+            raise IndexError("Ladder index %d out of range" % idx)
+        return self.value(idx)
+    
+    def value(self, idx):
+        return 2**(self.first_exponent + idx)
+    
+    def floor_index(self, value):
+        if value < 1:
+            return -1
+        return min(int(value).bit_length() - 1 - self.first_exponent, self.count - 1)
+
+def make_ladder(ladder, size_range, warp_size):
+    """The values in a half-open range that a dimension of a size may take.
+    Sizes are at least 1 whatever the range"""
+    lower, upper = max(size_range[0], 1), size_range[1]
+    if ladder == enums.SizeLadder.powers_of_two:
+        first_exponent = (lower - 1).bit_length()
+        return PowersOfTwoLadder(first_exponent, max((upper - 1).bit_length() - first_exponent, 0))
+    if ladder == enums.SizeLadder.warp_multiples:
+        first = ((lower + warp_size - 1) // warp_size) * warp_size
+        return ArithmeticLadder(first, warp_size, max((upper - 1 - first) // warp_size + 1, 0))
+    return ArithmeticLadder(lower, 1, max(upper - lower, 0))
+    
 class Size:
-    """Models a tile, block or grid size"""
+    """Models a tile, block or grid size. Values are drawn from a ladder which is
+    computed rather than enumerated, so drawing and permuting cost the same
+    whatever the range"""
     
-    def __init__(self, dimensions, lower_bound, upper_bound, product_bound):
+    # The furthest a dimension moves along its ladder when permuted
+    MAX_STEP = 5
+    
+    def __init__(self, dimensions, lower_bound, upper_bound, product_bound, ladder=enums.SizeLadder.linear):
         self.dimensions    = dimensions
         self.lower_bound   = lower_bound
         self.upper_bound   = upper_bound
         self.product_bound = product_bound
+        self.ladder        = make_ladder(ladder, (lower_bound, upper_bound), config.Arguments.warp_size)
+        self.log_uniform   = config.Arguments.size_distribution == enums.SizeDistribution.log_uniform
+    
+    def legal_count(self, product_bound):
+        """How many values of the ladder do not exceed the product bound. If none
+        does, the smallest value is still allowed since a size needs a value"""
+        return max(self.ladder.floor_index(product_bound) + 1, 1)
+    
+    def draw(self, product_bound):
+        count = self.legal_count(product_bound)
+        if self.log_uniform and count > 1:
+            # Every value is as likely as the share of the logarithmic range
+            # up to the next value that it covers
+            low  = self.ladder.value(0)
+            high = self.ladder.value(count)
+            return self.ladder.value(min(self.ladder.floor_index(low * (float(high)/low)**random.random()), count - 1))
+        return self.ladder.value(random.randint(0, count-1))
     
     def random_value(self):
         the_values    = []
         product_bound = self.product_bound
         for i in range(0,self.dimensions):
-            possible_values = [x for x in range(self.lower_bound, self.upper_bound) if x <= product_bound]
-            idx             = random.randint(0,len(possible_values)-1)
-            the_value       = possible_values[idx]
+            the_value      = self.draw(product_bound)
             the_values.append(the_value)
             product_bound /= the_value
         random.shuffle(the_values)
-        size_tuple = ()
-        for i in range(0,self.dimensions):
-            size_tuple += (the_values[i],)
-        return size_tuple
+        return tuple(the_values)
 
     def permute(self, old_size_tuple):
+        """Move every dimension a bounded distance along the ladder"""
         new_size_tuple = ()
         product_bound  = self.product_bound
         for i in range(0, self.dimensions):
-            possible_values = [x for x in range(self.lower_bound, self.upper_bound) if x <= product_bound]
-            old_value       = old_size_tuple[i]
-            if old_value not in possible_values:
-                idx = len(possible_values)-1
-            else:
-                idx = possible_values.index(old_size_tuple[i])
-            distance = random.randint(0, 5) 
-            if bool(random.getrandbits(1)):
-                new_idx = (idx + distance) % len(possible_values)
+            count = self.legal_count(product_bound)
+            if i < len(old_size_tuple):
+                # Values off the ladder move from the value below them
+                idx = min(max(self.ladder.floor_index(old_size_tuple[i]), 0), count-1)
+                idx = min(max(idx + random.randint(-Size.MAX_STEP, Size.MAX_STEP), 0), count-1)
+                the_value = self.ladder.value(idx)
             else:
-                new_idx = (idx - distance) % len(possible_values)
-            the_value = possible_values[new_idx]
-            product_bound /= the_value
+                the_value = self.draw(product_bound)
+            product_bound  /= the_value
             new_size_tuple += (the_value,)
         return new_size_tuple
     
@@ -98,21 +204,24 @@ class TileSize(Size):
         Size.__init__(self, dimensions,
                       config.Arguments.tile_size_range[0],
                       config.Arguments.tile_size_range[1],
-                      config.Arguments.tile_size_product_bound)
+                      config.Arguments.tile_size_product_bound,
+                      config.Arguments.tile_size_ladder)
         
 class BlockSize(Size):
     def __init__(self, dimensions):
         Size.__init__(self, dimensions,
               config.Arguments.block_size_range[0],
               config.Arguments.block_size_range[1],
-              config.Arguments.block_size_product_bound)
+              config.Arguments.block_size_product_bound,
+              config.Arguments.block_size_ladder)
         
 class GridSize(Size):
     def __init__(self, dimensions):
         Size.__init__(self, dimensions,
               config.Arguments.grid_size_range[0],
               config.Arguments.grid_size_range[1],
-              config.Arguments.grid_size_product_bound)
+              config.Arguments.grid_size_product_bound,
+              config.Arguments.grid_size_ladder)
     
 class SizeTuple:
     """Models a 3-tuple of tile, block and grid sizes"""
@@ -232,12 +341,102 @@ class SizesFlag(Flag):
                                               ','.join(str(val) for val in size_tuple.grid_size)))
         return '%s="{%s}"' % (self.name, ';'.join(per_kernel_size_strings))
     
+    def get_canonical_string(self, value):
+        # The order in which per-kernel sizes are listed does not matter to PPCG
+        sorted_value = collections.OrderedDict(sorted(value.iteritems()))
+        return self.get_command_line_string(sorted_value)
+    
+    def features(self, value):
+        # The sizes for all kernels, or else those of the lowest-numbered kernel,
+        # as the base-2 logarithms of the tile, block and grid sizes padded to
+        # the largest number of dimensions
+        size_tuple = None
+        if value:
+            size_tuple = value.get(SizesFlag.ALL_KERNELS_SENTINEL, value[min(value.keys())])
+        encoding = []
+        for dimensions, attribute in [(config.Arguments.tile_dimensions, "tile_size"),
+                                      (config.Arguments.block_dimensions, "block_size"),
+                                      (config.Arguments.grid_dimensions, "grid_size")]:
+            sizes = getattr(size_tuple, attribute, None) or ()
+            sizes = [math.log(max(size, 1), 2) for size in sizes][:dimensions]
+            encoding.extend(sizes + [0.0] * (dimensions - len(sizes)))
+        return encoding
+    
 def get_optimisation_flag(optimisation_flags, name):
+    if registry is not None:
+        flag = registry.lookup(name)
+        if flag is not None and registry.flags(registry.category(flag)) is optimisation_flags:
+            return flag
     for flag in optimisation_flags:
         if flag.name == name:
             return flag
     return None
 
+# The flags being tuned, or None until they are all known
+registry = None
+
+def open_registry():
+    global registry
+    registry = FlagRegistry([(FlagRegistry.ppcg, PPCG.optimisation_flags),
+                             (FlagRegistry.cc,   CC.optimisation_flags),
+                             (FlagRegistry.cxx,  CXX.optimisation_flags),
+                             (FlagRegistry.nvcc, NVCC.optimisation_flags)])
+    return registry
+
+class FlagRegistry:
+    """Indexes the flags being tuned by name and by category, i.e. the compiler
+    they are passed to. Every flag also has a position, which is the same in
+    every configuration of a search, so that a configuration can be stored as
+    an array with one entry per flag"""
+
+    ppcg = "ppcg"
+    cc   = "cc"
+    cxx  = "cxx"
+    nvcc = "nvcc"
+
+    def __init__(self, categories):
+        self.categories    = [category for category, the_flags in categories]
+        self.flag_lists    = dict(categories)
+        self.all_flags     = []
+        self.by_name       = {}
+        self.by_qualified  = {}
+        self.by_category   = {}
+        self.positions     = {}
+        self.value_indices = {}
+        for category, the_flags in categories:
+            for flag in the_flags:
+                self.positions[flag]   = len(self.all_flags)
+                self.by_category[flag] = category
+                self.all_flags.append(flag)
+                # The first category to name a flag takes it, as lookups by
+                # name would otherwise be ambiguous
+                self.by_name.setdefault(flag.name, flag)
+                self.by_qualified[(category, flag.name)] = flag
+                if isinstance(flag, EnumerationFlag):
+                    self.value_indices[flag] = dict((value, idx) for idx, value in reversed(list(enumerate(flag.possible_values))))
+
+    def __len__(self):
+        return len(self.all_flags)
+
+    def lookup(self, name, category=None):
+        """The flag with the given name, or None if it is not being tuned"""
+        if category is None:
+            return self.by_name.get(name)
+        return self.by_qualified.get((category, name))
+
+    def category(self, flag):
+        return self.by_category[flag]
+
+    def flags(self, category):
+        return self.flag_lists[category]
+
+    def position(self, flag):
+        return self.positions[flag]
+
+    def value_index(self, flag, value):
+        """The position of a value of an enumeration flag among its possible values"""
+        return self.value_indices[flag][value]
+
 class PPCG:    
     """All PPCG flags"""
     
@@ -8,9 +8,21 @@ time_PPCG    = 0.0
 time_backend = 0.0
 time_binary  = 0.0
 
+# Evaluation statistics
+num_cache_hits     = 0
+num_identical_code = 0
+num_artifact_hits  = 0
+num_replayed       = 0
+num_cut_short      = 0
+
 def summarise_timing():
     print("%s Summary of timing %s" % ('*' * 30, '*' * 30))
     print("Total time running PPCG:               %.2f seconds" % (time_PPCG))
     print("Total time running build:              %.2f seconds" % (time_backend))
     print("Total time running generated binaries: %.2f seconds" % (time_binary))
+    print("Evaluations served from the cache:     %d" % (num_cache_hits))
+    print("Evaluations with identical PPCG code:  %d" % (num_identical_code))
+    print("Builds served from the artifact cache: %d" % (num_artifact_hits))
+    print("Evaluations replayed from the journal: %d" % (num_replayed))
+    print("Runs cut short as slower than the best: %d" % (num_cut_short))
     print
@@ -0,0 +1,247 @@
+import abc
+import re
+import types
+import random
+import collections
+import config
+import debug
+import compiler_flags
+import search_space
+
+# The rules that every configuration must satisfy, or None if there are none
+checker = None
+
+# The variables of expressions that stand for the sizes of a kernel
+SIZE_VARIABLES = frozenset(["tile", "block", "grid", "kernel"])
+
+def product(values):
+    return reduce(lambda x, y: x*y, values, 1)
+
+def flag_variable(flag):
+    """The name by which expressions refer to the value of a flag, e.g.
+    no_shared_memory for --no-shared-memory"""
+    return re.sub(r'\W', '_', flag.name.lstrip('-'))
+
+def names(code):
+    """The global names that compiled code refers to, including those inside
+    its generator expressions and comprehensions, which have code of their own"""
+    found = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            found |= names(constant)
+    return found
+
+class Rule:
+    """A rule which configurations must satisfy. Rules about sizes are checked
+    for the sizes of every kernel in turn"""
+
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, description, variables):
+        self.description = description
+        # The variables that the rule depends on, so that a configuration that
+        # breaks it can be repaired by changing only those
+        self.variables   = frozenset(variables)
+
+    @abc.abstractmethod
+    def satisfied(self, values):
+        pass
+
+class WorkGroupSize(Rule):
+    def __init__(self, min_size, max_size):
+        Rule.__init__(self, "work group size in %d-%d" % (min_size, max_size), ["block"])
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def satisfied(self, values):
+        return self.min_size <= product(values["block"]) <= self.max_size
+
+class TileCoversBlock(Rule):
+    def __init__(self):
+        Rule.__init__(self, "tile sizes multiples of block sizes", ["tile", "block"])
+
+    def satisfied(self, values):
+        return all(t >= b and t % b == 0 for t, b in zip(values["tile"], values["block"]))
+
+class TileBlockRatio(Rule):
+    def __init__(self, max_ratio):
+        Rule.__init__(self, "tile/block ratio at most %d" % max_ratio, ["tile", "block"])
+        self.max_ratio = max_ratio
+
+    def satisfied(self, values):
+        return product(t/b for t, b in zip(values["tile"], values["block"])) <= self.max_ratio
+
+class Expression(Rule):
+    """A Python expression over the sizes of a kernel, as the tuples tile, block
+    and grid and its number kernel, and the values of the flags. Flags that a
+    configuration does not set are None"""
+
+    HELPERS = {"product": product, "all": all, "any": any, "min": min, "max": max, "len": len, "abs": abs, "zip": zip,
+               "True": True, "False": False, "None": None}
+
+    def __init__(self, text):
+        self.code = compile(text, "<constraint>", "eval")
+        Rule.__init__(self, text, names(self.code))
+
+    def satisfied(self, values):
+        # Generator expressions and comprehensions only see globals, so that is
+        # where the helpers and the variables go
+        namespace = {"__builtins__": {}}
+        namespace.update(Expression.HELPERS)
+        namespace.update(values)
+        return bool(eval(self.code, namespace))
+
+    def unknown_variables(self):
+        """The names in the expression that are neither helpers, sizes nor the
+        flags being tuned"""
+        known = set(Expression.HELPERS) | SIZE_VARIABLES | set(flag_variable(flag) for flag in compiler_flags.registry.all_flags)
+        return sorted(self.variables - known)
+
+def size_rules():
+    """The rules that the exhaustive search's --filter-testcases applies"""
+    return [WorkGroupSize(config.Arguments.min_work_group_size, config.Arguments.max_work_group_size),
+            TileCoversBlock(),
+            TileBlockRatio(config.Arguments.max_tile_block_ratio)]
+
+def read_expressions(file_name):
+    """One expression per line. Blank lines and lines starting with # are ignored"""
+    with open(file_name, 'r') as spec:
+        return [line.strip() for line in spec if line.strip() and not line.strip().startswith('#')]
+
+def repair_all(individuals):
+    """Repair the configurations of newly created individuals, if there are
+    any rules"""
+    if checker:
+        for individual in individuals:
+            checker.repair(individual)
+
+def open_checker(rules):
+    global checker
+    checker = Checker(rules)
+    return checker
+
+class Checker:
+    """Rejects configurations that break a rule before anything is compiled, and
+    repairs them where it can by redrawing the values that the broken rule
+    depends on. With the size rules, the tile and block sizes of a kernel are
+    drawn from the legal ones rather than at random, since random block sizes
+    almost never make a legal work group"""
+
+    # How many times a configuration is redrawn before it is given up on
+    MAX_REPAIRS = 20
+
+    def __init__(self, rules):
+        self.rules       = rules
+        self.rejected    = collections.Counter()
+        self.repaired    = 0
+        self.size_rules  = any(isinstance(rule, WorkGroupSize) for rule in rules)
+        self.size_spaces = {}
+
+    def kernel_values(self, individual):
+        """The values of the variables for each kernel in turn. Without sizes the
+        variables are checked once, and the rules about sizes are skipped"""
+        values = {}
+        for category in compiler_flags.registry.categories:
+            for flag in compiler_flags.registry.flags(category):
+                if not isinstance(flag, compiler_flags.SizesFlag):
+                    values.setdefault(flag_variable(flag), None)
+            for flag, value in individual.flag_values()[category].iteritems():
+                if not isinstance(flag, compiler_flags.SizesFlag):
+                    values[flag_variable(flag)] = value
+        sizes = individual.ppcg_flags.get(compiler_flags.registry.lookup(compiler_flags.PPCG.sizes, compiler_flags.FlagRegistry.ppcg))
+        if not sizes:
+            yield None, values
+            return
+        for kernel, size_tuple in sizes.iteritems():
+            kernel_values           = dict(values)
+            kernel_values["kernel"] = kernel
+            kernel_values["tile"]   = tuple(size_tuple.tile_size or ())
+            kernel_values["block"]  = tuple(size_tuple.block_size or ())
+            kernel_values["grid"]   = tuple(size_tuple.grid_size or ())
+            yield kernel, kernel_values
+
+    def violation(self, individual):
+        """The first rule that the individual breaks and the kernel whose sizes
+        break it, or None if it breaks none"""
+        for kernel, values in self.kernel_values(individual):
+            for rule in self.rules:
+                if "kernel" not in values and rule.variables & SIZE_VARIABLES:
+                    continue
+                if not rule.satisfied(values):
+                    return rule, kernel
+        return None
+
+    def reject(self, individual):
+        """Returns True if the individual breaks a rule, in which case it should
+        not be evaluated"""
+        broken = self.violation(individual)
+        if broken is None:
+            return False
+        rule, kernel = broken
+        self.rejected[rule.description] += 1
+        debug.verbose_message("Individual %d: rejected as it breaks the constraint '%s'" % (individual.ID, rule.description), __name__)
+        return True
+
+    def redraw(self, individual, rule, kernel):
+        for category in compiler_flags.registry.categories:
+            flag_values = individual.flag_values()[category]
+            for flag in flag_values.keys():
+                if isinstance(flag, compiler_flags.SizesFlag):
+                    if rule.variables & SIZE_VARIABLES:
+                        sizes         = collections.OrderedDict(flag_values[flag])
+                        sizes[kernel] = self.redraw_sizes(flag, sizes[kernel], rule)
+                        flag_values[flag] = sizes
+                elif flag_variable(flag) in rule.variables:
+                    flag_values[flag] = flag.random_value()
+
+    def size_space(self, flag, tile_dimensions, block_dimensions):
+        """The tile and block sizes that satisfy the size rules"""
+        key = (tile_dimensions, block_dimensions)
+        if key not in self.size_spaces:
+            tile_ladder  = flag.tile_size.ladder
+            block_ladder = flag.block_size.ladder
+            self.size_spaces[key] = search_space.TileBlockSpace([tile_ladder[i] for i in xrange(len(tile_ladder))],
+                                                                tile_dimensions,
+                                                                [block_ladder[i] for i in xrange(len(block_ladder))],
+                                                                block_dimensions,
+                                                                config.Arguments.min_work_group_size,
+                                                                config.Arguments.max_work_group_size,
+                                                                config.Arguments.max_tile_block_ratio)
+        return self.size_spaces[key]
+
+    def redraw_sizes(self, flag, size_tuple, rule):
+        """New sizes for one kernel. The grid size is kept unless the rule
+        depends on it"""
+        drawn = flag.random_value()[compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL]
+        if not self.size_rules:
+            return drawn
+        tile_size  = size_tuple.tile_size or drawn.tile_size
+        block_size = size_tuple.block_size or drawn.block_size
+        space      = self.size_space(flag, len(tile_size), len(block_size))
+        if not space.size():
+            return drawn
+        tile_size, block_size = space.unrank(random.randrange(space.size()))
+        grid_size = size_tuple.grid_size if size_tuple.grid_size and "grid" not in rule.variables else drawn.grid_size
+        return compiler_flags.SizeTuple(tile_size, block_size, grid_size)
+
+    def repair(self, individual):
+        """Redraw the values of a configuration that breaks a rule until it
+        breaks none. Returns False if that failed, in which case the individual
+        is left to be rejected when it is evaluated"""
+        broken = self.violation(individual)
+        if broken is None:
+            return True
+        for attempt in xrange(Checker.MAX_REPAIRS):
+            self.redraw(individual, *broken)
+            broken = self.violation(individual)
+            if broken is None:
+                self.repaired += 1
+                return True
+        return False
+
+    def summarise(self):
+        print("%s Summary of the constraints %s" % ('*' * 30, '*' * 30))
+        print("Configurations repaired: %d" % (self.repaired))
+        for rule in self.rules:
+            print("Configurations rejected by '%s': %d" % (rule.description, self.rejected[rule.description]))
+        print
@@ -0,0 +1,98 @@
+import math
+import collections
+import config
+import debug
+import enums
+
+# The model that screens configurations before they are evaluated, or None
+# unless the user asked for one
+model = None
+
+def open_model(neighbours, margin, min_samples):
+    global model
+    model = CostModel(neighbours, margin, min_samples)
+    return model
+
+class CostModel:
+    """Predicts the execution time of a configuration from the measured
+    configurations nearest to it, once enough of them have been measured. A
+    configuration is skipped when even the fastest of its nearest neighbours
+    is slower than the fittest configuration so far by more than the margin.
+
+    The model learns from every measurement as it arrives, however it was
+    obtained, and is kept separately for each kernel being tuned since their
+    execution times are not comparable"""
+
+    def __init__(self, neighbours, margin, min_samples):
+        self.neighbours   = neighbours
+        self.margin       = margin
+        self.min_samples  = min_samples
+        self.observations = collections.defaultdict(list)
+        self.incumbent    = {}
+        self.num_skipped  = 0
+        self.errors       = []
+
+    def nearest(self, individual):
+        """The execution times of the nearest measured configurations. Features
+        are scaled by their range over the measurements so that no feature
+        dominates the distance merely because of its units"""
+        observations = self.observations[individual.kernel_num]
+        features     = individual.features()
+        low          = [min(column) for column in zip(*[observed for observed, time in observations])]
+        high         = [max(column) for column in zip(*[observed for observed, time in observations])]
+        distances    = []
+        for observed, time in observations:
+            distance = 0.0
+            for x, y, lb, ub in zip(features, observed, low, high):
+                if ub > lb:
+                    distance += ((x - y)/(ub - lb))**2
+            distances.append((distance, time))
+        distances.sort()
+        return [time for distance, time in distances[:self.neighbours]]
+
+    def screen(self, individual):
+        """Returns True if the individual should be skipped. Otherwise the
+        prediction is kept so that its accuracy can be judged"""
+        individual.predicted_time = None
+        incumbent                 = self.incumbent.get(individual.kernel_num)
+        # Runs cut short are observed without setting an incumbent, and nothing
+        # is hopeless until something has been measured in full
+        if incumbent is None or len(self.observations[individual.kernel_num]) < self.min_samples:
+            return False
+        times = self.nearest(individual)
+        # The geometric mean suits execution times, which vary by factors
+        individual.predicted_time = math.exp(sum(math.log(time) for time in times)/len(times))
+        threshold                 = self.margin * incumbent
+        if min(times) <= threshold:
+            return False
+        self.num_skipped += 1
+        debug.verbose_message("Individual %d: skipped as its nearest neighbours took at least %f against %f for the fittest" \
+                              % (individual.ID, min(times), incumbent), __name__)
+        return True
+
+    def learn(self, individual):
+        if not individual.measured() or not 0 < individual.execution_time < float("inf"):
+            return
+        # A run cut short by --kill-slower-runs was slower than its lower bound,
+        # which is observed as it is, but neither judges a prediction nor
+        # becomes the incumbent
+        self.observations[individual.kernel_num].append((individual.features(), individual.execution_time))
+        if individual.status != enums.Status.passed:
+            individual.predicted_time = None
+            return
+        if individual.predicted_time is not None:
+            self.errors.append(abs(individual.predicted_time - individual.execution_time)/individual.execution_time)
+            individual.predicted_time = None
+        self.incumbent[individual.kernel_num] = min(individual.execution_time,
+                                                    self.incumbent.get(individual.kernel_num, float("inf")))
+
+    def summarise(self):
+        print("%s Summary of the cost model %s" % ('*' * 30, '*' * 30))
+        print("Evaluations skipped:                   %d" % (self.num_skipped))
+        if self.errors:
+            ordered = sorted(self.errors)
+            print("Predictions checked by measurement:    %d" % (len(ordered)))
+            print("Median relative error of predictions:  %.1f%%" % (100 * ordered[len(ordered)/2]))
+            print("Predictions within 20%% of measurement: %.1f%%" \
+                  % (100.0 * sum(1 for error in ordered if error <= 0.2)/len(ordered)))
+        print
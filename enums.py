@@ -7,6 +7,15 @@ class Crossover:
     one_point = "one_point"
     two_point = "two_point"
 
+class SizeLadder:
+    linear         = "linear"
+    powers_of_two  = "powers-of-two"
+    warp_multiples = "warp-multiples"
+
+class SizeDistribution:
+    uniform     = "uniform"
+    log_uniform = "log-uniform"
+
 class Compilers:
     gcc     = "gcc"
     gxx     = "g++"
@@ -20,10 +29,14 @@ class SearchStrategy:
     random              = "random"
     simulated_annealing = "simulated-annealing"
     exhaustive          = "exhaustive"
+    bayesian            = "bayesian"
 
 class Status:
     passed = "passed"
     failed = "failed"
     timeout = "timedout"
     ppcgtimeout = "ppcg_timeout"
+    skipped = "skipped"
+    infeasible = "infeasible"
+    censored = "censored"
     
@@ -0,0 +1,165 @@
+import sqlite3
+import hashlib
+import json
+import platform
+import threading
+import config
+import debug
+
+# The cache shared by all evaluations. It lives in memory unless the user
+# asked for a persistent one
+cache = None
+
+def open_cache(file_name):
+    global cache
+    cache = EvaluationCache(file_name)
+    return cache
+
+def machine_fingerprint():
+    return ';'.join([platform.node(), platform.machine(), platform.platform()])
+
+def canonical_flags(flags):
+    """Encode flags independently of the order in which they were set. Flags
+    that contribute nothing to the command line are dropped"""
+    strings = [flag.get_canonical_string(value) for flag, value in flags.iteritems()]
+    return sorted(string for string in strings if string)
+
+def adaptive_context(individual):
+    if not individual.adaptive():
+        return None
+    return [config.Arguments.min_runs,
+            config.Arguments.statistic,
+            config.Arguments.confidence,
+            config.Arguments.ci_width]
+
+def evaluation_context(individual):
+    """Everything besides the configuration itself that influences a measurement"""
+    if config.Arguments.cmd_string_complete:
+        run_cmd = config.Arguments.run_cmd
+    else:
+        run_cmd = config.Arguments.run_cmd_input
+    return [config.Arguments.target,
+            config.Arguments.build_cmd,
+            run_cmd,
+            config.Arguments.execution_time_from_binary,
+            config.Arguments.execution_time_regex,
+            config.Arguments.prl_profiling,
+            # How many runs a measurement takes and, with --adaptive-runs, how
+            # they are summarised
+            individual.max_runs(),
+            adaptive_context(individual),
+            individual.kernel_num,
+            machine_fingerprint(),
+            canonical_flags(individual.cc_flags),
+            canonical_flags(individual.cxx_flags),
+            canonical_flags(individual.nvcc_flags)]
+
+def make_key(individual):
+    """The key under which the measurement of an individual is stored"""
+    canonical = evaluation_context(individual) + [config.Arguments.ppcg_cmd,
+                                                  canonical_flags(individual.ppcg_flags)]
+    return hashlib.sha1(json.dumps(canonical)).hexdigest()
+
+def make_code_key(individual, code_digest):
+    """The key under which the measurement of the code generated by PPCG is
+    stored. Configurations for which PPCG generates the same code share it"""
+    canonical = evaluation_context(individual) + ["generated-code", code_digest]
+    return hashlib.sha1(json.dumps(canonical)).hexdigest()
+
+class CachedResult:
+    """A measurement retrieved from the cache"""
+
+    def __init__(self, status, execution_time, per_kernel_time, ppcg_cmd_line_flags, samples):
+        self.status              = status
+        self.execution_time      = execution_time
+        self.per_kernel_time     = per_kernel_time
+        self.ppcg_cmd_line_flags = ppcg_cmd_line_flags
+        self.samples             = samples
+
+class EvaluationCache:
+    """An on-disk cache of measurements which also makes sure that the same
+    configuration is never evaluated by two workers at once"""
+
+    def __init__(self, file_name):
+        self.lock       = threading.Lock()
+        self.in_flight  = {}
+        self.connection = sqlite3.connect(file_name, timeout=60, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS evaluations ("
+                                "key TEXT PRIMARY KEY, "
+                                "status TEXT, "
+                                "execution_time REAL, "
+                                "per_kernel_time TEXT, "
+                                "ppcg_cmd_line_flags TEXT, "
+                                "samples TEXT)")
+        # Caches written before per-run samples were kept lack the column
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(evaluations)")]
+        if "samples" not in columns:
+            self.connection.execute("ALTER TABLE evaluations ADD COLUMN samples TEXT")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS kernel_sizes ("
+                                "key TEXT PRIMARY KEY, "
+                                "sizes TEXT)")
+        self.connection.commit()
+
+    def lookup(self, key):
+        row = self.connection.execute("SELECT status, execution_time, per_kernel_time, ppcg_cmd_line_flags, samples "
+                                      "FROM evaluations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        status, execution_time, per_kernel_time, ppcg_cmd_line_flags, samples = row
+        return CachedResult(str(status), 
+                            execution_time, 
+                            json.loads(per_kernel_time), 
+                            str(ppcg_cmd_line_flags), 
+                            json.loads(samples) if samples else [])
+
+    def claim(self, key):
+        """Return the cached result for this key if there is one. Otherwise the caller
+        becomes responsible for evaluating the configuration and must call release()
+        once done. If another worker is already evaluating the configuration then
+        wait for it to finish"""
+        while True:
+            with self.lock:
+                result = self.lookup(key)
+                if result is not None:
+                    return result
+                if key not in self.in_flight:
+                    self.in_flight[key] = threading.Event()
+                    return None
+                event = self.in_flight[key]
+            debug.verbose_message("Waiting for in-flight evaluation of %s" % key, __name__)
+            event.wait()
+
+    def is_in_flight(self, key):
+        with self.lock:
+            return key in self.in_flight
+
+    def store(self, key, individual):
+        per_kernel_time = json.dumps(individual.per_kernel_time)
+        samples         = json.dumps(individual.samples)
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO evaluations "
+                                    "(key, status, execution_time, per_kernel_time, ppcg_cmd_line_flags, samples) "
+                                    "VALUES (?, ?, ?, ?, ?, ?)",
+                                    (key,
+                                     individual.status,
+                                     individual.execution_time,
+                                     per_kernel_time,
+                                     individual.ppcg_cmd_line_flags,
+                                     samples))
+            self.connection.commit()
+
+    def lookup_kernel_sizes(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT sizes FROM kernel_sizes WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def store_kernel_sizes(self, key, sizes):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO kernel_sizes (key, sizes) VALUES (?, ?)", (key, sizes))
+            self.connection.commit()
+
+    def release(self, key):
+        with self.lock:
+            event = self.in_flight.pop(key, None)
+        if event is not None:
+            event.set()
@@ -0,0 +1,331 @@
+import os
+import time
+import timeit
+import collections
+import config
+import debug
+import enums
+import processes
+import run_lanes
+
+class Stage:
+    """A stage of the evaluation pipeline: PPCG, build or run. At most
+    'concurrency' processes of a stage run at any one time, and processes that
+    run for longer than 'timeout' seconds are killed along with everything they
+    started"""
+
+    def __init__(self, name, concurrency, timeout):
+        self.name        = name
+        self.concurrency = concurrency
+        self.timeout     = timeout
+        self.waiting     = collections.deque()
+        self.active      = []
+
+    def has_capacity(self):
+        return len(self.active) < self.concurrency
+
+class Job:
+    """An individual on its way through the stages"""
+
+    def __init__(self, testcase, callback):
+        self.testcase = testcase
+        self.callback = callback
+        self.stage    = None
+        self.lane     = None
+        self.process  = None
+        self.waiter   = None
+        self.output   = None
+        self.start    = None
+        self.deadline = None
+
+    def elapsed(self):
+        return timeit.default_timer() - self.start
+
+class EvaluationEngine:
+    """Evaluates individuals by running PPCG, the build command and the binary as
+    non-blocking processes from a single event loop. PPCG and builds run with
+    bounded concurrency and feed the run lanes, each of which times one binary
+    at a time on its own cores and device"""
+
+    # How many compiled individuals may queue up in front of each run lane
+    # before no further PPCG processes are started
+    MAX_WAITING_TO_RUN = 10
+
+    def __init__(self, num_compile_threads):
+        self.num_compile_threads = max(1, num_compile_threads)
+        self.ppcg_stage          = Stage(processes.PPCG, self.num_compile_threads, config.Arguments.ppcg_timeout)
+        self.build_stage         = Stage(processes.BUILD, self.num_compile_threads, config.Arguments.build_timeout)
+        self.run_stage           = Stage(processes.RUN, len(run_lanes.lanes), config.Arguments.run_timeout)
+        self.stages              = [self.ppcg_stage, self.build_stage, self.run_stage]
+        self.free_lanes          = list(run_lanes.lanes)
+        self.jobs                = []
+        self.max_waiting_to_run  = EvaluationEngine.MAX_WAITING_TO_RUN * len(run_lanes.lanes)
+        self.max_in_flight       = 2 * self.num_compile_threads + len(run_lanes.lanes) + self.max_waiting_to_run
+        self.best_execution_time = float("inf")
+        self.best_wall_time      = None
+        self.num_evaluated       = 0
+
+    def evaluate_stream(self, individuals, callback=None):
+        """Evaluate every individual produced by the iterable, calling callback on
+        each one as soon as it has been measured. Individuals are pulled from the
+        iterable only as fast as the stages can take them"""
+        individuals = iter(individuals)
+        exhausted   = False
+        try:
+            while True:
+                while not exhausted and len(self.jobs) < self.max_in_flight:
+                    try:
+                        testcase = next(individuals)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    self.admit(Job(testcase, callback))
+                if exhausted and not self.jobs:
+                    break
+                self.step()
+        except KeyboardInterrupt:
+            self.cancel_all()
+            raise
+
+    def evaluate(self, individuals, callback=None):
+        """Evaluate a batch of individuals concurrently and wait for all of them"""
+        # The same individual may appear twice in a population, e.g. when a
+        # parent is copied unchanged into the next generation
+        unique = collections.OrderedDict((id(testcase), testcase) for testcase in individuals)
+        self.evaluate_stream(unique.values(), callback)
+        return individuals
+
+    def cancel(self, testcase):
+        """Abandon the evaluation of an individual, killing its running process"""
+        for job in list(self.jobs):
+            if job.testcase is testcase:
+                self.abandon(job)
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            self.abandon(job)
+
+    def shutdown(self):
+        self.cancel_all()
+
+    def admit(self, job):
+        job.testcase.checkforpause()
+        self.jobs.append(job)
+        self.enter(job, self.ppcg_stage)
+
+    def enter(self, job, stage):
+        job.stage = stage
+        stage.waiting.append(job)
+
+    def step(self):
+        progress = False
+        for stage in self.stages:
+            progress |= self.start_jobs(stage)
+        for stage in self.stages:
+            progress |= self.poll_jobs(stage)
+        if not progress:
+            # Poll finely while a binary is being timed so that its lane is
+            # handed on promptly. The measurement itself is taken by its waiter
+            if self.run_stage.active:
+                time.sleep(0.001)
+            else:
+                time.sleep(0.01)
+
+    def start_jobs(self, stage):
+        progress = False
+        if stage is self.ppcg_stage and len(self.run_stage.waiting) >= self.max_waiting_to_run:
+            # Back pressure from the run lanes
+            return progress
+        for job in list(stage.waiting):
+            if not stage.has_capacity():
+                break
+            if self.blocked(job, stage):
+                continue
+            stage.waiting.remove(job)
+            progress = True
+            try:
+                self.start(job, stage)
+            except Exception as e:
+                self.fail(job, "%s stage failed: %s" % (stage.name, e))
+        return progress
+
+    def blocked(self, job, stage):
+        # Wait rather than start a duplicate of an evaluation that is in flight
+        if stage is self.ppcg_stage:
+            return job.testcase.duplicate_in_flight()
+        if stage is self.build_stage:
+            return job.testcase.duplicate_code_in_flight()
+        return False
+
+    def start(self, job, stage):
+        testcase = job.testcase
+        if stage is self.ppcg_stage:
+            if testcase.begin_evaluation():
+                self.finish(job)
+            elif testcase.fetch_previous_build():
+                self.enter(job, self.run_stage)
+            else:
+                self.launch(job, testcase.ppcg_command(), "ppcg.err")
+        elif stage is self.build_stage:
+            if testcase.reuse_identical_code():
+                self.finish(job)
+            elif testcase.fetch_cached_build():
+                self.enter(job, self.run_stage)
+            else:
+                self.launch(job, testcase.build_command(), "build.out")
+        else:
+            if testcase.begin_runs(self.best_execution_time, self.best_wall_time):
+                # The lane stays with the individual until all its runs are done
+                job.lane = self.free_lanes.pop(0)
+                self.launch(job, testcase.run_command(), "run.out")
+            else:
+                testcase.end_runs()
+                self.finish(job)
+
+    def launch(self, job, cmd, output_name):
+        if job.stage is self.run_stage:
+            cmd          = job.lane.command(cmd)
+            job.deadline = min(job.stage.timeout, job.testcase.run_deadline())
+        else:
+            cmd          = run_lanes.compile_command(cmd)
+            job.deadline = job.stage.timeout
+        debug.verbose_message("Running '%s'" % cmd, __name__)
+        # Output goes to a file so that a chatty process can never block on a full pipe
+        job.output = open(os.path.join(job.testcase.get_workspace(), output_name), 'w+')
+        if job.stage is self.ppcg_stage:
+            job.process = processes.spawn(cmd, job.stage.name, stderr=job.output, env=job.testcase.environment())
+        else:
+            job.process = processes.spawn(cmd, job.stage.name, stdout=job.output, env=job.testcase.environment(job.lane))
+        job.start = timeit.default_timer()
+        if job.stage is self.run_stage:
+            # A binary is timed by a thread blocked on it rather than by the
+            # event loop, whose latency depends on the compiles it also serves
+            job.waiter = processes.Waiter(job.process)
+        job.stage.active.append(job)
+
+    def poll_jobs(self, stage):
+        progress = False
+        for job in list(stage.active):
+            if job.waiter:
+                returncode = job.waiter.returncode if job.waiter.exited.is_set() else None
+            else:
+                returncode = job.process.poll()
+            if returncode is None:
+                elapsed = job.elapsed()
+                if elapsed > job.deadline:
+                    self.kill(job)
+                    if job.deadline < stage.timeout:
+                        self.cut_short(job, elapsed)
+                    else:
+                        self.timed_out(job)
+                    progress = True
+                continue
+            if job.waiter:
+                elapsed    = job.waiter.end - job.start
+                job.waiter = None
+            else:
+                elapsed = job.elapsed()
+            stage.active.remove(job)
+            job.output.seek(0)
+            output = job.output.read()
+            job.output.close()
+            job.process = None
+            progress = True
+            if processes.exceeded_cpu_limit(returncode):
+                self.timed_out(job, "exceeded the CPU limit of %s seconds" % config.Arguments.cpu_limit)
+                continue
+            try:
+                self.completed(job, returncode, output, elapsed)
+            except Exception as e:
+                self.fail(job, "%s stage failed: %s" % (stage.name, e))
+        return progress
+
+    def completed(self, job, returncode, output, elapsed):
+        testcase = job.testcase
+        if job.stage is self.ppcg_stage:
+            testcase.ppcg_finished(returncode, elapsed)
+            self.enter(job, self.build_stage)
+        elif job.stage is self.build_stage:
+            testcase.build_finished(returncode, elapsed)
+            self.enter(job, self.run_stage)
+        else:
+            if testcase.run_finished(returncode, output, elapsed):
+                self.launch(job, testcase.run_command(), "run.out")
+            else:
+                testcase.end_runs()
+                self.finish(job)
+
+    def timed_out(self, job, reason=None):
+        testcase = job.testcase
+        if reason is None:
+            reason = "timed out after %s seconds" % job.stage.timeout
+        debug.warning_message("Individual %d: %s %s" % (testcase.ID, job.stage.name, reason))
+        if job.stage is self.ppcg_stage:
+            testcase.status = enums.Status.ppcgtimeout
+            testcase.clean_workspace()
+        elif job.stage is self.build_stage:
+            testcase.status = enums.Status.timeout
+            testcase.clean_workspace()
+        else:
+            testcase.end_runs()
+            testcase.status = enums.Status.timeout
+        self.finish(job)
+
+    def cut_short(self, job, elapsed):
+        job.testcase.cut_short(elapsed)
+        job.testcase.end_runs()
+        self.finish(job)
+
+    def kill(self, job):
+        job.stage.active.remove(job)
+        if job.waiter:
+            # The waiter reaps the process
+            processes.kill_group(job.process)
+            job.waiter.join()
+            job.waiter = None
+        else:
+            processes.kill(job.process)
+        job.output.close()
+        job.process = None
+
+    def fail(self, job, message):
+        debug.warning_message("Individual %d: %s" % (job.testcase.ID, message))
+        job.testcase.status = enums.Status.failed
+        job.testcase.clean_workspace()
+        self.finish(job, False)
+
+    def abandon(self, job):
+        if job.process is not None:
+            self.kill(job)
+        if job in job.stage.waiting:
+            job.stage.waiting.remove(job)
+        job.testcase.status = enums.Status.failed
+        job.testcase.end_evaluation(False)
+        job.testcase.clean_workspace()
+        self.release_lane(job)
+        self.jobs.remove(job)
+
+    def release_lane(self, job):
+        if job.lane is not None:
+            self.free_lanes.append(job.lane)
+            self.free_lanes.sort(key=lambda lane: lane.index)
+            job.lane = None
+
+    def finish(self, job, completed=True):
+        testcase = job.testcase
+        testcase.end_evaluation(completed)
+        testcase.compute_fitness()
+        testcase.record_evaluation()
+        self.num_evaluated += 1
+        if testcase.status == enums.Status.passed \
+        and testcase.execution_time != 0 \
+        and testcase.execution_time < self.best_execution_time:
+            self.best_execution_time = testcase.execution_time
+            # A measurement from the cache has no wall time, and that of a
+            # slower configuration still bounds runs safely
+            if testcase.wall_time is not None:
+                self.best_wall_time = testcase.wall_time
+        self.release_lane(job)
+        self.jobs.remove(job)
+        if job.callback:
+            job.callback(testcase)
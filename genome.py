@@ -0,0 +1,83 @@
+import array
+import collections
+import compiler_flags
+
+# The gene of a flag which a configuration does not set
+UNSET = -1
+
+class Genome(object):
+    """A snapshot of the configuration of an individual in a compact, immutable
+    form: the value of every enumeration flag as its position among the
+    possible values, in the order of the flag registry, and the values of the
+    --sizes flag as a tuple. GA elitism and simulated annealing copy
+    configurations through genomes rather than deep-copying individuals, which
+    also hold their measurement and their workspace. Individuals themselves
+    still keep their configuration in a dictionary per category of flags"""
+
+    __slots__ = ("genes", "sizes", "kernel_num", "hash")
+
+    def __init__(self, genes, sizes, kernel_num):
+        object.__setattr__(self, "genes", genes)
+        object.__setattr__(self, "sizes", sizes)
+        object.__setattr__(self, "kernel_num", kernel_num)
+        object.__setattr__(self, "hash", hash((genes.tostring(), sizes, kernel_num)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Genomes are immutable")
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return isinstance(other, Genome) \
+            and self.hash == other.hash \
+            and self.kernel_num == other.kernel_num \
+            and self.genes == other.genes \
+            and self.sizes == other.sizes
+
+    def __ne__(self, other):
+        return not self == other
+
+    def flags(self):
+        """The values of the flags as a dictionary per category, in the order of
+        the flag registry. The dictionaries are fresh so that they can be
+        changed without affecting the genome"""
+        registry = compiler_flags.registry
+        values   = dict((category, collections.OrderedDict()) for category in registry.categories)
+        for position, gene in enumerate(self.genes):
+            if gene == UNSET:
+                continue
+            flag = registry.all_flags[position]
+            if isinstance(flag, compiler_flags.SizesFlag):
+                values[registry.category(flag)][flag] = decode_sizes(self.sizes)
+            else:
+                values[registry.category(flag)][flag] = flag.possible_values[gene]
+        return values
+
+def encode_sizes(value):
+    return tuple((kernel,
+                  tuple(size_tuple.tile_size) if size_tuple.tile_size is not None else None,
+                  tuple(size_tuple.block_size) if size_tuple.block_size is not None else None,
+                  tuple(size_tuple.grid_size) if size_tuple.grid_size is not None else None)
+                 for kernel, size_tuple in value.iteritems())
+
+def decode_sizes(sizes):
+    value = collections.OrderedDict()
+    for kernel, tile_size, block_size, grid_size in sizes:
+        value[kernel] = compiler_flags.SizeTuple(tile_size, block_size, grid_size)
+    return value
+
+def encode(flag_values, kernel_num):
+    """The genome of a configuration given the values of its flags per category"""
+    registry = compiler_flags.registry
+    genes    = array.array('h', [UNSET]) * len(registry)
+    sizes    = None
+    for category in registry.categories:
+        for flag, value in flag_values[category].iteritems():
+            position = registry.position(flag)
+            if isinstance(flag, compiler_flags.SizesFlag):
+                genes[position] = 0
+                sizes           = encode_sizes(value)
+            else:
+                genes[position] = registry.value_index(flag, value)
+    return Genome(genes, sizes, kernel_num)
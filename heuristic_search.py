@@ -1,7 +1,6 @@
 import abc
 import random
 import math
-import copy
 import config
 import compiler_flags
 import enums
@@ -11,9 +10,25 @@ import collections
 import internal_exceptions
 import itertools
 import os
-from Queue import Queue
-from threading import Thread
+import evaluation_engine
+import search_space
 import sys
+import json
+import journal
+import kernel_discovery
+import population
+import constraints
+import space_spec
+
+def journal_state(strategy, **state):
+    if journal.journal:
+        journal.journal.record_state(strategy, **state)
+
+def fittest_time(population):
+    try:
+        return individual.get_fittest(population).execution_time
+    except internal_exceptions.NoFittestException:
+        return None
 
 class SearchStrategy:
     """Abstract class for a search strategy"""
@@ -37,17 +52,9 @@ class GA(SearchStrategy):
         return
     
     def set_child_flags(self, child, the_flags, the_flag_values):
+        child_flags = child.flag_values()
         for idx, flag in enumerate(the_flags):
-            if flag in compiler_flags.PPCG.optimisation_flags:
-                child.ppcg_flags[flag] = the_flag_values[idx]
-            elif flag in compiler_flags.CC.optimisation_flags:
-                child.cc_flags[flag] = the_flag_values[idx]
-            elif flag in compiler_flags.CXX.optimisation_flags:
-                child.cxx_flags[flag] = the_flag_values[idx]
-            elif flag in compiler_flags.NVCC.optimisation_flags:
-                child.nvcc_flags[flag] = the_flag_values[idx]
-            else:
-                assert False, "Unknown flag %s" % flag
+            child_flags[compiler_flags.registry.category(flag)][flag] = the_flag_values[idx]
                 
     def set_sizes_flag(self, child, dominant_parent, submissive_parent):
         # We handle the crossover of the --sizes flag in a special manner as the
@@ -158,6 +165,9 @@ class GA(SearchStrategy):
         old_population.sort(key=lambda x: x.fitness, reverse=True)
     
     def do_evolution(self, old_population):     
+        if population.numpy:
+            return self.evolve(old_population)
+
         # Normalise the fitness of each individual
         self.normalise_fitnesses(old_population)
         
@@ -181,8 +191,7 @@ class GA(SearchStrategy):
             # Add the elite candidate as required
             try:
                 fittest  = individual.get_fittest(old_population)
-                clone    = copy.deepcopy(fittest)
-                clone.ID = individual.Individual.get_ID()
+                clone    = individual.create_from_genome(fittest.get_genome())
                 new_population.append(clone)
             except internal_exceptions.NoFittestException:
                 pass
@@ -219,6 +228,87 @@ class GA(SearchStrategy):
         assert len(new_population) == len(old_population)
         return new_population    
     
+    def evolve(self, old_population):
+        """do_evolution on the encoded population: parents are selected,
+        crossed over and mutated all at once, and the children are only
+        decoded into individuals to be evaluated"""
+        numpy    = population.numpy
+        rng      = numpy.random.RandomState(random.getrandbits(32))
+        encoding = population.Encoding(old_population)
+        parents  = encoding.encode(old_population)
+        size     = len(old_population)
+        
+        # Roulette wheel selection on the prefix sum of the normalised fitnesses,
+        # fittest first. Individuals that ran in no time at all take every turn
+        fitnesses = numpy.array([testcase.fitness for testcase in old_population], dtype=float)
+        if numpy.isinf(fitnesses).any():
+            fitnesses = numpy.isinf(fitnesses).astype(float)
+        elif fitnesses.sum() == 0:
+            fitnesses = numpy.ones(size)
+        fitnesses /= fitnesses.sum()
+        order      = numpy.argsort(-fitnesses, kind="mergesort")
+        cumulative = numpy.cumsum(fitnesses[order])
+        
+        new_population = []
+        if config.Arguments.random_individual:
+            new_population.append(individual.create_random())
+        if config.Arguments.elite_individual:
+            try:
+                fittest = individual.get_fittest(old_population)
+                new_population.append(encoding.decode(parents[old_population.index(fittest)]))
+            except internal_exceptions.NoFittestException:
+                pass
+        needed = size - len(new_population)
+        pairs  = (needed + 1)/2
+        picks  = order[numpy.minimum(numpy.searchsorted(cumulative, rng.random_sample(2 * pairs), side="right"), size-1)]
+        mothers = parents[picks[:pairs]]
+        fathers = parents[picks[pairs:]]
+        
+        # The genes between the crossover points come from the other parent
+        crossed = rng.random_sample(pairs) < config.Arguments.crossover_rate
+        self.total_crossovers += int(crossed.sum())
+        genes = encoding.num_genes
+        start = rng.randint(0, genes+1, size=pairs)
+        if config.Arguments.crossover == enums.Crossover.two_point:
+            end = start + (rng.random_sample(pairs) * (genes + 1 - start)).astype(numpy.int64)
+        else:
+            end = numpy.repeat(genes, pairs)
+        columns     = numpy.arange(genes)
+        from_father = crossed[:, None] & (columns >= start[:, None]) & (columns < end[:, None])
+        first       = numpy.where(from_father, fathers, mothers)
+        second      = numpy.where(from_father, mothers, fathers)
+        # As in SizesFlag.crossover, a child of a crossover takes its tile and
+        # grid sizes from one parent and, where the other has them, its block
+        # sizes from the other
+        tile_and_grid = encoding.size_columns("tile_size") + encoding.size_columns("grid_size")
+        block         = encoding.size_columns("block_size")
+        for child, dominant, submissive in [(first, mothers, fathers), (second, fathers, mothers)]:
+            if tile_and_grid:
+                child[:, tile_and_grid] = numpy.where(crossed[:, None], dominant[:, tile_and_grid], child[:, tile_and_grid])
+            if block:
+                crossed_block = numpy.where(submissive[:, block] != 0, submissive[:, block], dominant[:, block])
+                child[:, block] = numpy.where(crossed[:, None], crossed_block, child[:, block])
+        children = numpy.empty((2 * pairs, genes), dtype=numpy.int64)
+        children[0::2] = first
+        children[1::2] = second
+        children = children[:needed]
+        
+        # Each gene of a mutated child is drawn afresh with probability 1/2
+        mutated = numpy.flatnonzero(rng.random_sample(needed) < config.Arguments.mutation_rate)
+        self.total_mutations += len(mutated)
+        if len(mutated):
+            redraw = rng.random_sample((len(mutated), encoding.num_enumerations)) < 0.5
+            children[mutated, :encoding.num_enumerations] = numpy.where(redraw, 
+                                                                        encoding.random_genes(rng, len(mutated)), 
+                                                                        children[mutated, :encoding.num_enumerations])
+            if encoding.sizes_flag is not None:
+                for child_idx in mutated[rng.random_sample(len(mutated)) < 0.5]:
+                    encoding.random_sizes(children[child_idx])
+        
+        new_population.extend(encoding.decode(row) for row in children)
+        assert len(new_population) == size
+        return new_population
+    
     def run(self):        
         self.generations      = collections.OrderedDict()  
         self.total_mutations  = 0
@@ -234,39 +324,49 @@ class GA(SearchStrategy):
         legal_transitions.add((state_basic_evolution, state_basic_evolution))
         legal_transitions.add((state_sizes_evolution, state_basic_evolution))
         
-        for generation in xrange(1, config.Arguments.generations+1):
-            debug.verbose_message("%s Creating generation %d %s" % ('+' * 10, generation, '+' * 10), __name__)
-            if current_state == state_random_population:
-                self.generations[generation] = self.create_initial()
-                next_state = state_basic_evolution
-            elif current_state == state_basic_evolution:
-                old_population = self.generations[generation-1]
-                self.generations[generation] = self.do_evolution(old_population)
-                next_state = state_basic_evolution
-            elif current_state == state_sizes_evolution:
-                debug.verbose_message("Now tuning individual kernel sizes", __name__)
-                the_sizes_flag = compiler_flags.PPCG.flag_map[compiler_flags.PPCG.sizes]
-                old_population = self.generations[generation-1]
-                for individual in old_population:
-                    individual.ppcg_flags[the_sizes_flag] = individual.size_data
-                self.generations[generation] = self.do_evolution(old_population)
-                legal_transitions.remove((state_basic_evolution, state_sizes_evolution))
-                next_state = state_basic_evolution
-            else:
-                assert False, "Unknown state reached"
+        self.engine = evaluation_engine.EvaluationEngine(config.Arguments.num_compile_threads)
+        try:
+            for generation in xrange(1, config.Arguments.generations+1):
+                debug.verbose_message("%s Creating generation %d %s" % ('+' * 10, generation, '+' * 10), __name__)
+                if current_state == state_random_population:
+                    self.generations[generation] = self.create_initial()
+                    next_state = state_basic_evolution
+                elif current_state == state_basic_evolution:
+                    old_population = self.generations[generation-1]
+                    self.generations[generation] = self.do_evolution(old_population)
+                    next_state = state_basic_evolution
+                elif current_state == state_sizes_evolution:
+                    debug.verbose_message("Now tuning individual kernel sizes", __name__)
+                    the_sizes_flag = compiler_flags.PPCG.flag_map[compiler_flags.PPCG.sizes]
+                    old_population = self.generations[generation-1]
+                    for individual in old_population:
+                        individual.ppcg_flags[the_sizes_flag] = kernel_discovery.per_kernel_sizes(individual.ppcg_flags[the_sizes_flag])
+                    self.generations[generation] = self.do_evolution(old_population)
+                    legal_transitions.remove((state_basic_evolution, state_sizes_evolution))
+                    next_state = state_basic_evolution
+                else:
+                    assert False, "Unknown state reached"
             
-            # Generation created, now calculate the fitness of each individual
-            for solution in self.generations[generation]:
-                solution.run()
+                # Generation created, now calculate the fitness of each individual
+                constraints.repair_all(self.generations[generation])
+                self.engine.evaluate(self.generations[generation])
+                journal_state(enums.SearchStrategy.ga,
+                              generation=generation,
+                              state=current_state,
+                              fittest=fittest_time(self.generations[generation]))
                 
-            if current_state == state_basic_evolution:
-                # Decide whether to start tuning on individual kernel sizes in the next state
-                if not config.Arguments.no_tune_kernel_sizes \
-                and (state_basic_evolution, state_sizes_evolution) in legal_transitions \
-                and bool(random.getrandbits(1)):
-                    next_state = state_sizes_evolution
+                if current_state == state_basic_evolution:
+                    # Decide whether to start tuning on individual kernel sizes in the next state
+                    # Per-kernel sizes need to know which kernels there are
+                    if not config.Arguments.no_tune_kernel_sizes \
+                    and kernel_discovery.kernel_sizes \
+                    and (state_basic_evolution, state_sizes_evolution) in legal_transitions \
+                    and bool(random.getrandbits(1)):
+                        next_state = state_sizes_evolution
                     
-            current_state = next_state
+                current_state = next_state
+        finally:
+            self.engine.shutdown()
                     
     def summarise(self):
         print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
@@ -289,9 +389,15 @@ class Random(SearchStrategy):
     def run(self):
         self.individuals = []
         for i in xrange(1, config.Arguments.population+1):
-            solution = individual.create_random()
-            solution.run()
-            self.individuals.append(solution)
+            self.individuals.append(individual.create_random())
+        engine = evaluation_engine.EvaluationEngine(config.Arguments.num_compile_threads)
+        try:
+            engine.evaluate(self.individuals)
+            journal_state(enums.SearchStrategy.random,
+                          population=len(self.individuals),
+                          fittest=fittest_time(self.individuals))
+        finally:
+            engine.shutdown()
     
     def summarise(self):
         print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
@@ -308,79 +414,6 @@ class Random(SearchStrategy):
             debug.summary_message(i.ppcg_cmd_line_flags, False)
         return
 
-compile_queue = Queue(10)
-run_queue = Queue(10)
-
-class CompileThread(Thread):
-    def run(self):
-        global compile_queue
-        global run_queue
-        while True:
-            testcase = compile_queue.get()
-            if isinstance(testcase, individual.EndOfQueue):
-                run_queue.put(testcase)
-                break
-
-            testcase.ppcg()
-            testcase.build()
-            run_queue.put(testcase)
-
-class RunThread(Thread):
-    def __init__(self, num_threads):
-        super(RunThread, self).__init__()
-        self.num_threads = num_threads
-        self.individuals = []
-
-    def run(self):
-        global run_queue
-        best_time = float("inf")
-        f = open(config.Arguments.results_file + ".log", 'a')
-        f_iter = open('.lastiter', 'w')
-        while True:
-            #print('***run thread waiting')
-            testcase = run_queue.get()
-            if isinstance(testcase, individual.EndOfQueue):
-                self.num_threads = self.num_threads - 1
-                print('***remaining threads: ' + str(self.num_threads))
-                if self.num_threads<=0:
-                    try:
-                       os.remove('.lastiter')
-                       self.summarise()
-                       self.logall()
-                    except:
-                       pass
-                    print('***run thread exiting')
-                    break
-                continue
-            #print('***run thread got job')
-            testcase.binary(best_time)
-            f_iter.seek(0)
-            f_iter.write(str(testcase.get_ID()))
-
-            if testcase.execution_time < best_time and testcase.execution_time != 0 and testcase.status == enums.Status.passed: 
-                self.individuals.append(testcase)
-                best_time = testcase.execution_time
-                f.write("\n Best iter so far = \n")
-                f.write(str(testcase))
-                f.flush()
-
-    def summarise(self):
-        print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
-        try:
-            fittest = individual.get_fittest(self.individuals)
-            debug.summary_message("The fittest individual had execution time %f seconds" % (fittest.execution_time)) 
-            debug.summary_message("To replicate, pass the following to PPCG:")
-            debug.summary_message(fittest.ppcg_cmd_line_flags, False)
-        except internal_exceptions.NoFittestException:
-           pass
-
-    def logall(self):
-        print("%s Log of all runs %s" %('*' * 30, '*' * 30))
-        for i in self.individuals:
-            print(i)
-            debug.summary_message(i.ppcg_cmd_line_flags, False)
-        pass
-
 class Exhaustive(SearchStrategy):
     """Exhaustive search all the values in the specified range or """
     """all combinations provided in explore-params.py file"""
@@ -392,39 +425,16 @@ class Exhaustive(SearchStrategy):
         return paramValues
 
     def countConfigs(self, paramValues):
-        n = 1
-        for i in paramValues:
-            n *= len(i)
-        return n
-
-    def createExhaConfigs(self):
-        tile_size_lb = config.Arguments.tile_size_range[0] 
-        tile_size_ub = config.Arguments.tile_size_range[1]
-        if config.Arguments.only_powers_of_two:
-            tile_size_range = [2**i for i in range(tile_size_lb, tile_size_ub)]
-        else:
-            tile_size_range = range(tile_size_lb, tile_size_ub)
-
-        tile_sizes = itertools.product(tile_size_range, repeat=config.Arguments.tile_dimensions)
-        
-        block_size_lb = config.Arguments.block_size_range[0] 
-        block_size_ub = config.Arguments.block_size_range[1] 
-        if config.Arguments.only_powers_of_two:
-            block_size_range = [2**i for i in range(block_size_lb, block_size_ub)]
-        else:
-            block_size_range = range(block_size_lb, block_size_ub)
-
-        block_sizes = itertools.product(block_size_range, repeat=config.Arguments.block_dimensions)
+        return search_space.Product(*paramValues).size()
 
-        grid_size_lb = config.Arguments.grid_size_range[0] 
-        grid_size_ub = config.Arguments.grid_size_range[1] 
+    def sizeValues(self, size_range):
+        lb = size_range[0]
+        ub = size_range[1]
         if config.Arguments.only_powers_of_two:
-            grid_size_range = [2**i for i in range(grid_size_lb, grid_size_ub)]
-        else:
-            grid_size_range = range(grid_size_lb, grid_size_ub)
-
-        grid_sizes = itertools.product(grid_size_range, repeat=config.Arguments.grid_dimensions)
+            return [2**i for i in range(lb, ub)]
+        return xrange(lb, ub)
 
+    def memoryValues(self):
         if config.Arguments.no_shared_memory:
             shared_mem = [True, False]
         else:
@@ -434,15 +444,86 @@ class Exhaustive(SearchStrategy):
             private_mem = [True, False]
         else:
             private_mem = [False]
+        return shared_mem, private_mem
+
+    def createExhaConfigs(self):
+        tile_sizes  = search_space.Product(*[self.sizeValues(config.Arguments.tile_size_range)] * self.tile_dimensions)
+        block_sizes = search_space.Product(*[self.sizeValues(config.Arguments.block_size_range)] * self.block_dimensions)
+        grid_sizes  = search_space.Product(*[self.sizeValues(config.Arguments.grid_size_range)] * self.grid_dimensions)
+        shared_mem, private_mem = self.memoryValues()
 
         paramValues = [tile_sizes, block_sizes, grid_sizes, shared_mem, private_mem]
         return paramValues
 
+    def createLegalConfigs(self):
+        """The configurations which tile_size_multiple_filter accepts, constructed
+        directly instead of filtering the whole space. Each is a pair of tile and
+        block sizes followed by the grid size and memory flags"""
+        tile_block = search_space.TileBlockSpace(self.sizeValues(config.Arguments.tile_size_range),
+                                                 self.tile_dimensions,
+                                                 self.sizeValues(config.Arguments.block_size_range),
+                                                 self.block_dimensions,
+                                                 config.Arguments.min_work_group_size,
+                                                 config.Arguments.max_work_group_size,
+                                                 config.Arguments.max_tile_block_ratio)
+        grid_sizes  = search_space.Product(*[self.sizeValues(config.Arguments.grid_size_range)] * self.grid_dimensions)
+        shared_mem, private_mem = self.memoryValues()
+        return search_space.Product(tile_block, grid_sizes, shared_mem, private_mem)
+
+    def lastiter_file(self):
+        # Shards that share a directory must not resume from each other's position
+        if config.Arguments.shard:
+            return ".lastiter.shard-%d-of-%d" % config.Arguments.shard
+        return ".lastiter"
+
+    def selectConfigs(self, space, start_iter):
+        """Enumerate the numbered configurations from start_iter onwards that
+        belong to this shard. Shards take every N-th configuration so that
+        neighbouring configurations, which tend to cost the same to evaluate,
+        are spread evenly across them. The space is indexed directly, so
+        neither resuming nor sharding enumerates the skipped configurations"""
+        if config.Arguments.sample is not None:
+            # Sampled configurations are drawn afresh, so there is nothing to resume
+            numbered = space.sample(config.Arguments.sample)
+            if config.Arguments.shard:
+                index, count = config.Arguments.shard
+                numbered = itertools.islice(numbered, index, None, count)
+        elif config.Arguments.shard:
+            index, count = config.Arguments.shard
+            numbered = space.select(start_iter + (index - start_iter) % count, count)
+        else:
+            numbered = space.select(start_iter)
+        for cnt, conf in numbered:
+            if self.legal_configs:
+                # Tile and block sizes come as a pair
+                conf = conf[0] + conf[1:]
+            elif space_spec.spec:
+                if not space_spec.spec.admits(conf, self.kernel):
+                    continue
+            elif config.Arguments.filter_testcases and not self.tile_size_multiple_filter(conf):
+                continue
+            yield cnt, conf
+
+    def record_result(self, testcase):
+        """Append the outcome of an evaluation to the records file, which
+        merge_results.py combines across shards"""
+        record = collections.OrderedDict()
+        record["shard"]           = "%d/%d" % config.Arguments.shard if config.Arguments.shard else None
+        record["id"]              = testcase.get_ID()
+        record["kernel"]          = testcase.kernel_num
+        record["status"]          = testcase.status
+        record["execution_time"]  = testcase.execution_time
+        record["per_kernel_time"] = testcase.per_kernel_time
+        record["runs"]            = len(testcase.samples)
+        record["ppcg_flags"]      = testcase.ppcg_cmd_line_flags
+        self.records_stream.write(json.dumps(record) + "\n")
+        self.records_stream.flush()
+
     def get_last_iter(self):
-        if os.path.isfile(".lastiter"):
+        if os.path.isfile(self.lastiter_file()):
             print("found last iter")
             try:
-                f_iter = open(".lastiter", 'r+')
+                f_iter = open(self.lastiter_file(), 'r+')
                 start_iter = int(f_iter.readline())
             except:
                 start_iter = 0
@@ -454,120 +535,303 @@ class Exhaustive(SearchStrategy):
 
         return start_iter
 
-    def pipelineExec(self, combs):
+    def pipelineExec(self, combs, ker_num):
 
         start_iter = self.get_last_iter()
-        num_threads = config.Arguments.num_compile_threads
-        for i in range(num_threads):
-            t = CompileThread()
-            t.daemon = True
-            t.start()
-
-        RunThread(num_threads).start()
-
-        cnt = 0
-        for conf in combs:
-            if cnt < start_iter:
-                cnt += 1
-                continue
-            print '---- Configuration ' + str(cnt) + ': ' + str(conf)
-            cur = individual.create_test_case(conf[0], conf[1], conf[2], conf[3], conf[4])
-            cur.set_ID(cnt)
-            cnt += 1
-            compile_queue.put(cur)
-
-        for i in range(num_threads):
-            compile_queue.put(individual.EndOfQueue()) # So every CompileThread fetches one EndOfQueue element
-       
-    def tile_size_multiple_filter(self, conf):
-        tile_size = conf[0]
-        block_size = conf[1]
-
-        work_group_size = reduce(lambda x,y: x*y, block_size)
-        if work_group_size > config.Arguments.max_work_group_size:
-            return False
+        self.best_time = float("inf")
+        self.log_file  = open(config.Arguments.results_file + ".log", 'a')
+        self.iter_file = open(self.lastiter_file(), 'w')
+        # Test cases complete out of order, so resume from the first one that
+        # has not completed rather than from the last one that has
+        self.issued    = collections.deque()
+        self.completed = set()
+
+        def test_cases():
+            for cnt, conf in self.selectConfigs(combs, start_iter):
+                print '---- Configuration ' + str(cnt) + ': ' + str(conf)
+                cur = self.create_test_case(conf, ker_num)
+                cur.set_ID(cnt)
+                self.issued.append(cnt)
+                yield cur
+
+        engine = evaluation_engine.EvaluationEngine(config.Arguments.num_compile_threads)
+        try:
+            engine.evaluate_stream(test_cases(), self.record_pipelined_run)
+        finally:
+            engine.shutdown()
+            self.log_file.close()
+            self.iter_file.close()
 
-        if work_group_size < config.Arguments.min_work_group_size:
-            return False
+        try:
+            os.remove(self.lastiter_file())
+            self.summarise()
+            self.logall()
+        except:
+            pass
 
-        mul_factor = 1
-        for t, b in zip(tile_size, block_size):
-            if t < b:
-                return False
-            if t % b != 0:
-                return False
-            mul_factor *= t/b
+    def record_pipelined_run(self, testcase):
+        # Called from the timing lane as soon as a test case has been measured
+        self.completed.add(testcase.get_ID())
+        resume_from = testcase.get_ID() + 1
+        while self.issued and self.issued[0] in self.completed:
+            resume_from = self.issued.popleft() + 1
+            self.completed.remove(resume_from - 1)
+        if self.issued:
+            resume_from = self.issued[0]
+        self.iter_file.seek(0)
+        self.iter_file.truncate()
+        self.iter_file.write(str(resume_from))
+        self.iter_file.flush()
+        self.record_result(testcase)
+        if self.multi_kernel:
+            self.credit_kernels(testcase)
+
+        if testcase.execution_time < self.best_time and testcase.execution_time != 0 and testcase.status == enums.Status.passed: 
+            self.individuals.append(testcase)
+            self.best_time = testcase.execution_time
+            self.log_file.write("\n Best iter so far = \n")
+            self.log_file.write(str(testcase))
+            self.log_file.flush()
+       
+    def race(self, combs, ker_num):
+        """Successive halving: time every configuration once, then repeatedly
+        keep the fastest 1/eta of them and time those again with eta times as
+        many runs, until --racing-survivors configurations remain. These are
+        measured with the most runs (or with --adaptive-runs) and the fastest
+        of them wins"""
+        eta       = max(2, config.Arguments.racing_eta)
+        survivors = max(1, config.Arguments.racing_survivors)
+        self.log_file = open(config.Arguments.results_file + ".log", 'a')
+        
+        def test_cases():
+            for cnt, conf in self.selectConfigs(combs, 0):
+                print '---- Configuration ' + str(cnt) + ': ' + str(conf)
+                cur = self.create_test_case(conf, ker_num)
+                cur.set_ID(cnt)
+                cur.runs = 1
+                yield cur
+        
+        candidates = []
+        def record(testcase):
+            self.record_result(testcase)
+            if testcase.status == enums.Status.passed and testcase.execution_time != 0:
+                candidates.append(testcase)
+        
+        try:
+            runs  = 1
+            rung = 0
+            self.race_round(test_cases(), record, rung, runs)
+            journal_state("racing", round=rung, runs=runs, survivors=len(candidates))
+            final = len(candidates) <= survivors
+            while candidates:
+                candidates.sort(key=lambda testcase: testcase.execution_time)
+                if not final:
+                    keep       = max(survivors, int(math.ceil(len(candidates)/float(eta))))
+                    candidates = candidates[:keep]
+                    final      = keep <= survivors
+                runs  *= eta
+                rung += 1
+                contestants = candidates
+                candidates  = []
+                for testcase in contestants:
+                    if final and config.Arguments.adaptive_runs:
+                        testcase.remeasure_with(None)
+                    else:
+                        testcase.remeasure_with(runs)
+                self.race_round(contestants, record, rung, runs)
+                journal_state("racing", round=rung, runs=runs, survivors=len(candidates))
+                if final:
+                    break
+        finally:
+            self.log_file.close()
+        
+        candidates.sort(key=lambda testcase: testcase.execution_time)
+        self.individuals.extend(candidates)
+        self.summarise()
+        self.logall()
+    
+    def race_round(self, testcases, record, rung, runs):
+        debug.verbose_message("Racing round %d with %d runs per configuration" % (rung, runs), __name__)
+        engine = evaluation_engine.EvaluationEngine(config.Arguments.num_compile_threads)
+        try:
+            engine.evaluate_stream(testcases, record)
+        finally:
+            engine.shutdown()
+        self.log_file.write("\n Racing round %d with %d runs per configuration: %d configurations evaluated\n" \
+                            % (rung, runs, engine.num_evaluated))
+        self.log_file.flush()
 
-        if mul_factor > 36:
-            return False
+    def create_test_case(self, conf, ker_num):
+        if space_spec.spec:
+            return space_spec.spec.create_test_case(conf, ker_num)
+        return individual.create_test_case(conf[0], conf[1], conf[2], conf[3], conf[4], ker_num)
 
-        return True
+    def tile_size_multiple_filter(self, conf):
+        values = {"tile": conf[0], "block": conf[1]}
+        return all(rule.satisfied(values) for rule in self.size_rules)
 
     def run(self):
         self.individuals = []
         self.multi_kernel = False
+        self.best_kernel_time  = {}
+        self.best_kernel_run   = {}
+        self.best_kernel_sizes = {}
+        self.composite         = None
+        self.size_rules        = constraints.size_rules()
         self.output_stream = open(config.Arguments.results_file, 'w')
-        if config.Arguments.no_concurrent_kernel_tuning:
-            self.multi_kernel = True
-            self.tune_kernel(compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL)
-            self.print_summary()
-            return
-            
-        for k in config.Arguments.kernels_to_tune:
-            self.individuals = []
-            self.tune_kernel(k)
-            self.print_summary()
-        self.output_stream.close()
+        self.records_stream = open(config.Arguments.results_file + ".jsonl", 'a')
+        try:
+            if config.Arguments.decompose_kernels:
+                self.multi_kernel = True
+                self.decompose()
+                self.print_summary()
+                return
+
+            if config.Arguments.no_concurrent_kernel_tuning:
+                self.multi_kernel = True
+                self.tune_kernel(compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL)
+                self.print_summary()
+                return
+                
+            for k in config.Arguments.kernels_to_tune:
+                self.individuals = []
+                self.tune_kernel(k)
+                self.print_summary()
+            self.output_stream.close()
+        finally:
+            self.records_stream.close()
 
-    def tune_kernel(self, ker_num):
+    def kernelSizes(self, ker_num):
+        """The tile, block and grid sizes of one kernel, without memory flags"""
+        self.tile_dimensions, self.block_dimensions, self.grid_dimensions = kernel_discovery.dimensions(ker_num)
+        if space_spec.spec:
+            return space_spec.spec.sizes_space(ker_num)
+        if config.Arguments.filter_testcases:
+            sizes = self.createLegalConfigs()
+            return search_space.Product(sizes.pools[0], sizes.pools[1])
+        return search_space.Product(*self.createExhaConfigs()[:3])
 
-        if config.Arguments.params_from_file:
-            paramValues = self.readParamValues()
+    def kernelSizeTuple(self, sizes):
+        if config.Arguments.filter_testcases and not space_spec.spec:
+            (tile_size, block_size), grid_size = sizes
         else:
-            paramValues = self.createExhaConfigs()
+            tile_size, block_size, grid_size = sizes
+        return compiler_flags.SizeTuple(tile_size, block_size, grid_size)
+
+    def decompose(self):
+        """Tune the sizes of all kernels at once, on the assumption that the time
+        of a kernel depends on its own sizes only. The n-th configuration gives
+        every kernel the n-th sizes of its own space, or leaves it to PPCG's
+        defaults once its space is exhausted, and --prl-profiling credits each
+        kernel's time to its own sizes. The search therefore costs as much as
+        the largest space of a kernel rather than the product of all of them.
+        The best sizes of each kernel are then combined and the composite
+        configuration is measured to validate it"""
+        kernels = [k for k in config.Arguments.kernels_to_tune if k != compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL]
+        if not kernels:
+            sys.exit("--decompose-kernels needs the kernels to tune, from --kernels-to-tune or --discover-kernels")
+        spaces = collections.OrderedDict((k, self.kernelSizes(k)) for k in kernels)
+        for k, space in spaces.iteritems():
+            print 'Number of configurations of kernel %d: %d' % (k, space.size())
+        total = max(space.size() for space in spaces.itervalues())
+        print 'Number of decomposed configurations: ' + str(total)
+        journal_state(enums.SearchStrategy.exhaustive, decomposed=total)
+        the_sizes_flag = compiler_flags.PPCG.flag_map[compiler_flags.PPCG.sizes]
 
-        cnt = 0
-        combs = itertools.product(*paramValues)
+        def test_cases():
+            for cnt in xrange(total):
+                sizes = collections.OrderedDict()
+                for k, space in spaces.iteritems():
+                    if cnt < space.size():
+                        conf = space.unrank(cnt)
+                        if space_spec.spec and not space_spec.spec.admits(conf, k):
+                            # Left to PPCG's defaults, like an exhausted kernel
+                            continue
+                        sizes[k] = self.kernelSizeTuple(conf)
+                print '---- Configuration ' + str(cnt) + ': ' + ', '.join("kernel %d %s" % item for item in sizes.iteritems())
+                cur = individual.Individual()
+                cur.ppcg_flags[the_sizes_flag] = sizes
+                cur.set_ID(cnt)
+                yield cur
+
+        def record(testcase):
+            self.record_result(testcase)
+            sizes = testcase.ppcg_flags[the_sizes_flag]
+            for k in self.credit_kernels(testcase):
+                if k in sizes:
+                    self.best_kernel_sizes[k] = sizes[k]
+                else:
+                    # The kernel was left to PPCG's defaults
+                    self.best_kernel_sizes.pop(k, None)
 
+        engine = evaluation_engine.EvaluationEngine(config.Arguments.num_compile_threads)
+        try:
+            engine.evaluate_stream(test_cases(), record)
+            if not self.best_kernel_sizes:
+                return
+            self.composite = individual.Individual()
+            self.composite.ppcg_flags[the_sizes_flag] = collections.OrderedDict(sorted(self.best_kernel_sizes.items()))
+            self.composite.set_ID(total)
+            debug.verbose_message("Validating the composite configuration", __name__)
+            engine.evaluate([self.composite], record)
+            journal_state(enums.SearchStrategy.exhaustive, composite=self.composite.execution_time)
+        finally:
+            engine.shutdown()
 
-        if config.Arguments.filter_testcases:
-            #Filter out only test cases based on heusristics such as tile size is multiple of block size etc.. 
-            combs = filter(self.tile_size_multiple_filter, combs)
-            #Filter out only test cases where shared memory is true
-            #combs = filter(lambda conf: conf[3] == True, combs)
-            #Filter out only test cases where private memory is true
-            #combs = filter(lambda conf: conf[4] == True, combs)
+    def tune_kernel(self, ker_num):
+        journal_state(enums.SearchStrategy.exhaustive, kernel=ker_num)
+        # Discovered kernels have sizes of their own number of dimensions
+        self.tile_dimensions, self.block_dimensions, self.grid_dimensions = kernel_discovery.dimensions(ker_num)
+
+        # Configurations are generated lazily, one at a time, so that memory
+        # stays constant and the first one is evaluated straight away. Each is
+        # numbered by its position in the space
+        self.kernel        = ker_num
+        self.legal_configs = config.Arguments.filter_testcases and not config.Arguments.params_from_file and not space_spec.spec
+        if self.legal_configs:
+            # Only the configurations that pass the filter are generated
+            combs = self.createLegalConfigs()
+            print 'Number of configurations: ' + str(combs.size())
+        elif space_spec.spec:
+            # Configurations that break the conditions of the space are skipped in selectConfigs
+            combs = space_spec.spec.space(ker_num)
+            print 'Number of configurations before filtering: ' + str(combs.size())
+        else:
+            if config.Arguments.params_from_file:
+                paramValues = self.readParamValues()
+            else:
+                paramValues = self.createExhaConfigs()
+            combs = search_space.Product(*paramValues)
+            # Sizes read from explore-params.py are filtered in selectConfigs
+            print 'Number of configurations before filtering: ' + str(self.countConfigs(paramValues))
+
+        if config.Arguments.racing:
+            self.race(combs, ker_num)
+            return
 
         if config.Arguments.parallelize_compilation:
-            self.pipelineExec(combs)
+            self.pipelineExec(combs, ker_num)
             return
 
         start_iter = self.get_last_iter() 
 
         f = open(config.Arguments.results_file + ".log", 'a')
-        f_iter = open('.lastiter', 'w')
+        f_iter = open(self.lastiter_file(), 'w')
 
-        best_time = float("inf")
-        best_kernel_time = [] 
-        self.best_kernel_run = []
-        if self.multi_kernel:
-            for s in config.Arguments.kernels_to_tune:
-                best_kernel_time.append(float("inf"))
-                self.best_kernel_run.append(0)
+        best_time      = float("inf")
+        best_wall_time = None
         #print 'Parameter values to be explored: ' + str(paramValues)
         #print 'Number of configurations: ' + str(self.countConfigs(paramValues))
-        for conf in combs:
-            if cnt < start_iter:
-                cnt += 1
-                continue
+        for cnt, conf in self.selectConfigs(combs, start_iter):
             print '---- Configuration ' + str(cnt) + ': ' + str(conf)
-            cur = individual.create_test_case(conf[0], conf[1], conf[2], conf[3], conf[4], ker_num)
+            cur = self.create_test_case(conf, ker_num)
             cur.set_ID(cnt)
             cnt += 1
-            cur.run(best_time)
+            cur.run(best_time, best_wall_time)
+            self.record_result(cur)
             if cur.status == enums.Status.ppcgtimeout :
-                f.write("\nppcg timeout")
-                f.write(str(best_run))
+                f.write("\nppcg timeout\n")
+                f.write(str(cur))
                 f.flush()
                 continue
                 
@@ -576,32 +840,57 @@ class Exhaustive(SearchStrategy):
 
             if self.multi_kernel:
                 #f.write("\n====================================\n")
-                for k in config.Arguments.kernels_to_tune:
-                    if cur.per_kernel_time[k] < best_kernel_time[k]:
-                        best_kernel_time[k] = cur.per_kernel_time[k]
-                        self.best_kernel_run[k] = cur
-                        f.write("\n Best time so far for kernel "+str(k) + " ID " +  str(cnt) + " kernel time = " + str(best_kernel_time[k]))
-                        f.write(str(cur.ppcg_cmd_line_flags) + str("\n"))
-                        f.flush()
+                for k in self.credit_kernels(cur):
+                    f.write("\n Best time so far for kernel "+str(k) + " ID " +  str(cnt) + " kernel time = " + str(self.best_kernel_time[k]))
+                    f.write(str(cur.ppcg_cmd_line_flags) + str("\n"))
+                    f.flush()
 
             if cur.execution_time < best_time and cur.status == enums.Status.passed:
                 self.individuals.append(cur)
                 best_time = cur.execution_time
                 best_run = cur
+                if cur.wall_time is not None:
+                    best_wall_time = cur.wall_time
                 f.write("\n Best iter so far = "+ str(cnt) + "\n")
                 f.write(str(best_run))
                 f.flush()
 
             f_iter.seek(0)
-            f_iter.write(str(cur.get_ID()))
+            f_iter.truncate()
+            f_iter.write(str(cur.get_ID() + 1))
+            f_iter.flush()
 
             
+    def credit_kernels(self, testcase):
+        """Credit the time of each kernel in a run to the configuration that ran
+        it. Returns the kernels for which the configuration is the best so far"""
+        improved = []
+        if testcase.status != enums.Status.passed:
+            return improved
+        for k in config.Arguments.kernels_to_tune:
+            if testcase.per_kernel_time[k] < self.best_kernel_time.get(k, float("inf")):
+                self.best_kernel_time[k] = testcase.per_kernel_time[k]
+                self.best_kernel_run[k]  = testcase
+                improved.append(k)
+        return improved
+
     def summarise_per_kernel(self):
         for k in config.Arguments.kernels_to_tune:
+            if k not in self.best_kernel_run:
+                print("No time was measured for kernel %d; kernel times need --prl-profiling" % k)
+                continue
             print "Best config for kernel " + str(k)
             print("had execution time %f ms" % (self.best_kernel_time[k])) 
             print("To replicate, use the following configuration:")
-            print(self.best_kernel_run[k].ppcg_cmd_line_flags, False)
+            if k in self.best_kernel_sizes:
+                print("kernel %d sizes %s" % (k, self.best_kernel_sizes[k]))
+            else:
+                print(self.best_kernel_run[k].ppcg_cmd_line_flags)
+        if self.composite is not None:
+            print("The composite of the best sizes of each kernel had execution time %f (status %s)" \
+                  % (self.composite.execution_time, self.composite.status))
+            print("To replicate, pass the following to PPCG:")
+            print(self.composite.ppcg_cmd_line_flags)
 
     def summarise(self):
         print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
@@ -654,8 +943,7 @@ class SimulatedAnnealing(SearchStrategy):
                 clone_flags[the_flag] = the_flag.possible_values[newIdx]
     
    def mutate(self, solution):
-        clone    = copy.deepcopy(solution)
-        clone.ID = individual.Individual.get_ID()
+        clone    = individual.create_from_genome(solution.get_genome())
         for the_flag in solution.ppcg_flags.keys():   
             if bool(random.getrandbits(1)):
                 if isinstance(the_flag, compiler_flags.EnumerationFlag):
@@ -669,27 +957,52 @@ class SimulatedAnnealing(SearchStrategy):
         self.mutate_backend_flags(clone.cc_flags, solution.cc_flags)
         self.mutate_backend_flags(clone.cxx_flags, solution.cxx_flags)
         self.mutate_backend_flags(clone.nvcc_flags, solution.nvcc_flags)
+        constraints.repair_all([clone])
         return clone
     
    def run(self):        
+        self.engine = evaluation_engine.EvaluationEngine(config.Arguments.num_compile_threads)
+        try:
+            self.anneal()
+        finally:
+            self.engine.shutdown()
+    
+   def anneal(self):
         debug.verbose_message("Creating initial solution", __name__)
         current = individual.create_random()
-        current.run()   
+        self.engine.evaluate([current])
         self.fittest = current
+        journal_state(enums.SearchStrategy.simulated_annealing, current=current.ID, fittest=current.execution_time)
         
+        # Neighbours of the current solution are evaluated in batches so that
+        # all compile workers are kept busy. The batch is then walked in order
+        # and the usual acceptance test applied to each neighbour
+        batch_size  = self.engine.num_compile_threads
         temperature = config.Arguments.initial_temperature
         for i in range(1, config.Arguments.cooling_steps+1):
             debug.verbose_message("Cooling step %d" % i, __name__)
             temperature *= config.Arguments.cooling
-            for j in range(1, config.Arguments.temperature_steps+1):
+            j = 1
+            while j <= config.Arguments.temperature_steps:
                 debug.verbose_message("Temperature step %d" % j, __name__)
-                new = self.mutate(current)
-                new.run()       
-                if new.status == enums.Status.passed:     
-                    if self.acceptance_probability(current.execution_time, new.execution_time, temperature):
-                        current = new
-                    if current.execution_time < self.fittest.execution_time:
-                        self.fittest = current
+                neighbours = [self.mutate(current) for k in range(min(batch_size, config.Arguments.temperature_steps-j+1))]
+                self.engine.evaluate(neighbours)
+                j += len(neighbours)
+                for new in neighbours:
+                    # A run cut short still ranks the neighbour by the lower
+                    # bound on its time, but only a complete measurement can
+                    # make it the fittest
+                    if new.measured():     
+                        if self.acceptance_probability(current.execution_time, new.execution_time, temperature):
+                            current = new
+                        if current.status == enums.Status.passed and current.execution_time < self.fittest.execution_time:
+                            self.fittest = current
+                journal_state(enums.SearchStrategy.simulated_annealing,
+                              cooling_step=i,
+                              temperature_step=j-1,
+                              temperature=temperature,
+                              current=current.ID,
+                              fittest=self.fittest.execution_time)
     
    def summarise(self):
         debug.summary_message("The final individual had execution time %f seconds" % (self.fittest.execution_time)) 
@@ -1,4 +1,3 @@
-import timeit
 import os
 import re
 import debug
@@ -6,16 +5,21 @@ import compiler_flags
 import config
 import enums
 import collections
-import subprocess
 import threading
 import internal_exceptions
 import time
-
-class EndOfQueue:
-    def __init__(self):
-        pass
-
-
+import shutil
+import hashlib
+import tempfile
+import evaluation_cache
+import artifact_cache
+import run_lanes
+import processes
+import measurement
+import journal
+import cost_model
+import genome
+import constraints
 
 def get_fittest(population):
     fittest = None
@@ -36,37 +40,37 @@ def create_test_case(tile_size, block_size, grid_size, shared_mem=True, private_
     per_kernel_size_info[k] = compiler_flags.SizeTuple(tile_size, block_size, grid_size)
     individual.kernel_num = k
 
-    #for flag in compiler_flags.PPCG.optimisation_flags:
-    #    print(flag)
-
-    #TODO: Get a better way of getting size_data_flag
-    flag = compiler_flags.PPCG.optimisation_flags[4]
+    flag = compiler_flags.registry.lookup(compiler_flags.PPCG.sizes, compiler_flags.FlagRegistry.ppcg)
+    assert flag is not None, "The --sizes flag is not being tuned"
     individual.ppcg_flags[flag] = per_kernel_size_info 
 
+    # The memory flags are left alone if the user blacklisted them
     if not shared_mem:
-        flag = compiler_flags.PPCG.optimisation_flags[0]
-        #individual.ppcg_flags[flag] = compiler_flags.EnumerationFlag(flag) 
-        individual.ppcg_flags[flag] = True 
-
+        flag = compiler_flags.registry.lookup(compiler_flags.PPCG.no_shared_memory, compiler_flags.FlagRegistry.ppcg)
+        if flag is not None:
+            individual.ppcg_flags[flag] = True 
 
     if not private_mem:
-        flag = compiler_flags.PPCG.optimisation_flags[7]
-        #individual.ppcg_flags[flag] = compiler_flags.EnumerationFlag(flag) 
-        individual.ppcg_flags[flag] = True 
-
-    #Set isl fusion flag
-    #flag = compiler_flags.PPCG.optimisation_flags[6]
-    #individual.ppcg_flags[flag] = fusion
-    #string  = individual.ppcg_flags[flag].get_command_line_string(1024)
-    #print(string)
-    #print("end")
+        flag = compiler_flags.registry.lookup(compiler_flags.PPCG.no_private_memory, compiler_flags.FlagRegistry.ppcg)
+        if flag is not None:
+            individual.ppcg_flags[flag] = True 
+
     return individual
 
+def create_from_genome(the_genome):
+    """A fresh individual with the configuration of the given genome"""
+    individual            = Individual()
+    flag_values           = the_genome.flags()
+    individual.ppcg_flags = flag_values[compiler_flags.FlagRegistry.ppcg]
+    individual.cc_flags   = flag_values[compiler_flags.FlagRegistry.cc]
+    individual.cxx_flags  = flag_values[compiler_flags.FlagRegistry.cxx]
+    individual.nvcc_flags = flag_values[compiler_flags.FlagRegistry.nvcc]
+    individual.kernel_num = the_genome.kernel_num
+    return individual
 
 def create_random():
     individual = Individual()   
     for flag in compiler_flags.PPCG.optimisation_flags:
-        print(flag)
         individual.ppcg_flags[flag] = flag.random_value()
     for flag in compiler_flags.CC.optimisation_flags:
         individual.cc_flags[flag] = flag.random_value()
@@ -74,23 +78,89 @@ def create_random():
         individual.cxx_flags[flag] = flag.random_value()
     for flag in compiler_flags.NVCC.optimisation_flags:
         individual.nvcc_flags[flag] = flag.random_value()
+    constraints.repair_all([individual])
     return individual
 
+def features(ppcg_flags, cc_flags, cxx_flags, nvcc_flags):
+    """Encode a configuration as a vector of reals. Every configuration of a
+    search encodes to the same length whichever flags it sets"""
+    encoding = []
+    for the_flags, flag_values in [(compiler_flags.PPCG.optimisation_flags, ppcg_flags),
+                                   (compiler_flags.CC.optimisation_flags, cc_flags),
+                                   (compiler_flags.CXX.optimisation_flags, cxx_flags),
+                                   (compiler_flags.NVCC.optimisation_flags, nvcc_flags)]:
+        for flag in the_flags:
+            encoding.extend(flag.features(flag_values.get(flag)))
+    return encoding
+
 class Individual:
     """An individual solution in a population"""
     
-    ID = 0
+    # The suffixes of the files that PPCG generates
+    GENERATED_SUFFIXES = ['_host.c', 
+                          '_host_kernel.cl', 
+                          '_host.cu', 
+                          '_kernel.cu', 
+                          '_kernel.hu', 
+                          '_host_kernel.hu', 
+                          '_host_kernel.h']
+    
+    ID      = 0
+    ID_lock = threading.Lock()
+    # The outcomes that are not stored in the evaluation cache
+    UNCACHEABLE = [enums.Status.ppcgtimeout, enums.Status.timeout, enums.Status.censored]
+    
     @staticmethod
     def get_ID_init():
-        Individual.ID += 1
-        return Individual.ID
+        with Individual.ID_lock:
+            Individual.ID += 1
+            return Individual.ID
+    
+    def get_workspace(self):
+        """The scratch directory holding the files of this evaluation. It is
+        created on first use and its name is unique across processes"""
+        if self.workspace is None:
+            try:
+                os.makedirs(config.Arguments.workspace_dir)
+            except OSError:
+                if not os.path.isdir(config.Arguments.workspace_dir):
+                    raise
+            self.workspace = tempfile.mkdtemp(prefix='testcase%d-' % self.ID, 
+                                              dir=config.Arguments.workspace_dir)
+        return self.workspace
+    
+    def clean_workspace(self):
+        if self.workspace is not None:
+            shutil.rmtree(self.workspace, ignore_errors=True)
+            self.workspace = None
     
     def file_name(self):
         if config.Arguments.binary_file_name:
-            return config.Arguments.binary_file_name
+            return os.path.join(self.get_workspace(), config.Arguments.binary_file_name)
 
-        return 'testcase'+str(self.ID)
+        return os.path.join(self.get_workspace(), 'testcase'+str(self.ID))
         #return 'gemm'
+    
+    def executable(self):
+        the_executable = self.file_name()+'.exe'
+        if not os.path.isabs(the_executable):
+            the_executable = os.path.join(os.curdir, the_executable)
+        return the_executable
+    
+    def environment(self, lane=None):
+        """The environment of the processes spawned for this evaluation. Commands
+        given with --cmd-string-complete can refer to these variables to find
+        the workspace, and binaries to find the device of their run lane. The
+        processes run in the current directory rather than in the workspace,
+        since their inputs are given relative to it, so such commands must
+        write their outputs under AUTOTUNER_WORKSPACE themselves"""
+        env = dict(os.environ)
+        env["AUTOTUNER_PPCG_FLAGS"] = self.ppcg_cmd_line_flags
+        env["AUTOTUNER_WORKSPACE"]  = self.get_workspace()
+        env["AUTOTUNER_FILE_NAME"]  = self.file_name()
+        if lane is not None:
+            lane.environment(env)
+        return env
 
     def set_ID(self, num):
         self.ID = num  
@@ -106,7 +176,20 @@ class Individual:
         self.nvcc_flags       = collections.OrderedDict()
         self.status           = enums.Status.failed
         self.execution_time   = float("inf") 
+        self.samples          = []
+        self.runs             = None
+        self.fresh            = False
         self.num = 0
+        self.cache_key        = None
+        self.code_key         = None
+        self.code_digest      = None
+        self.relocatable      = False
+        self.artifact_key     = None
+        self.from_cache       = False
+        self.replayed         = False
+        self.predicted_time   = None
+        self.workspace        = None
+        self.wall_time        = None
         self.kernel_num=compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL
         self.per_kernel_time = [] 
         for k in config.Arguments.kernels_to_tune:
@@ -117,23 +200,186 @@ class Individual:
     
     def all_flag_values(self):
         return self.ppcg_flags.values() + self.cc_flags.values() + self.cxx_flags.values() + self.nvcc_flags.values()
+    
+    def flag_values(self):
+        """The values of the flags per category of the flag registry"""
+        return {compiler_flags.FlagRegistry.ppcg: self.ppcg_flags,
+                compiler_flags.FlagRegistry.cc:   self.cc_flags,
+                compiler_flags.FlagRegistry.cxx:  self.cxx_flags,
+                compiler_flags.FlagRegistry.nvcc: self.nvcc_flags}
+    
+    def get_genome(self):
+        return genome.encode(self.flag_values(), self.kernel_num)
+    
+    def features(self):
+        return features(self.ppcg_flags, self.cc_flags, self.cxx_flags, self.nvcc_flags)
             
-    def run(self, timeout):
+    def run(self, timeout, best_wall_time=None):
         try:
-            self.compile(timeout)
-            if self.status == enums.Status.passed:
-                # Fitness is inversely proportional to execution time
-                if self.execution_time == 0:
-                    self.fitness = float("inf")
-                else:
-                    self.fitness = 1/self.execution_time 
-                debug.verbose_message("Individual %d: execution time = %f, fitness = %f" \
-                                      % (self.ID, self.execution_time, self.fitness), __name__) 
-            else:
-                self.fitness = 0
+            if not self.begin_evaluation():
+                completed = False
+                try:
+                    self.compile(timeout, best_wall_time)
+                    completed = True
+                finally:
+                    self.end_evaluation(completed)
+            self.compute_fitness()
+            self.record_evaluation()
         except internal_exceptions.FailedCompilationException as e:
             debug.exit_message(e)
             
+    def measured(self):
+        """Whether the execution time ranks this individual: either all its runs
+        completed or they were cut short by --kill-slower-runs, in which case
+        the execution time is a lower bound"""
+        return self.status in [enums.Status.passed, enums.Status.censored]
+
+    def compute_fitness(self):
+        if self.measured():
+            # Fitness is inversely proportional to execution time
+            if self.execution_time == 0:
+                self.fitness = float("inf")
+            else:
+                self.fitness = 1/self.execution_time 
+            debug.verbose_message("Individual %d: execution time = %f, fitness = %f" \
+                                  % (self.ID, self.execution_time, self.fitness), __name__) 
+        else:
+            self.fitness = 0
+            
+    def begin_evaluation(self):
+        """Consult the evaluation cache. Returns True if the measurement of this
+        individual was retrieved from the cache, if it breaks a constraint, or
+        if the cost model predicts it to be hopeless, in which case there is
+        nothing left to do. Otherwise
+        the caller must evaluate the individual and then call end_evaluation()"""
+        self.ppcg_cmd_line_flags = self.get_ppcg_cmd_line_flags()
+        self.cache_key           = None
+        self.code_key            = None
+        self.from_cache          = False
+        self.replayed            = False
+        if journal.journal and journal.journal.replay(self):
+            self.replayed = True
+            debug.verbose_message("Individual %d: measurement replayed from the journal" % self.ID, __name__)
+            return True
+        if constraints.checker and not self.fresh and constraints.checker.reject(self):
+            self.status         = enums.Status.infeasible
+            self.execution_time = float("inf")
+            return True
+        if cost_model.model and not self.fresh and cost_model.model.screen(self):
+            self.status         = enums.Status.skipped
+            self.execution_time = float("inf")
+            return True
+        if not evaluation_cache.cache or self.fresh:
+            return False
+        key    = evaluation_cache.make_key(self)
+        result = evaluation_cache.cache.claim(key)
+        if result is None:
+            self.cache_key = key
+            return False
+        self.restore_measurement(result)
+        config.num_cache_hits += 1
+        debug.verbose_message("Individual %d: measurement retrieved from the cache" % self.ID, __name__)
+        return True
+    
+    def record_evaluation(self):
+        """Append the outcome of this evaluation to the journal unless it was
+        replayed from there, and teach it to the cost model"""
+        if journal.journal and not self.replayed:
+            journal.journal.record_evaluation(self)
+        if cost_model.model:
+            cost_model.model.learn(self)
+    
+    def reuse_identical_code(self):
+        """Called once PPCG has run. Returns True if PPCG generated the same code
+        as for an earlier evaluation, in which case that measurement is reused
+        and there is no need to build and run this individual"""
+        if not evaluation_cache.cache or self.code_digest is None or self.fresh:
+            return False
+        key    = evaluation_cache.make_code_key(self, self.code_digest)
+        result = evaluation_cache.cache.claim(key)
+        if result is None:
+            self.code_key = key
+            return False
+        self.restore_measurement(result)
+        self.clean_workspace()
+        config.num_identical_code += 1
+        debug.verbose_message("Individual %d: PPCG generated the same code as before, reusing its measurement" % self.ID, __name__)
+        return True
+    
+    def remeasure_with(self, runs):
+        """Prepare to measure this individual again, this time with the given
+        number of runs or, if that is None, as many as --adaptive-runs decides.
+        The evaluation cache is bypassed so that the binary is actually run"""
+        self.runs  = runs
+        self.fresh = True
+    
+    def duplicate_in_flight(self):
+        """True if the same configuration is being evaluated right now, in which
+        case begin_evaluation() would wait for it"""
+        return not self.fresh \
+            and evaluation_cache.cache is not None \
+            and evaluation_cache.cache.is_in_flight(evaluation_cache.make_key(self))
+    
+    def duplicate_code_in_flight(self):
+        """True if the code that PPCG generated for this individual is being built
+        or run right now, in which case reuse_identical_code() would wait for it"""
+        return not self.fresh \
+            and evaluation_cache.cache is not None \
+            and self.code_digest is not None \
+            and evaluation_cache.cache.is_in_flight(evaluation_cache.make_code_key(self, self.code_digest))
+    
+    def restore_measurement(self, result):
+        self.status          = result.status
+        self.execution_time  = result.execution_time
+        self.per_kernel_time = result.per_kernel_time
+        self.samples         = result.samples
+        self.from_cache      = True
+    
+    def generated_code_digest(self):
+        """Returns a hash of the code that PPCG generated, or None if no generated
+        file was found, and whether the code is independent of the workspace it
+        was generated in"""
+        digest      = hashlib.sha1()
+        found       = False
+        relocatable = True
+        base_name   = os.path.basename(self.file_name())
+        for suffix in Individual.GENERATED_SUFFIXES:
+            the_file = self.file_name() + suffix
+            if not os.path.exists(the_file):
+                continue
+            found = True
+            with open(the_file, 'r') as f:
+                code = f.read()
+            # The OpenCL host code, for example, refers to the kernel file by
+            # its path, which contains the workspace
+            if self.get_workspace() in code:
+                relocatable = False
+                code = code.replace(self.get_workspace(), 'workspace')
+            if not config.Arguments.binary_file_name:
+                # Generated files refer to each other by name and the name
+                # contains the ID of the individual
+                code = re.sub(r'%s(?!\d)' % re.escape(base_name), 'testcase', code)
+            digest.update(suffix)
+            digest.update(code)
+        if not found:
+            return None, False
+        return digest.hexdigest(), relocatable
+    
+    def end_evaluation(self, completed=True):
+        """Record the measurement in the evaluation cache, unless the evaluation
+        did not complete, and let waiting workers proceed. Timeouts and runs cut
+        short depend on --*-timeout and on the best configuration at the time,
+        so they are not results of the configuration alone and are not cached"""
+        for key in [self.cache_key, self.code_key]:
+            if not key:
+                continue
+            try:
+                if completed and self.status not in Individual.UNCACHEABLE:
+                    evaluation_cache.cache.store(key, self)
+            finally:
+                evaluation_cache.cache.release(key)
+        self.cache_key = None
+        self.code_key  = None
             
     def checkforpause(self):
         while(1):
@@ -144,20 +390,24 @@ class Individual:
                 #print("Auto tuning restarted")
                 break
 
-    def compile(self, timeout=float("inf")):
+    def compile(self, timeout=float("inf"), best_wall_time=None):
         self.checkforpause()
-        self.ppcg()
-        #sucess=self.ppcg_with_timeout(timeout)
-        #if not sucess:
-        #    return
-        self.build()
-        self.binary(timeout)
+        try:
+            self.ppcg()
+            if self.reuse_identical_code():
+                return
+            self.build()
+        except internal_exceptions.StageTimeoutException as e:
+            debug.warning_message("Individual %d: %s" % (self.ID, e))
+            return
+        self.binary(timeout, best_wall_time)
 
-    def ppcg(self):
-        self.ppcg_cmd_line_flags = "--target=%s --dump-sizes %s" % (config.Arguments.target, 
-                                                                    ' '.join(flag.get_command_line_string(self.ppcg_flags[flag]) for flag in self.ppcg_flags.keys()))
-        
-        os.environ["AUTOTUNER_PPCG_FLAGS"] = self.ppcg_cmd_line_flags
+    def get_ppcg_cmd_line_flags(self):
+        return "--target=%s --dump-sizes %s" % (config.Arguments.target, 
+                                                ' '.join(flag.get_command_line_string(self.ppcg_flags[flag]) for flag in self.ppcg_flags.keys()))
+
+    def ppcg_command(self):
+        self.ppcg_cmd_line_flags = self.get_ppcg_cmd_line_flags()
 
         if config.Arguments.cmd_string_complete:
             cmd = config.Arguments.ppcg_cmd+ ' '+self.ppcg_cmd_line_flags
@@ -165,45 +415,105 @@ class Individual:
             cmd = config.Arguments.ppcg_cmd + ' '+self.ppcg_cmd_line_flags+' -o '+self.file_name()
         else:
             cmd = config.Arguments.ppcg_cmd + ' '+self.ppcg_cmd_line_flags+' -o '+self.file_name()+'_host.c'
+        return cmd
 
-        debug.verbose_message("Running '%s'" % cmd, __name__)
-        #debug.verbose_message("Running '%s'" % self.ppcg_cmd_line_flags , __name__)
-        start  = timeit.default_timer()
-        self.ppcg_proc   = subprocess.Popen(cmd, shell=True, stderr=subprocess.PIPE)  
-        stderr = self.ppcg_proc.communicate()[1]
-        end    = timeit.default_timer()
-        config.time_PPCG += end - start
-        if self.ppcg_proc.returncode:
+    def ppcg_finished(self, returncode, elapsed):
+        config.time_PPCG += elapsed
+        if returncode:
             raise internal_exceptions.FailedCompilationException("FAILED: '%s'" % config.Arguments.ppcg_cmd)         
-        
+        self.code_digest, self.relocatable = self.generated_code_digest()
 
-    def ppcg_with_timeout(self, timeout=float("inf")):
-        thread = threading.Thread(target=self.ppcg)
-        thread.start()
-        thread.join(timeout)
-        if thread.is_alive():
-            print("Timeout: terminating the ppcg ")
-            self.ppcg_proc.terminate()
-            thread.join(timeout)
+    def ppcg(self):
+        cmd = self.ppcg_command()
+        debug.verbose_message("Running '%s'" % cmd, __name__)
+        #debug.verbose_message("Running '%s'" % self.ppcg_cmd_line_flags , __name__)
+        returncode, stderr, elapsed = processes.run(run_lanes.compile_command(cmd), processes.PPCG, config.Arguments.ppcg_timeout,
+                                                    capture="stderr", env=self.environment())
+        self.check_stage(processes.PPCG, returncode, config.Arguments.ppcg_timeout)
+        # Keep the sizes PPCG dumps, as the event loop does
+        with open(os.path.join(self.get_workspace(), "ppcg.err"), 'w') as ppcg_err:
+            ppcg_err.write(stderr)
+        self.ppcg_finished(returncode, elapsed)
+
+    def check_stage(self, stage, returncode, timeout):
+        """Give up on PPCG or the build command if it was killed for running out
+        of time, as the event loop does"""
+        if returncode is None:
+            reason = "%s timed out after %s seconds" % (stage, timeout)
+        elif processes.exceeded_cpu_limit(returncode):
+            reason = "%s exceeded the CPU limit of %s seconds" % (stage, config.Arguments.cpu_limit)
+        else:
+            return
+        if stage == processes.PPCG:
             self.status = enums.Status.ppcgtimeout
-            return False
-        return True
+        else:
+            self.status = enums.Status.timeout
+        self.clean_workspace()
+        raise internal_exceptions.StageTimeoutException(reason)
 
-    def build(self):
+    def build_command(self):
         if config.Arguments.cmd_string_complete:
             build_cmd = config.Arguments.build_cmd
         elif config.Arguments.target == enums.Targets.cuda:
             build_cmd = config.Arguments.build_cmd + ' ' + self.file_name()+ '_host.cu ' + self.file_name()+ '_kernel.cu '+ '-o '+ self.file_name()+'.exe'
         else:
             build_cmd = config.Arguments.build_cmd + ' ' + self.file_name()+ '_host.c ' + '-o '+ self.file_name()+'.exe' + ' -lprl -lOpenCL'
-        debug.verbose_message("Running '%s'" % build_cmd, __name__)
-        start  = timeit.default_timer()
-        proc   = subprocess.Popen(build_cmd, shell=True)  
-        stderr = proc.communicate()[1]     
-        end    = timeit.default_timer()
-        config.time_backend += end - start
-        if proc.returncode:
+        return build_cmd
+
+    def fetch_cached_build(self):
+        """Returns True if the executable was retrieved from the artifact cache,
+        in which case there is no need to run the build command"""
+        self.artifact_key = None
+        if artifact_cache.cache and self.code_digest and self.relocatable:
+            self.artifact_key = artifact_cache.make_key(self)
+            if artifact_cache.cache.fetch(self.artifact_key, self.file_name()+'.exe'):
+                config.num_artifact_hits += 1
+                debug.verbose_message("Individual %d: executable retrieved from the artifact cache" % self.ID, __name__)
+                return True
+        return False
+
+    def fetch_previous_build(self):
+        """Returns True if the executable built during an earlier evaluation of
+        this individual was retrieved from the artifact cache, in which case
+        neither PPCG nor the build command need to run again"""
+        if not self.fresh or not artifact_cache.cache or not self.artifact_key:
+            return False
+        if artifact_cache.cache.fetch(self.artifact_key, self.file_name()+'.exe'):
+            config.num_artifact_hits += 1
+            return True
+        return False
+
+    def build_finished(self, returncode, elapsed):
+        config.time_backend += elapsed
+        if returncode:
             raise internal_exceptions.FailedCompilationException("FAILED: '%s'" % config.Arguments.build_cmd)
+        if self.artifact_key:
+            if os.path.exists(self.file_name()+'.exe'):
+                artifact_cache.cache.store(self.artifact_key, self.file_name()+'.exe')
+            else:
+                self.artifact_key = None
+
+    def build(self):
+        if self.fetch_cached_build():
+            return
+        build_cmd = self.build_command()
+        debug.verbose_message("Running '%s'" % build_cmd, __name__)
+        returncode, _, elapsed = processes.run(run_lanes.compile_command(build_cmd), processes.BUILD, config.Arguments.build_timeout,
+                                               env=self.environment())
+        self.check_stage(processes.BUILD, returncode, config.Arguments.build_timeout)
+        self.build_finished(returncode, elapsed)
+
+    def remeasure(self, best_execution_time=float("inf")):
+        """Time this individual again using its cached executable, so that neither
+        PPCG nor the build command are invoked. Returns False if the executable
+        is not available, in which case nothing is run"""
+        if not artifact_cache.cache or not self.artifact_key:
+            return False
+        if not artifact_cache.cache.fetch(self.artifact_key, self.file_name()+'.exe'):
+            self.clean_workspace()
+            return False
+        self.binary(best_execution_time)
+        return True
 
 
     
@@ -239,7 +549,18 @@ class Individual:
         for k in config.Arguments.kernels_to_tune:
             self.per_kernel_time[k] = self.extract_kernel_time(k, stdout)
 
-    def binary(self, best_execution_time=float("inf")):
+    def run_command(self):
+        if config.Arguments.cmd_string_complete:
+            run_cmd = config.Arguments.run_cmd
+        else:
+            run_cmd = self.executable()+' '+config.Arguments.run_cmd_input
+        #run_cmd = config.Arguments.run_cmd
+        return run_cmd
+
+    def begin_runs(self, best_execution_time=float("inf"), best_wall_time=None):
+        """Prepare to time the binary. Returns True if it should be run at all.
+        The wall time of a run of the best configuration so far, if known,
+        bounds how long each run may take with --kill-slower-runs"""
         #time_regex = re.compile(r'^(\d*\.\d+|\d+)$')
         #print config.Arguments.execution_time_regex
         if config.Arguments.prl_profiling:
@@ -251,57 +572,127 @@ class Individual:
             re_str = config.Arguments.execution_time_regex
 
         print re_str
-        time_regex = re.compile(re_str)
-        total_time = 0.0
-        status     = enums.Status.passed
-        num_actual_runs = 0
-        for run in xrange(1,config.Arguments.runs+1):
-            if config.Arguments.cmd_string_complete:
-                run_cmd = config.Arguments.run_cmd
-            else:
-                run_cmd = './'+self.file_name()+'.exe '+config.Arguments.run_cmd_input
-            #run_cmd = config.Arguments.run_cmd
-            debug.verbose_message("Run #%d of '%s'" % (run, run_cmd), __name__)
-            start = timeit.default_timer()
-            self.proc  = subprocess.Popen(run_cmd, shell=True, stdout=subprocess.PIPE)    
-            stdout, stderr = self.proc.communicate()
-            end   = timeit.default_timer()
-            if self.proc.returncode:
-                sper_kernel_size_infotatus = enums.Status.failed
-                debug.warning_message("FAILED: '%s'" % config.Arguments.run_cmd)
-                continue
-            if config.Arguments.execution_time_from_binary:
-                if not stdout:
-                    raise internal_exceptions.BinaryRunException("Expected the binary to dump its execution time. Found nothing")
-                self.update_kernel_times(stdout)
-                nmatchedlines = 0
-                for line in stdout.split(os.linesep):
-                    line    = line.strip()
-                    matches = time_regex.findall(line)
-                    if matches:
-                        nmatchedlines += 1
-                        try:
-                            total_time += float(matches[0])
-                        except:
-                            raise internal_exceptions.BinaryRunException("Execution time '%s' is not in the required format" % matches[0])
-                if nmatchedlines == 0:
-                    raise internal_exceptions.BinaryRunException("Regular expression did not match anything on the program's output")
-            else:
-                total_time += end - start
+        self.time_regex_string   = re_str
+        self.total_time          = 0.0
+        self.samples             = []
+        self.run_status          = enums.Status.passed
+        self.num_actual_runs     = 0
+        self.num_runs            = 0
+        self.best_execution_time = best_execution_time
+        self.best_wall_time      = best_wall_time
+        self.total_wall_time     = 0.0
+        return self.max_runs() > 0
+
+    def adaptive(self):
+        return config.Arguments.adaptive_runs and self.runs is None
+
+    def max_runs(self):
+        if self.runs is not None:
+            return self.runs
+        if config.Arguments.adaptive_runs:
+            return config.Arguments.max_runs
+        return config.Arguments.runs
+
+    def run_finished(self, returncode, stdout, elapsed):
+        """Account for one run of the binary. Returns True if it should be run again"""
+        self.num_runs += 1
+        if returncode:
+            self.run_status = enums.Status.failed
+            debug.warning_message("FAILED: '%s'" % config.Arguments.run_cmd)
+            return False
+        self.total_wall_time += elapsed
+        sample = 0.0
+        if config.Arguments.execution_time_from_binary:
+            if not stdout:
+                raise internal_exceptions.BinaryRunException("Expected the binary to dump its execution time. Found nothing")
+            self.update_kernel_times(stdout)
+            time_regex    = re.compile(self.time_regex_string)
+            nmatchedlines = 0
+            for line in stdout.split(os.linesep):
+                line    = line.strip()
+                matches = time_regex.findall(line)
+                if matches:
+                    nmatchedlines += 1
+                    try:
+                        sample += float(matches[0])
+                    except:
+                        raise internal_exceptions.BinaryRunException("Execution time '%s' is not in the required format" % matches[0])
+            if nmatchedlines == 0:
+                raise internal_exceptions.BinaryRunException("Regular expression did not match anything on the program's output")
+        else:
+            sample = elapsed
 
-            num_actual_runs +=1
-            per_var = 1 + config.Arguments.max_exec_time_var/100
-            time = per_var  * best_execution_time
-            if total_time > time * num_actual_runs:
-                #print "Execution time of cur test case is worst than the best so far, stopping at first run" 
-                break
+        self.samples.append(sample)
+        self.total_time      += sample
+        self.num_actual_runs +=1
+        if self.num_runs >= self.max_runs():
+            return False
+        if self.adaptive():
+            return self.needs_more_runs()
+        per_var = 1 + config.Arguments.max_exec_time_var/100.0
+        time = per_var  * self.best_execution_time
+        if self.total_time > time * self.num_actual_runs:
+            #print "Execution time of cur test case is worst than the best so far, stopping at first run" 
+            return False
+        return True
 
-        self.status = status
-        config.time_binary += total_time
-        if num_actual_runs != 0:
-            self.execution_time = total_time/num_actual_runs
+    def reference_wall_time(self):
+        """The wall time of a run of the best configuration so far. Without
+        --execution-time-from-binary that is the best execution time itself"""
+        if not config.Arguments.execution_time_from_binary:
+            return self.best_execution_time
+        return self.best_wall_time
+
+    def run_deadline(self):
+        """How many seconds the next run may take before it is cut short as
+        slower than the best configuration so far"""
+        reference = self.reference_wall_time()
+        if config.Arguments.kill_slower_runs is None or reference is None:
+            return float("inf")
+        return reference * (1 + config.Arguments.kill_slower_runs/100.0)
+
+    def cut_short(self, elapsed):
+        """Account for a run killed after elapsed seconds as slower than the best
+        so far. The run counts as a sample with a lower bound on its time,
+        scaled from wall time to the units of the execution time"""
+        sample = self.best_execution_time * elapsed / self.reference_wall_time()
+        self.samples.append(sample)
+        self.total_time      += sample
+        self.num_runs        += 1
+        self.num_actual_runs += 1
+        self.run_status       = enums.Status.censored
+        config.num_cut_short += 1
+        debug.verbose_message("Individual %d: run cut short after %f seconds as slower than the best so far" \
+                              % (self.ID, elapsed), __name__)
+
+    def needs_more_runs(self):
+        """Decide from the samples so far whether the binary should be run again.
+        It should not if it is significantly slower than the best so far, or if
+        the confidence interval is already narrow enough"""
+        estimate = measurement.Estimate(self.samples, config.Arguments.statistic, config.Arguments.confidence)
+        if estimate.low > self.best_execution_time:
+            debug.verbose_message("Individual %d: significantly slower than the best so far after %d runs" \
+                                  % (self.ID, self.num_actual_runs), __name__)
+            return False
+        if self.num_actual_runs < config.Arguments.min_runs:
+            return True
+        return estimate.relative_width() > config.Arguments.ci_width
+
+    def end_runs(self):
+        self.status = self.run_status
+        config.time_binary += self.total_time
+        if self.num_actual_runs != 0 and self.adaptive():
+            self.execution_time = measurement.Estimate(self.samples, config.Arguments.statistic, config.Arguments.confidence).value
+            debug.verbose_message("Individual %d: %s of %d runs = %f" \
+                                  % (self.ID, config.Arguments.statistic, self.num_actual_runs, self.execution_time), __name__)
+        elif self.num_actual_runs != 0:
+            self.execution_time = self.total_time/self.num_actual_runs
         else:
-            self.execution_time = total_time
+            self.execution_time = self.total_time
+        if self.status == enums.Status.passed and self.num_actual_runs != 0:
+            self.wall_time = self.total_wall_time/self.num_actual_runs
+        if self.artifact_key and self.status == enums.Status.passed:
+            artifact_cache.cache.record(self.artifact_key, self.execution_time)
 
         self.deleteFile(self.file_name()+'.exe')
         self.deleteFile(self.file_name()+'_host.c')
@@ -312,26 +703,33 @@ class Individual:
         self.deleteFile(self.file_name()+'_host_kernel.hu')
         self.deleteFile(self.file_name()+'_host_kernel.h')
         self.deleteFile(self.file_name())
-
- 
-    def run_with_timeout(self, timeout=2):
-        print "executing task " + str(self.ID)
-        timeout = config.Arguments.timeout_ppcg
-        try:
-            thread = threading.Thread(target=self.binary)
-            thread.start()
-            thread.join(timeout)
-            if thread.is_alive():
-                print("Timeout: terminating the procs")
-                self.proc.terminate()
-                thread.join()
+        self.clean_workspace()
+
+    def binary(self, best_execution_time=float("inf"), best_wall_time=None):
+        # Without the event loop there is only ever one binary running, so the
+        # first lane is always free
+        lane      = run_lanes.lanes[0]
+        run_again = self.begin_runs(best_execution_time, best_wall_time)
+        while run_again:
+            run_cmd = lane.command(self.run_command())
+            debug.verbose_message("Run #%d of '%s'" % (self.num_runs+1, run_cmd), __name__)
+            deadline = self.run_deadline()
+            returncode, stdout, elapsed = processes.run(run_cmd, processes.RUN, min(deadline, config.Arguments.run_timeout),
+                                                        capture="stdout", env=self.environment(lane))
+            if returncode is None and deadline < config.Arguments.run_timeout:
+                self.cut_short(elapsed)
+                break
+            if returncode is None or processes.exceeded_cpu_limit(returncode):
+                if returncode is None:
+                    debug.warning_message("Individual %d: run timed out after %s seconds" % (self.ID, config.Arguments.run_timeout))
+                else:
+                    debug.warning_message("Individual %d: run exceeded the CPU limit of %s seconds" % (self.ID, config.Arguments.cpu_limit))
+                self.end_runs()
                 self.status = enums.Status.timeout
-        except:
-            print("Exception running"+str(self.ID))
-            self.status = enums.Status.timeout
+                return
+            run_again = self.run_finished(returncode, stdout, elapsed)
+        self.end_runs()
 
-        return
-        
                
     def __str__(self):
         return "ID %4d: execution time = %3f, ppcg = %s, status = %s" % (self.ID, self.execution_time, self.ppcg_cmd_line_flags, self.status)
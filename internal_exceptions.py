@@ -14,4 +14,7 @@ class FailedCompilationException(Exception):
     pass
 
 class BinaryRunException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class StageTimeoutException(Exception):
+    pass
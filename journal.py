@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import random
+import hashlib
+import collections
+import config
+import debug
+import evaluation_cache
+
+# The journal of the current search, or None unless the user asked for one
+journal = None
+
+def open_journal(file_name, resume):
+    global journal
+    journal = Journal(file_name, resume)
+    return journal
+
+def evaluation_key(individual):
+    """Unlike the keys of the evaluation cache, journal keys do not depend on the
+    machine so that a search can be resumed on another node of a cluster"""
+    canonical = [individual.kernel_num,
+                 evaluation_cache.canonical_flags(individual.ppcg_flags),
+                 evaluation_cache.canonical_flags(individual.cc_flags),
+                 evaluation_cache.canonical_flags(individual.cxx_flags),
+                 evaluation_cache.canonical_flags(individual.nvcc_flags)]
+    return hashlib.sha1(json.dumps(canonical)).hexdigest()
+
+def random_state_digest():
+    return hashlib.sha1(repr(random.getstate())).hexdigest()[:16]
+
+class Journal:
+    """An append-only log of every evaluation and every state transition of a
+    search. Searches are deterministic given the seed of the random number
+    generator and the measurements, so a search is resumed by running it again
+    from the start with the journalled seed while serving the journalled
+    measurements instead of evaluating them. Once the journal is exhausted the
+    search carries on live, appending to the same journal"""
+
+    def __init__(self, file_name, resume):
+        self.file_name   = file_name
+        self.seed        = None
+        self.evaluations = collections.defaultdict(collections.deque)
+        self.states      = collections.deque()
+        self.diverged    = False
+        if resume and os.path.exists(file_name):
+            self.load()
+            self.stream = open(file_name, 'a')
+        else:
+            self.stream = open(file_name, 'w')
+
+    def load(self):
+        with open(self.file_name, 'r') as journal_file:
+            lines = journal_file.readlines()
+        for line_number, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash can leave the last record half written
+                if line_number == len(lines) - 1:
+                    debug.warning_message("Ignoring the incomplete last record of journal '%s'" % self.file_name)
+                    self.truncate(sum(len(earlier) for earlier in lines[:line_number]))
+                    break
+                raise
+            if record["type"] == "start":
+                self.seed = record["seed"]
+            elif record["type"] == "evaluation":
+                self.evaluations[record["key"]].append(record)
+            elif record["type"] == "state":
+                self.states.append(record)
+        debug.verbose_message("Replaying %d evaluations and %d state transitions from '%s'" \
+                              % (sum(len(records) for records in self.evaluations.itervalues()), len(self.states), self.file_name), __name__)
+
+    def truncate(self, size):
+        with open(self.file_name, 'r+') as journal_file:
+            journal_file.truncate(size)
+
+    def append(self, record):
+        self.stream.write(json.dumps(record) + "\n")
+        self.stream.flush()
+        os.fsync(self.stream.fileno())
+
+    def start(self, seed):
+        """Returns the seed for the random number generator: the journalled seed
+        when resuming, otherwise the given one or a fresh one"""
+        if self.seed is not None:
+            if seed is not None and seed != self.seed:
+                debug.warning_message("Resuming with the journalled seed %d rather than %d" % (self.seed, seed))
+            return self.seed
+        if seed is None:
+            seed = random.SystemRandom().randint(0, sys.maxint)
+        self.seed = seed
+        self.append({"type": "start", "seed": seed, "arguments": sys.argv[1:]})
+        return seed
+
+    def replay(self, individual):
+        """Restore the measurement of an individual from the journal. Returns
+        False if the journal holds no more measurements of its configuration"""
+        records = self.evaluations.get(evaluation_key(individual))
+        if not records:
+            return False
+        record = records.popleft()
+        individual.restore_measurement(evaluation_cache.CachedResult(record["status"],
+                                                                     record["execution_time"],
+                                                                     record["per_kernel_time"],
+                                                                     record["ppcg_flags"],
+                                                                     record["samples"]))
+        individual.artifact_key = record["artifact_key"]
+        config.num_replayed += 1
+        return True
+
+    def record_evaluation(self, individual):
+        self.append({"type":            "evaluation",
+                     "key":             evaluation_key(individual),
+                     "id":              individual.ID,
+                     "status":          individual.status,
+                     "execution_time":  individual.execution_time,
+                     "per_kernel_time": individual.per_kernel_time,
+                     "samples":         individual.samples,
+                     "artifact_key":    individual.artifact_key,
+                     "ppcg_flags":      individual.ppcg_cmd_line_flags})
+
+    def record_state(self, strategy, **state):
+        """Journal a state transition of a search strategy. While resuming, check
+        it against the journalled transition instead, since a mismatch means
+        the search is no longer retracing its steps"""
+        record = collections.OrderedDict([("type", "state"), ("strategy", strategy)])
+        record.update(sorted(state.items()))
+        record["random"] = random_state_digest()
+        if self.states:
+            expected = self.states.popleft()
+            if expected != json.loads(json.dumps(record)) and not self.diverged:
+                self.diverged = True
+                debug.warning_message("The search has diverged from journal '%s' (expected %s, reached %s); "
+                                      "journalled measurements are still reused but the search will not retrace its steps" \
+                                      % (self.file_name, json.dumps(expected), json.dumps(record)))
+            return
+        self.append(record)
+
+    def close(self):
+        self.stream.close()
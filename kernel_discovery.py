@@ -0,0 +1,162 @@
+import os
+import json
+import hashlib
+import collections
+import config
+import debug
+import compiler_flags
+import evaluation_cache
+import individual
+import processes
+import run_lanes
+
+# The kernels that PPCG generates when left to its defaults, mapped to the
+# tile, block and grid sizes it chooses for them, or None unless discovered
+kernel_sizes = None
+
+# The kernels to tune and the dimensions of tile, block and grid sizes given
+# on the command line, each None if left to discovery
+given_kernels    = None
+given_dimensions = (None, None, None)
+
+# The default configuration, once measured
+baseline = None
+
+DEFAULT_DIMENSIONS = 3
+
+def make_key():
+    """The key under which the discovered kernels are cached. It changes when
+    the PPCG command or any file it names changes"""
+    canonical = [config.Arguments.target, config.Arguments.ppcg_cmd]
+    for word in config.Arguments.ppcg_cmd.split():
+        if os.path.isfile(word):
+            canonical.append([word, os.path.getmtime(word)])
+    return hashlib.sha1(json.dumps(canonical)).hexdigest()
+
+def encode(sizes):
+    return json.dumps([[kernel, list(size_tuple.tile_size), list(size_tuple.block_size), list(size_tuple.grid_size)]
+                       for kernel, size_tuple in sizes.iteritems()])
+
+def decode(string):
+    sizes = collections.OrderedDict()
+    for kernel, tile_size, block_size, grid_size in json.loads(string):
+        sizes[kernel] = compiler_flags.SizeTuple(tuple(tile_size), tuple(block_size), tuple(grid_size))
+    return sizes
+
+def run_PPCG():
+    """Run PPCG with its defaults and parse the sizes it dumps. Returns None if
+    it fails or dumps nothing"""
+    testcase = individual.Individual()
+    try:
+        cmd  = testcase.ppcg_command()
+        debug.verbose_message("Discovering kernels with '%s'" % cmd, __name__)
+        returncode, stderr, _ = processes.run(run_lanes.compile_command(cmd), processes.PPCG, config.Arguments.ppcg_timeout,
+                                              capture="stderr", env=testcase.environment())
+        if returncode is None:
+            debug.warning_message("PPCG timed out with its default options, so no kernels were discovered")
+            return None
+        if returncode:
+            debug.warning_message("PPCG failed with its default options, so no kernels were discovered")
+            return None
+        try:
+            parsed = compiler_flags.SizesFlag.parse_PPCG_dump_sizes(stderr)
+        except AssertionError:
+            parsed = None
+        if not parsed:
+            debug.warning_message("PPCG did not dump any kernel sizes, so no kernels were discovered")
+            return None
+    finally:
+        testcase.clean_workspace()
+    sizes = collections.OrderedDict()
+    for kernel in sorted(parsed.keys(), key=int):
+        sizes[int(kernel)] = parsed[kernel]
+    return sizes
+
+def discover():
+    """Find the kernels and their default sizes, from the evaluation cache if
+    PPCG has already been asked about the same input"""
+    global kernel_sizes
+    key    = make_key()
+    cached = evaluation_cache.cache.lookup_kernel_sizes(key)
+    if cached is not None:
+        kernel_sizes = decode(cached)
+        debug.verbose_message("Kernels retrieved from the cache", __name__)
+    else:
+        kernel_sizes = run_PPCG()
+        if kernel_sizes is not None:
+            evaluation_cache.cache.store_kernel_sizes(key, encode(kernel_sizes))
+    if kernel_sizes is not None:
+        for kernel, size_tuple in kernel_sizes.iteritems():
+            debug.verbose_message("Kernel %d: default sizes %s" % (kernel, size_tuple), __name__)
+    return kernel_sizes
+
+def remember_given_options():
+    global given_kernels, given_dimensions
+    given_kernels    = config.Arguments.kernels_to_tune
+    given_dimensions = (config.Arguments.tile_dimensions,
+                        config.Arguments.block_dimensions,
+                        config.Arguments.grid_dimensions)
+
+def apply_defaults():
+    """Fill in the options that discovery decides unless the user gave them:
+    the kernels to tune and the largest dimensions of the sizes. Until kernels
+    are discovered, all kernels are tuned alike"""
+    if given_kernels is not None:
+        config.Arguments.kernels_to_tune = given_kernels
+    elif kernel_sizes:
+        config.Arguments.kernels_to_tune = kernel_sizes.keys()
+    else:
+        config.Arguments.kernels_to_tune = [compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL]
+    tile_dimensions, block_dimensions, grid_dimensions = dimensions(compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL)
+    config.Arguments.tile_dimensions  = tile_dimensions
+    config.Arguments.block_dimensions = block_dimensions
+    config.Arguments.grid_dimensions  = grid_dimensions
+
+def dimensions(kernel_num):
+    """The number of dimensions of the tile, block and grid sizes of a kernel,
+    or the largest over all kernels for the sentinel"""
+    if kernel_sizes and kernel_num in kernel_sizes:
+        size_tuples = [kernel_sizes[kernel_num]]
+    elif kernel_sizes:
+        size_tuples = kernel_sizes.values()
+    else:
+        size_tuples = []
+    discovered = [max([len(size_tuple.tile_size) for size_tuple in size_tuples] or [DEFAULT_DIMENSIONS]),
+                  max([len(size_tuple.block_size) for size_tuple in size_tuples] or [DEFAULT_DIMENSIONS]),
+                  max([len(size_tuple.grid_size) for size_tuple in size_tuples] or [DEFAULT_DIMENSIONS])]
+    return tuple(given if given is not None else found for given, found in zip(given_dimensions, discovered))
+
+def per_kernel_sizes(value):
+    """Turn a value of --sizes into one that lists every discovered kernel.
+    Kernels without sizes of their own take those given for all kernels, or
+    else PPCG's defaults"""
+    sizes = collections.OrderedDict()
+    for kernel, default_sizes in kernel_sizes.iteritems():
+        if kernel in value:
+            sizes[kernel] = value[kernel]
+        elif compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL in value:
+            sizes[kernel] = value[compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL]
+        else:
+            sizes[kernel] = default_sizes
+    return sizes
+
+def create_baseline():
+    """The configuration in which every kernel has PPCG's default sizes"""
+    testcase = individual.Individual()
+    testcase.ppcg_flags[compiler_flags.PPCG.flag_map[compiler_flags.PPCG.sizes]] = collections.OrderedDict(kernel_sizes)
+    return testcase
+
+def measure_baseline():
+    global baseline
+    debug.verbose_message("Measuring the default configuration", __name__)
+    baseline = create_baseline()
+    baseline.run(float("inf"))
+    return baseline
+
+def summarise():
+    if baseline is not None:
+        print("%s Summary of kernel discovery %s" % ('*' * 30, '*' * 30))
+        for kernel, size_tuple in kernel_sizes.iteritems():
+            print("Kernel %d: default sizes %s" % (kernel, size_tuple))
+        print("The default configuration had execution time %f (status %s)" % (baseline.execution_time, baseline.status))
+        print
@@ -1,11 +1,23 @@
 #!/usr/bin/env python 
 
 import re
+import random
 import argparse
 import config
 import enums
+import debug
 import compiler_flags
 import heuristic_search
+import evaluation_cache
+import artifact_cache
+import run_lanes
+import processes
+import measurement
+import journal
+import cost_model
+import kernel_discovery
+import constraints
+import space_spec
 import sys
 
 def print_summary(search):
@@ -32,14 +44,29 @@ def autotune():
         search = heuristic_search.Exhaustive()
     elif config.Arguments.autotune_subcommand == enums.SearchStrategy.simulated_annealing:
         search = heuristic_search.SimulatedAnnealing()
+    elif config.Arguments.autotune_subcommand == enums.SearchStrategy.bayesian:
+        # Only this search needs NumPy, so it is not a hard dependency
+        try:
+            import bayesian
+        except ImportError:
+            sys.exit("The %s search requires NumPy" % enums.SearchStrategy.bayesian)
+        search = bayesian.Bayesian()
     else:
         assert False, "Unknown testing strategy %s" % config.Arguments.autotune_subcommand
     try:
+        if kernel_discovery.kernel_sizes:
+            kernel_discovery.measure_baseline()
         search.run()
     except KeyboardInterrupt:
         pass
     finally:
         print_summary(search)
+        config.summarise_timing()
+        kernel_discovery.summarise()
+        if constraints.checker:
+            constraints.checker.summarise()
+        if cost_model.model:
+            cost_model.model.summarise()
 
 def setup_PPCG_flags():
     # We have to add some of the PPCG optimisation flags on the fly as they
@@ -71,6 +98,7 @@ def setup_PPCG_flags():
                 compiler_flags.PPCG.optimisation_flags.remove(compiler_flags.PPCG.flag_map[flag_name])
             else:
                 raise argparse.ArgumentTypeError("PPCG flag '%s' not recognised" % flag_name)
+    compiler_flags.open_registry()
     
 def the_command_line():    
     class ISLAction(argparse.Action):
@@ -100,6 +128,22 @@ def the_command_line():
     def string_csv(string):
         return string.split(',')
     
+    def shard(string):
+        match = re.match(r'(\d+)/(\d+)$', string)
+        if not match:
+            raise argparse.ArgumentTypeError("'%s' is not a shard. Expected something like '0/4'" % string)
+        index = int(match.group(1))
+        count = int(match.group(2))
+        if index >= count:
+            raise argparse.ArgumentTypeError("Shard index %d must be less than the number of shards %d" % (index, count))
+        return (index, count)
+    
+    def run_lane(string):
+        try:
+            return run_lanes.parse_lane(string)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    
     # The command-line parser and its options
     parser = argparse.ArgumentParser(description="Auto-tuning framework for CARP", fromfile_prefix_chars='@')
     
@@ -115,6 +159,22 @@ def the_command_line():
                         help="log results of the search to this file",
                         default=None)
     
+    parser.add_argument("--seed",
+                        type=int,
+                        metavar="<int>",
+                        help="seed the random number generator so that the search can be repeated",
+                        default=None)
+    
+    parser.add_argument("--journal",
+                        metavar="<FILE>",
+                        help="log every evaluation and every step of the search to this file as it happens, so that the search can be resumed after a crash",
+                        default=None)
+    
+    parser.add_argument("--resume",
+                        action="store_true",
+                        help="resume the search logged in the journal: it is run again from the start with the same seed, but journalled measurements are reused rather than evaluated again",
+                        default=False)
+    
     # Building the application options
     building_and_running_group = parser.add_argument_group("Arguments for how to compile application and run executable") 
     
@@ -141,9 +201,33 @@ def the_command_line():
                                             default="")
 
     
+    building_and_running_group.add_argument("--evaluation-cache",
+                                            metavar="<FILE>",
+                                            help="remember measured configurations in this SQLite database across runs of the auto-tuner (by default they are only remembered in memory)",
+                                            default=None)
+
+    building_and_running_group.add_argument("--artifact-cache",
+                                            metavar="<DIR>",
+                                            help="keep built executables in this directory, addressed by the code PPCG generated and the build command, and never build the same code twice",
+                                            default=None)
+    
+    artifact_cache_size = 1024
+    building_and_running_group.add_argument("--artifact-cache-size",
+                                            type=int,
+                                            metavar="<int>",
+                                            help="evict the least recently used executables once the artifact cache exceeds this many megabytes (default: %d)" % artifact_cache_size,
+                                            default=artifact_cache_size)
+    
+    keep_best_binaries = 5
+    building_and_running_group.add_argument("--keep-best-binaries",
+                                            type=int,
+                                            metavar="<int>",
+                                            help="never evict the executables of this many of the fastest configurations from the artifact cache (default: %d)" % keep_best_binaries,
+                                            default=keep_best_binaries)
+
     building_and_running_group.add_argument("--cmd-string-complete",
                                             action="store_true",
-                                            help="dont modify the cmd string, note the output file nmaes should be part of cmd lines",
+                                            help="dont modify the cmd string, note the output file nmaes should be part of cmd lines. Every command runs in the directory the autotuner was started from, which concurrent evaluations share, so the commands must write their files under $AUTOTUNER_WORKSPACE, e.g. to $AUTOTUNER_FILE_NAME, to not overwrite each other",
                                             default=False)
 
     runs = 1
@@ -153,6 +237,129 @@ def the_command_line():
                                             help="number of times to run the compiled executable for purposes of timing (default: %d)" % runs,
                                             default=runs)
     
+    building_and_running_group.add_argument("--adaptive-runs",
+                                            action="store_true",
+                                            help="run each executable until the confidence interval of its execution time is narrow enough, instead of a fixed number of times. Runs stop early once an executable is significantly slower than the best so far",
+                                            default=False)
+    
+    min_runs = 3
+    building_and_running_group.add_argument("--min-runs",
+                                            type=int,
+                                            metavar="<int>",
+                                            help="with --adaptive-runs, the least number of times to run an executable unless it is significantly slower than the best so far (default: %d)" % min_runs,
+                                            default=min_runs)
+    
+    max_runs = 30
+    building_and_running_group.add_argument("--max-runs",
+                                            type=int,
+                                            metavar="<int>",
+                                            help="with --adaptive-runs, the most number of times to run an executable (default: %d)" % max_runs,
+                                            default=max_runs)
+    
+    ci_width = 0.02
+    building_and_running_group.add_argument("--ci-width",
+                                            type=float,
+                                            metavar="<float>",
+                                            help="with --adaptive-runs, stop running an executable once the half-width of the confidence interval of its execution time falls below this fraction of the execution time (default: %.2f)" % ci_width,
+                                            default=ci_width)
+    
+    confidence = 0.95
+    building_and_running_group.add_argument("--confidence",
+                                            type=float,
+                                            choices=measurement.CONFIDENCE_LEVELS,
+                                            help="with --adaptive-runs, the confidence level of the confidence intervals (default: %.2f)" % confidence,
+                                            default=confidence)
+    
+    statistic = "median"
+    building_and_running_group.add_argument("--statistic",
+                                            choices=sorted(measurement.STATISTICS.keys()),
+                                            help="with --adaptive-runs, summarise the runs of an executable by this statistic (default: %s)" % statistic,
+                                            default=statistic)
+    
+    building_and_running_group.add_argument("--cost-model",
+                                            action="store_true",
+                                            help="skip configurations that a model of the measurements so far predicts to be much slower than the fittest, without running PPCG on them",
+                                            default=False)
+    
+    cost_model_neighbours = 5
+    building_and_running_group.add_argument("--cost-model-neighbours",
+                                            type=int,
+                                            metavar="<int>",
+                                            help="with --cost-model, predict from this many of the nearest measured configurations (default: %d)" % cost_model_neighbours,
+                                            default=cost_model_neighbours)
+    
+    cost_model_margin = 2.0
+    building_and_running_group.add_argument("--cost-model-margin",
+                                            type=float,
+                                            metavar="<float>",
+                                            help="with --cost-model, skip a configuration only if all of its nearest measured configurations took more than this many times as long as the fittest (default: %.1f)" % cost_model_margin,
+                                            default=cost_model_margin)
+    
+    cost_model_min_samples = 20
+    building_and_running_group.add_argument("--cost-model-min-samples",
+                                            type=int,
+                                            metavar="<int>",
+                                            help="with --cost-model, measure this many configurations of a kernel before skipping any (default: %d)" % cost_model_min_samples,
+                                            default=cost_model_min_samples)
+    
+    num_compile_threads = 1
+    building_and_running_group.add_argument("--num-compile-threads",
+                                            type=int,
+                                            metavar="<int>",
+                                            default=num_compile_threads,
+                                            help="number of PPCG and build processes to run concurrently while binaries are timed one at a time (default: %d)" % num_compile_threads)
+    
+    building_and_running_group.add_argument("--run-lane",
+                                            type=run_lane,
+                                            action="append",
+                                            dest="run_lanes",
+                                            metavar="<SPEC>",
+                                            help="time generated binaries in a lane with exclusive resources, given as comma-separated fields 'cores=<LIST>' (e.g. 2+3 or 4-7, pinned with taskset), 'numa=<int>' (bound with numactl) and 'device=<STRING>' (exported as AUTOTUNER_DEVICE and, for CUDA, CUDA_VISIBLE_DEVICES). Repeat to time several binaries at once. PPCG and builds are confined to the cores which no lane claims (default: a single lane which pins nothing)",
+                                            default=None)
+    
+    building_and_running_group.add_argument("--ppcg-timeout",
+                                            type=float,
+                                            metavar="<float>",
+                                            help="kill PPCG if it runs for longer than this many seconds (default: no timeout)",
+                                            default=float("inf"))
+    
+    building_and_running_group.add_argument("--build-timeout",
+                                            type=float,
+                                            metavar="<float>",
+                                            help="kill the build command if it runs for longer than this many seconds (default: no timeout)",
+                                            default=float("inf"))
+    
+    building_and_running_group.add_argument("--run-timeout",
+                                            type=float,
+                                            metavar="<float>",
+                                            help="kill a run of the generated binary if it runs for longer than this many seconds (default: no timeout)",
+                                            default=float("inf"))
+    
+    building_and_running_group.add_argument("--memory-limit",
+                                            type=int,
+                                            metavar="<int>",
+                                            help="limit the address space of PPCG and the build command to this many megabytes. Binaries are not limited since GPU runtimes map far more memory than they use (default: no limit)",
+                                            default=None)
+    
+    building_and_running_group.add_argument("--cpu-limit",
+                                            type=int,
+                                            metavar="<int>",
+                                            help="kill PPCG, the build command or a run of the generated binary once it has used this many seconds of CPU time, which is recorded as a timeout (default: no limit)",
+                                            default=None)
+    
+    building_and_running_group.add_argument("--kill-slower-runs",
+                                            type=float,
+                                            metavar="<float>",
+                                            help="kill a run of the generated binary once it has taken this many percent longer than a run of the best configuration so far. Its execution time is recorded as a lower bound with status '%s', which still ranks it below the best (default: runs are never cut short)" % enums.Status.censored,
+                                            default=None)
+    
+    max_exec_time_var = 20 
+    building_and_running_group.add_argument("--max-exec-time-var",
+                                            type=int,
+                                            metavar="<int>",
+                                            default=max_exec_time_var,
+                                            help="max allowed variance for execution time. If the execution time of a test case is greater that best so far + max-exec-time-var then number of runs is restricted to 1 (default: %d )" % max_exec_time_var)
+    
     building_and_running_group.add_argument("--execution-time-from-binary",
                                             action="store_true",
                                             help="assume that the binary prints its execution time to standard output (rather than measuring the execution time through Python)",
@@ -164,6 +371,12 @@ def the_command_line():
                                             required=False,
                                             default="")
     
+    workspace_dir = ".autotuner-workspaces"
+    building_and_running_group.add_argument("--workspace-dir",
+                                            metavar="<DIR>",
+                                            help="create a private scratch directory for each evaluation under this directory (default: %s). Its path is exported to the PPCG, build and run commands as AUTOTUNER_WORKSPACE. The commands still run in the current directory so that relative input files are found" % workspace_dir,
+                                            default=workspace_dir)
+    
     building_and_running_group.add_argument("--execution-time-regex",
                             type=str,
                             help="regular expression format for execution time",
@@ -204,12 +417,16 @@ def the_command_line():
                             help="consider only these values when tuning the shared memory size (default: %s)" % (shared_memory_possibilties),
                             default=shared_memory_possibilties)
      
-    kernels_list = [compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL]
+    ppcg_group.add_argument("--discover-kernels",
+                            action="store_true",
+                            help="run PPCG once with its default options to find the kernels and the sizes it chooses for them. These become the default kernels to tune and dimensions of the sizes, let the genetic algorithm tune the sizes of each kernel, and form a baseline configuration which is measured first",
+                            default=False)
+    
     ppcg_group.add_argument("--kernels-to-tune",
                             type=int_csv,
                             metavar="<LIST>",
-                            help="consider only these kernels values when tuning (default: all)",
-                            default=kernels_list)
+                            help="consider only these kernels values when tuning (default: the discovered kernels with --discover-kernels, otherwise all kernels alike)",
+                            default=None)
     
     tile_size_range = (2**0, 2**6)
     ppcg_group.add_argument("--tile-size-range",
@@ -218,12 +435,11 @@ def the_command_line():
                             help="consider only values in this range when tuning the tile size (default: %d-%d)" % (tile_size_range[0], tile_size_range[1]),
                             default=tile_size_range)
     
-    tile_dimensions = 3
     ppcg_group.add_argument("--tile-dimensions",
                             type=int,
                             metavar="<int>",
-                            help="consider only tile dimensions of this size (default: %d)" % tile_dimensions,
-                            default=tile_dimensions)
+                            help="consider only tile dimensions of this size (default: as discovered with --discover-kernels, otherwise %d)" % kernel_discovery.DEFAULT_DIMENSIONS,
+                            default=None)
     
     tile_size_product_bound = sys.maxint
     ppcg_group.add_argument("--tile-size-product-bound",
@@ -232,6 +448,12 @@ def the_command_line():
                             help="bound the per-dimension product of tile sizes by this value (default: %d)" % tile_size_product_bound,
                             default=tile_size_product_bound)
     
+    tile_size_ladder = enums.SizeLadder.linear
+    ppcg_group.add_argument("--tile-size-ladder",
+                            choices=[enums.SizeLadder.linear, enums.SizeLadder.powers_of_two, enums.SizeLadder.warp_multiples],
+                            help="the values that each dimension of the tile size may take within its range: every integer, powers of two, or multiples of the warp size (default: %s)" % tile_size_ladder,
+                            default=tile_size_ladder)
+    
     block_size_range = (2**0, 2**10)
     ppcg_group.add_argument("--block-size-range",
                             type=parse_int_range,
@@ -239,12 +461,11 @@ def the_command_line():
                             help="consider only values in this range when tuning the block size (default: %d-%d)" % (block_size_range[0], block_size_range[1]),
                             default=block_size_range)
     
-    block_dimensions = 3
     ppcg_group.add_argument("--block-dimensions",
                             type=int,
                             metavar="<int>",
-                            help="consider only block dimensions of this size (default: %d)" % block_dimensions,
-                            default=block_dimensions)
+                            help="consider only block dimensions of this size (default: as discovered with --discover-kernels, otherwise %d)" % kernel_discovery.DEFAULT_DIMENSIONS,
+                            default=None)
     
     block_size_product_bound = sys.maxint
     ppcg_group.add_argument("--block-size-product-bound",
@@ -253,6 +474,12 @@ def the_command_line():
                             help="bound the per-dimension product of block sizes by this value (default: %d)" % block_size_product_bound,
                             default=block_size_product_bound)
     
+    block_size_ladder = enums.SizeLadder.linear
+    ppcg_group.add_argument("--block-size-ladder",
+                            choices=[enums.SizeLadder.linear, enums.SizeLadder.powers_of_two, enums.SizeLadder.warp_multiples],
+                            help="the values that each dimension of the block size may take within its range: every integer, powers of two, or multiples of the warp size (default: %s)" % block_size_ladder,
+                            default=block_size_ladder)
+    
     grid_size_range = (2**0, 2**15)
     ppcg_group.add_argument("--grid-size-range",
                             type=parse_int_range,
@@ -260,12 +487,11 @@ def the_command_line():
                             help="consider only values in this range when tuning the grid size (default: %d-%d)" % (grid_size_range[0], grid_size_range[1]),
                             default=grid_size_range)
     
-    grid_dimensions = 3
     ppcg_group.add_argument("--grid-dimensions",
                             type=int,
                             metavar="<int>",
-                            help="consider only grid dimensions of this size (default: %d)" % grid_dimensions,
-                            default=grid_dimensions)
+                            help="consider only grid dimensions of this size (default: as discovered with --discover-kernels, otherwise %d)" % kernel_discovery.DEFAULT_DIMENSIONS,
+                            default=None)
     
     grid_size_product_bound = sys.maxint
     ppcg_group.add_argument("--grid-size-product-bound",
@@ -274,6 +500,25 @@ def the_command_line():
                             help="bound the per-dimension product of grid sizes by this value (default: %d)" % grid_size_product_bound,
                             default=grid_size_product_bound)
     
+    grid_size_ladder = enums.SizeLadder.linear
+    ppcg_group.add_argument("--grid-size-ladder",
+                            choices=[enums.SizeLadder.linear, enums.SizeLadder.powers_of_two, enums.SizeLadder.warp_multiples],
+                            help="the values that each dimension of the grid size may take within its range: every integer, powers of two, or multiples of the warp size (default: %s)" % grid_size_ladder,
+                            default=grid_size_ladder)
+    
+    size_distribution = enums.SizeDistribution.uniform
+    ppcg_group.add_argument("--size-distribution",
+                            choices=[enums.SizeDistribution.uniform, enums.SizeDistribution.log_uniform],
+                            help="how random sizes are drawn from their ladders. Log-uniform draws favour small values as much as large ones whatever the width of the range (default: %s)" % size_distribution,
+                            default=size_distribution)
+    
+    warp_size = 32
+    ppcg_group.add_argument("--warp-size",
+                            type=int,
+                            metavar="<int>",
+                            help="the size of the ladder steps of multiples of the warp size (default: %d)" % warp_size,
+                            default=warp_size)
+    
     ppcg_group.add_argument("--no-tune-kernel-sizes",
                             action="store_true",
                             help="do not tune kernel sizes individually, i.e. use a uniform tile size for all kernels and let PPCG decide on suitable block and grid sizes",
@@ -294,6 +539,45 @@ def the_command_line():
                             metavar="",
                             help="use all ISL options available. (Performance is likely to be very slow)")
     
+    constraints_group = parser.add_argument_group("Constraints which configurations must satisfy. Every search rejects configurations that break them before compiling anything, and the generated configurations of the genetic algorithm, random search and simulated annealing are redrawn until they satisfy them where possible")
+    
+    constraints_group.add_argument("--size-constraints",
+                                   action="store_true",
+                                   help="constrain the sizes of every kernel by the rules of the exhaustive search's --filter-testcases: the work group size within bounds, tile sizes multiples of block sizes, and the tile/block ratio bounded",
+                                   default=False)
+    
+    max_tile_block_ratio = 36
+    constraints_group.add_argument("--max-tile-block-ratio",
+                                   type=int,
+                                   metavar="<int>",
+                                   default=max_tile_block_ratio,
+                                   help="test cases in which the product over all dimensions of tile size divided by block size exceeds this value will be filtered out (default: %d)" % max_tile_block_ratio)
+    
+    max_work_group_size = 1024
+    constraints_group.add_argument("--max-work-group-size",
+                                   type=int,
+                                   metavar="<int>",
+                                   default=max_work_group_size,
+                                   help="max work group size, test cases with work group size greater than this value will be filtered out (default: %d)" % max_work_group_size)
+    
+    min_work_group_size = 1 
+    constraints_group.add_argument("--min-work-group-size",
+                                   type=int,
+                                   metavar="<int>",
+                                   default=min_work_group_size,
+                                   help="min work group size, test cases with work group size lesser than this value will be filtered out (default: %d)" % min_work_group_size)
+    
+    constraints_group.add_argument("--constraint",
+                                   action="append",
+                                   metavar="<EXPR>",
+                                   help="a Python expression which every configuration must satisfy, over the sizes of each kernel as the tuples tile, block and grid, its number kernel, and the flags, named like no_shared_memory for --no-shared-memory and None when not set, e.g. 'product(tile) <= 4096'. May be given several times",
+                                   default=[])
+    
+    constraints_group.add_argument("--constraints-file",
+                                   metavar="<FILE>",
+                                   help="read further constraints from this file, one expression per line. Blank lines and lines starting with # are ignored",
+                                   default=None)
+    
     search_subparsers = parser.add_subparsers(dest="autotune_subcommand",
                                               description="test generation subcommands")
         
@@ -386,6 +670,36 @@ def the_command_line():
                                help="the number of random tests to generate (default: %d)" % randoms)
     
     
+    # Create the parser for the sub-command 'bayesian'
+    parser_bayesian = search_subparsers.add_parser(enums.SearchStrategy.bayesian)
+    
+    evaluations = 50
+    parser_bayesian.add_argument("--evaluations",
+                                 type=int,
+                                 metavar="<int>",
+                                 default=evaluations,
+                                 help="the number of configurations to evaluate (default: %d)" % evaluations)
+    
+    initial_samples = 10
+    parser_bayesian.add_argument("--initial-samples",
+                                 type=int,
+                                 metavar="<int>",
+                                 default=initial_samples,
+                                 help="the number of random configurations evaluated before the model is consulted (default: %d)" % initial_samples)
+    
+    parser_bayesian.add_argument("--batch-size",
+                                 type=int,
+                                 metavar="<int>",
+                                 default=0,
+                                 help="the number of configurations proposed at a time (default: the number of compile threads)")
+    
+    candidates = 1000
+    parser_bayesian.add_argument("--candidates",
+                                 type=int,
+                                 metavar="<int>",
+                                 default=candidates,
+                                 help="the number of random configurations from which each batch is chosen, besides neighbours of the fittest (default: %d)" % candidates)
+    
     parser_exhaustive = search_subparsers.add_parser(enums.SearchStrategy.exhaustive)
 
     parser_exhaustive.add_argument("--params-from-file",
@@ -393,6 +707,11 @@ def the_command_line():
                          help="read the paramters from the explore-params py",
                          default=False)
 
+    parser_exhaustive.add_argument("--space-spec",
+                         metavar="<FILE>",
+                         help="read the search space of each kernel from this JSON file instead: its tile, block and grid sizes as values, ranges or ladders, the PPCG and isl flags to tune, and conditions on them. See explore-space.json",
+                         default=None)
+
     parser_exhaustive.add_argument("--only-powers-of-two",
                          action="store_true",
                          help="Search for parameter values that are powers of two",
@@ -404,55 +723,149 @@ def the_command_line():
                          help="few heursitics to reduce search space such as tile size multiple of block size, tile size > block size etc..",
                          default=True)
 
+    # These are global options now, but are still accepted here so that older
+    # command lines keep working
+    for name in ["--max-tile-block-ratio", "--max-work-group-size", "--min-work-group-size"]:
+        parser_exhaustive.add_argument(name,
+                                       type=int,
+                                       metavar="<int>",
+                                       default=argparse.SUPPRESS,
+                                       help="the same as the global %s" % name)
+
     parser_exhaustive.add_argument("--parallelize-compilation",
                          action="store_true",
                          help="parallelize ppcg compilation and execution of test case",
                          default=False)
     
-    
-    num_compile_threads = 1
-    parser_exhaustive.add_argument("--num-compile-threads",
-                               type=int,
-                               metavar="<int>",
-                               default=num_compile_threads,
-                               help="number of threads to use for ppcg compilation (default: %d)" % num_compile_threads)
+    parser_exhaustive.add_argument("--decompose-kernels",
+                         action="store_true",
+                         help="tune the tile, block and grid sizes of every kernel in the same runs, crediting each kernel's time from --prl-profiling to its own sizes, then validate the composite of the best sizes of each kernel with a final run. Needs the kernels from --kernels-to-tune or --discover-kernels. Memory flags are left to PPCG's defaults",
+                         default=False)
     
     
-    max_work_group_size = 1024
-    parser_exhaustive.add_argument("--max-work-group-size",
-                               type=int,
-                               metavar="<int>",
-                               default=max_work_group_size,
-                               help="max work group size, test cases with work group size greater than this value will be filtered out (default: %d)" % max_work_group_size)
+    parser_exhaustive.add_argument("--shard",
+                         type=shard,
+                         metavar="<i/N>",
+                         help="evaluate only the i-th of N disjoint slices of the configurations (counting from 0), e.g. on each of N machines, and combine their results with merge_results.py",
+                         default=None)
     
+    parser_exhaustive.add_argument("--sample",
+                         type=int,
+                         metavar="<int>",
+                         help="evaluate only this many configurations, drawn uniformly at random without replacement",
+                         default=None)
     
+    parser_exhaustive.add_argument("--racing",
+                         action="store_true",
+                         help="race the configurations by successive halving: run each once, then repeatedly re-run the fastest ones with more runs, so that only promising configurations are measured carefully",
+                         default=False)
     
-    min_work_group_size = 1 
-    parser_exhaustive.add_argument("--min-work-group-size",
+    racing_eta = 3
+    parser_exhaustive.add_argument("--racing-eta",
                                type=int,
                                metavar="<int>",
-                               default=min_work_group_size,
-                               help="min work group size, test cases with work group size lesser than this value will be filtered out (default: %d)" % min_work_group_size)
+                               default=racing_eta,
+                               help="with --racing, keep the fastest 1/eta of the configurations after each round and give the next round eta times as many runs (default: %d)" % racing_eta)
     
-    timeout = 500
-    parser_exhaustive.add_argument("--timeout-ppcg",
+    racing_survivors = 4
+    parser_exhaustive.add_argument("--racing-survivors",
                                type=int,
                                metavar="<int>",
-                               default=timeout,
-                               help="timeout for ppcg compilation and testcase execution (default: %d sec)" % num_compile_threads)
+                               default=racing_survivors,
+                               help="with --racing, the number of configurations in the final round, which are measured with the most runs or with --adaptive-runs (default: %d)" % racing_survivors)
+    
+    parser_exhaustive.add_argument("--timeout-ppcg",
+                               type=float,
+                               metavar="<float>",
+                               default=None,
+                               help="deprecated: use --ppcg-timeout and --run-timeout, which this sets unless they are given")
     
     
-    max_exec_time_var = 20 
-    parser_exhaustive.add_argument("--max-exec-time-var",
-                               type=int,
-                               metavar="<int>",
-                               default=max_exec_time_var,
-                               help="max allowed variance for execution time. If the execution time of a test case is greater that best so far + max-exec-time-var then number of runs is restricted to 1 (default: %d )" % max_exec_time_var)
     
     parser.parse_args(namespace=config.Arguments)
+    if config.Arguments.resume and not config.Arguments.journal:
+        parser.error("--resume needs a --journal to resume from")
+    if config.Arguments.cost_model_neighbours < 1 or config.Arguments.cost_model_min_samples < 1:
+        parser.error("--cost-model-neighbours and --cost-model-min-samples must be at least 1")
+    if config.Arguments.autotune_subcommand == enums.SearchStrategy.exhaustive \
+    and config.Arguments.decompose_kernels and not config.Arguments.prl_profiling:
+        parser.error("--decompose-kernels needs the time of each kernel from --prl-profiling")
+    if config.Arguments.autotune_subcommand == enums.SearchStrategy.exhaustive \
+    and config.Arguments.space_spec and config.Arguments.params_from_file:
+        parser.error("--space-spec and --params-from-file are alternatives")
+    if getattr(config.Arguments, "timeout_ppcg", None) is not None:
+        debug.warning_message("--timeout-ppcg is deprecated; use --ppcg-timeout and --run-timeout")
+        if config.Arguments.ppcg_timeout == float("inf"):
+            config.Arguments.ppcg_timeout = config.Arguments.timeout_ppcg
+        if config.Arguments.run_timeout == float("inf"):
+            config.Arguments.run_timeout = config.Arguments.timeout_ppcg
+    if config.Arguments.kill_slower_runs is not None and config.Arguments.kill_slower_runs < 0:
+        parser.error("--kill-slower-runs must not be negative")
+    for limit in ["memory_limit", "cpu_limit"]:
+        if getattr(config.Arguments, limit) is not None:
+            if getattr(config.Arguments, limit) < 1:
+                parser.error("--%s must be at least 1" % limit.replace('_', '-'))
+            if processes.resource is None:
+                parser.error("--%s needs the resource module, which this platform lacks" % limit.replace('_', '-'))
+    if config.Arguments.warp_size < 1:
+        parser.error("--warp-size must be at least 1")
+    for part in ["tile", "block", "grid"]:
+        size_range = getattr(config.Arguments, "%s_size_range" % part)
+        ladder     = getattr(config.Arguments, "%s_size_ladder" % part)
+        if not len(compiler_flags.make_ladder(ladder, size_range, config.Arguments.warp_size)):
+            parser.error("No %s size in the range %d-%d is on the %s ladder" % (part, size_range[0], size_range[1]-1, ladder))
+    if config.Arguments.constraints_file:
+        try:
+            config.Arguments.constraint += constraints.read_expressions(config.Arguments.constraints_file)
+        except IOError as e:
+            parser.error("Cannot read --constraints-file: %s" % e)
+    for expression in config.Arguments.constraint:
+        try:
+            constraints.Expression(expression)
+        except SyntaxError as e:
+            parser.error("The constraint '%s' is not a Python expression: %s" % (expression, e))
+    # Options left out are decided once kernels have been discovered
+    kernel_discovery.remember_given_options()
+    kernel_discovery.apply_defaults()
   
 if __name__ == "__main__":
     the_command_line()
+    seed = config.Arguments.seed
+    if config.Arguments.journal:
+        seed = journal.open_journal(config.Arguments.journal, config.Arguments.resume).start(seed)
+    if seed is not None:
+        # Seed before the PPCG flags are set up as some of them draw random values
+        random.seed(seed)
+    run_lanes.setup_lanes(config.Arguments.run_lanes)
+    evaluation_cache.open_cache(config.Arguments.evaluation_cache or ":memory:")
+    if config.Arguments.artifact_cache:
+        artifact_cache.open_cache(config.Arguments.artifact_cache,
+                                  config.Arguments.artifact_cache_size * 1024 * 1024,
+                                  config.Arguments.keep_best_binaries)
+    if config.Arguments.discover_kernels:
+        kernel_discovery.discover()
+        kernel_discovery.apply_defaults()
     setup_PPCG_flags()
+    if config.Arguments.autotune_subcommand == enums.SearchStrategy.exhaustive and config.Arguments.space_spec:
+        try:
+            space_spec.open_spec(config.Arguments.space_spec)
+        except (IOError, ValueError) as e:
+            sys.exit("Cannot use --space-spec: %s" % e)
+        if space_spec.spec.unknown_variables():
+            sys.exit("The conditions of --space-spec refer to %s, which is not a flag being tuned" \
+                     % ', '.join(space_spec.spec.unknown_variables()))
+    rules = [constraints.Expression(expression) for expression in config.Arguments.constraint]
+    for rule in rules:
+        if rule.unknown_variables():
+            sys.exit("The constraint '%s' refers to %s, which is not a flag being tuned. Flags are named like no_shared_memory for --no-shared-memory" \
+                     % (rule.description, ', '.join(rule.unknown_variables())))
+    if config.Arguments.size_constraints:
+        rules = constraints.size_rules() + rules
+    if rules:
+        constraints.open_checker(rules)
+    if config.Arguments.cost_model:
+        cost_model.open_model(config.Arguments.cost_model_neighbours,
+                              config.Arguments.cost_model_margin,
+                              config.Arguments.cost_model_min_samples)
     autotune()    
         
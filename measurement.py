@@ -0,0 +1,82 @@
+import math
+
+# Two-sided critical values of Student's t-distribution, indexed by degrees of
+# freedom, for the supported confidence levels
+T_TABLE = {0.90: [6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833, 1.812,
+                  1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734, 1.729, 1.725,
+                  1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703, 1.701, 1.699, 1.697],
+           0.95: [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+                  2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+                  2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042],
+           0.99: [63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250, 3.169,
+                  3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878, 2.861, 2.845,
+                  2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771, 2.763, 2.756, 2.750]}
+
+# The normal approximation used beyond the end of the table
+Z_TABLE = {0.90: 1.645,
+           0.95: 1.960,
+           0.99: 2.576}
+
+CONFIDENCE_LEVELS = sorted(T_TABLE.keys())
+
+def t_critical(degrees_of_freedom, confidence):
+    table = T_TABLE[confidence]
+    if degrees_of_freedom <= len(table):
+        return table[degrees_of_freedom-1]
+    return Z_TABLE[confidence]
+
+def mean(samples):
+    return sum(samples)/float(len(samples))
+
+def median(samples):
+    ordered = sorted(samples)
+    middle  = len(ordered)/2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle-1] + ordered[middle])/2.0
+
+def mean_interval(samples, confidence):
+    """The confidence interval of the mean, assuming the samples are normally
+    distributed"""
+    n = len(samples)
+    if n < 2:
+        return (float("-inf"), float("inf"))
+    centre     = mean(samples)
+    variance   = sum((sample - centre)**2 for sample in samples)/(n-1)
+    half_width = t_critical(n-1, confidence) * math.sqrt(variance/n)
+    return (centre - half_width, centre + half_width)
+
+def median_interval(samples, confidence):
+    """The distribution-free confidence interval of the median, which is formed
+    by the order statistics whose ranks the binomial distribution gives"""
+    n       = len(samples)
+    ordered = sorted(samples)
+    alpha   = 1 - confidence
+    # Find the largest rank r such that P(X < r) <= alpha/2 for X ~ B(n, 1/2)
+    rank       = 0
+    cumulative = 0.0
+    while rank < n/2:
+        cumulative += math.exp(math.lgamma(n+1) - math.lgamma(rank+1) - math.lgamma(n-rank+1) - n*math.log(2))
+        if cumulative > alpha/2:
+            break
+        rank += 1
+    if rank == 0:
+        return (float("-inf"), float("inf"))
+    return (ordered[rank-1], ordered[n-rank])
+
+STATISTICS = {"mean":   (mean, mean_interval),
+              "median": (median, median_interval)}
+
+class Estimate:
+    """A location estimate of a set of timing samples and its confidence interval"""
+
+    def __init__(self, samples, statistic, confidence):
+        estimator, interval = STATISTICS[statistic]
+        self.value          = estimator(samples)
+        self.low, self.high = interval(samples, confidence)
+
+    def relative_width(self):
+        """The half-width of the confidence interval relative to the estimate"""
+        if self.value <= 0 or math.isinf(self.low) or math.isinf(self.high):
+            return float("inf")
+        return (self.high - self.low)/(2 * self.value)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""Combine the records that the shards of an exhaustive search wrote (the
+.jsonl file next to each --log-results-to-file) into one global ranking and a
+summary per kernel"""
+
+import argparse
+import collections
+import json
+import enums
+import compiler_flags
+
+def read_records(file_names):
+    records = []
+    for file_name in file_names:
+        with open(file_name, 'r') as records_file:
+            for line in records_file:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    return records
+
+def best_measurements(records):
+    """A configuration may have been evaluated more than once, e.g. when racing
+    or when a shard was resumed. Keep the measurement made with the most runs"""
+    best = collections.OrderedDict()
+    for record in records:
+        key = (record["kernel"], record["ppcg_flags"])
+        if key not in best or (record["runs"], -record["execution_time"]) > (best[key]["runs"], -best[key]["execution_time"]):
+            best[key] = record
+    return best.values()
+
+def check_shards(records):
+    shards = set(record["shard"] for record in records if record["shard"])
+    counts = set(int(shard.split('/')[1]) for shard in shards)
+    print("Shards merged: %s" % (', '.join(sorted(shards)) or "none"))
+    if len(counts) > 1:
+        print("WARNING: the records come from searches split into different numbers of shards")
+    for count in counts:
+        missing = ["%d/%d" % (index, count) for index in range(count) if "%d/%d" % (index, count) not in shards]
+        if missing:
+            print("WARNING: no records from shards %s" % ', '.join(missing))
+
+def kernel_name(kernel):
+    if kernel == compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL:
+        return "all kernels"
+    return "kernel %d" % kernel
+
+def summarise(records, top):
+    passed = [record for record in best_measurements(records)
+              if record["status"] == enums.Status.passed and record["execution_time"] != 0]
+    print("%s Global ranking %s" % ('*' * 30, '*' * 30))
+    print("%d records, %d distinct configurations passed" % (len(records), len(passed)))
+    by_kernel = collections.defaultdict(list)
+    for record in passed:
+        by_kernel[record["kernel"]].append(record)
+    for kernel in sorted(by_kernel.keys()):
+        ranking = sorted(by_kernel[kernel], key=lambda record: record["execution_time"])
+        print("Tuning %s:" % kernel_name(kernel))
+        for rank, record in enumerate(ranking[:top]):
+            print("%4d. execution time = %f (%d runs, shard %s, ID %d): %s" % (rank+1,
+                                                                               record["execution_time"],
+                                                                               record["runs"],
+                                                                               record["shard"],
+                                                                               record["id"],
+                                                                               record["ppcg_flags"]))
+    print("%s Summary per kernel %s" % ('*' * 30, '*' * 30))
+    best_kernel_time = {}
+    best_kernel_run  = {}
+    for record in passed:
+        for k, kernel_time in enumerate(record["per_kernel_time"]):
+            if kernel_time < best_kernel_time.get(k, float("inf")):
+                best_kernel_time[k] = kernel_time
+                best_kernel_run[k]  = record
+    for k in sorted(best_kernel_time.keys()):
+        print("Best config for kernel %d had execution time %f ms" % (k, best_kernel_time[k]))
+        print("To replicate, use the following configuration:")
+        print(best_kernel_run[k]["ppcg_flags"])
+
+def the_command_line():
+    parser = argparse.ArgumentParser(description="Merge the results of a sharded exhaustive search")
+
+    parser.add_argument("records",
+                        nargs="+",
+                        metavar="<FILE>",
+                        help="the records file of each shard")
+
+    top = 10
+    parser.add_argument("--top",
+                        type=int,
+                        metavar="<int>",
+                        help="show this many of the fastest configurations (default: %d)" % top,
+                        default=top)
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    arguments = the_command_line()
+    records   = read_records(arguments.records)
+    check_shards(records)
+    summarise(records, arguments.top)
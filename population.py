@@ -0,0 +1,133 @@
+import collections
+import compiler_flags
+import individual
+
+# The matrix representation is only used when NumPy is available; otherwise
+# the genetic algorithm manipulates individuals one flag at a time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class Encoding:
+    """Encodes a population as a matrix of integers with one row per individual
+    and one column per gene. The gene of an enumeration flag is the position of
+    its value in the possible values. The --sizes flag takes one column per
+    dimension of the tile, block and grid size of each kernel, holding the size
+    itself, or 0 where an individual has fewer dimensions or no sizes for that
+    kernel. Individuals are only decoded when they are to be evaluated"""
+
+    SIZE_PARTS = ["tile_size", "block_size", "grid_size"]
+
+    def __init__(self, population):
+        self.flag_lists = [compiler_flags.PPCG.optimisation_flags,
+                           compiler_flags.CC.optimisation_flags,
+                           compiler_flags.CXX.optimisation_flags,
+                           compiler_flags.NVCC.optimisation_flags]
+        # (list, flag, column) of every enumeration flag, and for each gene the
+        # first value it may take and how many values follow
+        self.enumerations = []
+        self.columns      = {}
+        offsets           = []
+        counts            = []
+        self.sizes_flag   = None
+        for flag_list_idx, the_flags in enumerate(self.flag_lists):
+            for flag in the_flags:
+                if isinstance(flag, compiler_flags.SizesFlag):
+                    self.sizes_flag = flag
+                    continue
+                self.columns[flag] = len(offsets)
+                self.enumerations.append((flag_list_idx, flag, len(offsets)))
+                if flag.tuneable:
+                    offsets.append(0)
+                    counts.append(len(flag.possible_values))
+                else:
+                    offsets.append(flag.possible_values.index(flag.random_value()))
+                    counts.append(1)
+        self.num_enumerations = len(offsets)
+        self.offsets          = numpy.array(offsets, dtype=numpy.int64)
+        self.counts           = numpy.array(counts, dtype=numpy.int64)
+        # The kernels with sizes and the widest size of each part among them,
+        # leaving room for the random sizes that mutation draws
+        self.kernels = []
+        self.widths  = [0] * len(Encoding.SIZE_PARTS)
+        if self.sizes_flag is not None:
+            self.widths = [self.sizes_flag.tile_dimensions,
+                           self.sizes_flag.block_dimensions,
+                           self.sizes_flag.grid_dimensions]
+            for testcase in population:
+                for kernel, size_tuple in testcase.ppcg_flags.get(self.sizes_flag, {}).iteritems():
+                    if kernel not in self.kernels:
+                        self.kernels.append(kernel)
+                    for part_idx, part in enumerate(Encoding.SIZE_PARTS):
+                        self.widths[part_idx] = max(self.widths[part_idx], len(getattr(size_tuple, part) or ()))
+        self.kernel_width = sum(self.widths)
+        self.num_genes    = self.num_enumerations + len(self.kernels) * self.kernel_width
+
+    def size_columns(self, part):
+        """The columns of one part of the sizes of every kernel"""
+        part_idx = Encoding.SIZE_PARTS.index(part)
+        start    = sum(self.widths[:part_idx])
+        columns  = []
+        for kernel_idx in xrange(len(self.kernels)):
+            first = self.num_enumerations + kernel_idx * self.kernel_width + start
+            columns.extend(xrange(first, first + self.widths[part_idx]))
+        return columns
+
+    def encode_sizes(self, value, row):
+        row[self.num_enumerations:] = 0
+        for kernel_idx, kernel in enumerate(self.kernels):
+            column = self.num_enumerations + kernel_idx * self.kernel_width
+            for part_idx, part in enumerate(Encoding.SIZE_PARTS):
+                if kernel in value:
+                    sizes = getattr(value[kernel], part) or ()
+                    row[column:column + len(sizes)] = sizes
+                column += self.widths[part_idx]
+
+    def encode(self, population):
+        matrix = numpy.zeros((len(population), self.num_genes), dtype=numpy.int64)
+        for row, testcase in zip(matrix, population):
+            flag_values = [testcase.ppcg_flags, testcase.cc_flags, testcase.cxx_flags, testcase.nvcc_flags]
+            for flag_list_idx, flag, column in self.enumerations:
+                row[column] = flag.possible_values.index(flag_values[flag_list_idx][flag])
+            if self.sizes_flag is not None:
+                self.encode_sizes(testcase.ppcg_flags[self.sizes_flag], row)
+        return matrix
+
+    def decode(self, row):
+        testcase    = individual.Individual()
+        flag_values = [testcase.ppcg_flags, testcase.cc_flags, testcase.cxx_flags, testcase.nvcc_flags]
+        for flag_list_idx, the_flags in enumerate(self.flag_lists):
+            for flag in the_flags:
+                if flag is self.sizes_flag:
+                    flag_values[flag_list_idx][flag] = self.decode_sizes(row)
+                else:
+                    flag_values[flag_list_idx][flag] = flag.possible_values[row[self.columns[flag]]]
+        return testcase
+
+    def decode_sizes(self, row):
+        value = collections.OrderedDict()
+        for kernel_idx, kernel in enumerate(self.kernels):
+            column = self.num_enumerations + kernel_idx * self.kernel_width
+            genes  = row[column:column + self.kernel_width]
+            if not genes.any():
+                continue
+            parts = []
+            for width in self.widths:
+                parts.append(tuple(int(size) for size in genes[:width] if size))
+                genes = genes[width:]
+            value[kernel] = compiler_flags.SizeTuple(*parts)
+        return value
+
+    def random_sizes(self, row):
+        """Give every kernel of an individual the same fresh random sizes, as
+        mutating the --sizes flag one individual at a time does"""
+        size_tuple = self.sizes_flag.random_value()[compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL]
+        kernels    = [kernel for kernel_idx, kernel in enumerate(self.kernels)
+                      if row[self.num_enumerations + kernel_idx * self.kernel_width:
+                             self.num_enumerations + (kernel_idx+1) * self.kernel_width].any()]
+        self.encode_sizes(dict((kernel, size_tuple) for kernel in kernels), row)
+
+    def random_genes(self, rng, rows):
+        """Fresh values for every enumeration gene of the given number of rows"""
+        return self.offsets + (rng.random_sample((rows, self.num_enumerations)) * self.counts).astype(numpy.int64)
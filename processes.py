@@ -0,0 +1,137 @@
+import os
+import signal
+import timeit
+import tempfile
+import subprocess
+import threading
+import config
+
+# resource is only available on Unix, and only needed for --memory-limit and
+# --cpu-limit
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PPCG  = "ppcg"
+BUILD = "build"
+RUN   = "run"
+
+# The stages whose address space --memory-limit caps. The runtimes of GPUs map
+# far more virtual memory than they use, so binaries are left alone
+MEMORY_LIMITED_STAGES = [PPCG, BUILD]
+
+def limits(stage):
+    """The resource limits of the processes of a stage as (resource, soft, hard)
+    triples"""
+    the_limits = []
+    if config.Arguments.memory_limit and stage in MEMORY_LIMITED_STAGES:
+        memory = config.Arguments.memory_limit * 1024 * 1024
+        the_limits.append((resource.RLIMIT_AS, memory, memory))
+    if config.Arguments.cpu_limit:
+        # A process is sent SIGXCPU at the soft limit, which tells a CPU limit
+        # apart from other deaths, and SIGKILL at the hard limit if it survives
+        the_limits.append((resource.RLIMIT_CPU, config.Arguments.cpu_limit, config.Arguments.cpu_limit + 1))
+    return the_limits
+
+def spawn(cmd, stage, **kwargs):
+    """Start a shell command in a process group of its own, so that the
+    processes it starts can be killed along with the shell. It runs in the
+    current directory, which concurrent evaluations share"""
+    the_limits = limits(stage)
+
+    def prepare():
+        os.setsid()
+        for the_resource, soft, hard in the_limits:
+            resource.setrlimit(the_resource, (soft, hard))
+
+    return subprocess.Popen(cmd, shell=True, preexec_fn=prepare, close_fds=True, **kwargs)
+
+def kill_group(process):
+    """Kill the process group of a process started by spawn()"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        # The group has already gone
+        pass
+
+def kill(process):
+    """Kill the process group of a process started by spawn() and reap it"""
+    kill_group(process)
+    try:
+        process.wait()
+    except OSError:
+        pass
+
+class Waiter(threading.Thread):
+    """Waits for a process in the background and notes when it exited, so that
+    its elapsed time does not depend on how promptly it is polled"""
+
+    def __init__(self, process):
+        threading.Thread.__init__(self)
+        self.daemon     = True
+        self.process    = process
+        self.returncode = None
+        self.end        = None
+        self.exited     = threading.Event()
+        self.start()
+
+    def run(self):
+        try:
+            self.returncode = self.process.wait()
+        finally:
+            self.end = timeit.default_timer()
+            self.exited.set()
+
+def exceeded_cpu_limit(returncode):
+    """Whether a process, or the command that the shell ran, was killed by
+    --cpu-limit. The shell reports the signal that killed its command as
+    128 plus the signal number"""
+    return config.Arguments.cpu_limit is not None \
+        and returncode in (-signal.SIGXCPU, 128 + signal.SIGXCPU)
+
+def run(cmd, stage, timeout, capture=None, **kwargs):
+    """Run a command to completion or until it has run for timeout seconds,
+    whichever comes first. If capture is "stdout" or "stderr", that stream is
+    returned, having gone to a file so that a chatty process can never block on
+    a full pipe. Returns the return code, which is None if the command timed
+    out, the output and the elapsed time"""
+    output = tempfile.TemporaryFile() if capture else None
+    if capture:
+        kwargs[capture] = output
+    expired = threading.Event()
+
+    def expire():
+        expired.set()
+        kill_group(process)
+
+    timer = None
+    try:
+        process = spawn(cmd, stage, **kwargs)
+        # Timed from when the process has started, as by the event loop, since
+        # forking a large interpreter costs milliseconds
+        start   = timeit.default_timer()
+        # Block until the process exits, which times it as precisely as the
+        # operating system can, and leave the deadline to a timer
+        if timeout < float("inf"):
+            timer = threading.Timer(timeout, expire)
+            timer.daemon = True
+            timer.start()
+        try:
+            process.wait()
+        except BaseException:
+            # The process group does not receive the SIGINT of a Ctrl-C
+            kill(process)
+            raise
+        elapsed = timeit.default_timer() - start
+        if expired.is_set():
+            return None, "", elapsed
+        if not capture:
+            return process.returncode, None, elapsed
+        output.seek(0)
+        return process.returncode, output.read(), elapsed
+    finally:
+        if timer:
+            timer.cancel()
+        if output:
+            output.close()
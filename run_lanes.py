@@ -0,0 +1,140 @@
+import re
+import pipes
+import multiprocessing
+import distutils.spawn
+import config
+import debug
+import enums
+
+# The lanes in which generated binaries are timed. There is always at least
+# one; without --run-lane it is a single lane that pins nothing
+lanes = []
+
+# The cores to which PPCG and the build command are confined, or None if they
+# may run anywhere
+compile_cores = None
+
+def parse_cores(string):
+    """Parse a list of cores such as '0+2+4-7'. Cores are separated by '+'
+    because ',' separates the fields of a lane"""
+    cores = []
+    for part in string.split('+'):
+        match = re.match(r'(\d+)(?:-(\d+))?$', part)
+        if not match:
+            raise ValueError("'%s' is not a list of cores. Expected something like '0+2+4-7'" % string)
+        start = int(match.group(1))
+        end   = int(match.group(2)) if match.group(2) else start
+        if end < start:
+            raise ValueError("The core range '%s' is empty" % part)
+        cores.extend(range(start, end+1))
+    return sorted(set(cores))
+
+def parse_lane(string):
+    """Parse a lane such as 'cores=2+3,numa=0,device=1'. Every field is optional"""
+    lane = Lane()
+    for field in string.split(','):
+        if not field:
+            continue
+        if '=' not in field:
+            raise ValueError("'%s' is not of the form <key>=<value>" % field)
+        key, value = field.split('=', 1)
+        if key == "cores":
+            lane.cores = parse_cores(value)
+        elif key == "numa":
+            if not value.isdigit():
+                raise ValueError("NUMA node '%s' must be an integer" % value)
+            lane.numa_node = int(value)
+        elif key == "device":
+            lane.device = value
+        else:
+            raise ValueError("Unknown run lane field '%s'. Expected 'cores', 'numa' or 'device'" % key)
+    return lane
+
+def core_list(cores):
+    return ','.join(str(core) for core in cores)
+
+def shell_command(cmd):
+    """Commands are shell strings, so wrappers must apply to the whole of it
+    rather than to its first word"""
+    return "/bin/sh -c %s" % pipes.quote(cmd)
+
+def setup_lanes(lane_specs):
+    """Install the lanes given on the command line and confine compilation to
+    the cores which none of them claims"""
+    global lanes, compile_cores
+    lanes = lane_specs or [Lane()]
+    for index, lane in enumerate(lanes):
+        lane.index = index
+    claimed = set()
+    for lane in lanes:
+        if claimed.intersection(lane.cores):
+            debug.warning_message("Run lane %d shares cores with another run lane" % lane.index)
+        claimed.update(lane.cores)
+    compile_cores = None
+    if claimed:
+        remaining = [core for core in range(multiprocessing.cpu_count()) if core not in claimed]
+        if remaining:
+            compile_cores = remaining
+        else:
+            debug.warning_message("The run lanes claim every core, so PPCG and builds will compete with timed binaries")
+    for lane in lanes:
+        lane.check_tools()
+    if compile_cores and not distutils.spawn.find_executable("taskset"):
+        debug.warning_message("'taskset' was not found, so PPCG and builds are not confined to cores %s" % core_list(compile_cores))
+        compile_cores = None
+    debug.verbose_message("Run lanes: %s; compilation cores: %s" % (', '.join(str(lane) for lane in lanes),
+                                                                     core_list(compile_cores) if compile_cores else "any"), __name__)
+
+def compile_command(cmd):
+    if not compile_cores:
+        return cmd
+    return "taskset -c %s %s" % (core_list(compile_cores), shell_command(cmd))
+
+class Lane:
+    """Exclusive resources for timing one binary at a time: a set of cores, a
+    NUMA node and a device"""
+
+    def __init__(self):
+        self.index     = 0
+        self.cores     = []
+        self.numa_node = None
+        self.device    = None
+
+    def check_tools(self):
+        if self.cores and not distutils.spawn.find_executable("taskset"):
+            debug.warning_message("'taskset' was not found, so run lane %d is not pinned to cores %s" % (self.index, core_list(self.cores)))
+            self.cores = []
+        if self.numa_node is not None and not distutils.spawn.find_executable("numactl"):
+            debug.warning_message("'numactl' was not found, so run lane %d is not bound to NUMA node %d" % (self.index, self.numa_node))
+            self.numa_node = None
+
+    def command(self, cmd):
+        """Wrap a run command so that it executes on the resources of this lane"""
+        if not self.cores and self.numa_node is None:
+            return cmd
+        cmd = shell_command(cmd)
+        if self.cores:
+            cmd = "taskset -c %s %s" % (core_list(self.cores), cmd)
+        if self.numa_node is not None:
+            cmd = "numactl --cpunodebind=%d --membind=%d %s" % (self.numa_node, self.numa_node, cmd)
+        return cmd
+
+    def environment(self, env):
+        """Export the lane to the binary. The device index goes to
+        AUTOTUNER_DEVICE and, for CUDA, also to CUDA_VISIBLE_DEVICES"""
+        env["AUTOTUNER_RUN_LANE"] = str(self.index)
+        if self.device is not None:
+            env["AUTOTUNER_DEVICE"] = self.device
+            if config.Arguments.target == enums.Targets.cuda:
+                env["CUDA_VISIBLE_DEVICES"] = self.device
+        return env
+
+    def __str__(self):
+        fields = []
+        if self.cores:
+            fields.append("cores=%s" % core_list(self.cores))
+        if self.numa_node is not None:
+            fields.append("numa=%d" % self.numa_node)
+        if self.device is not None:
+            fields.append("device=%s" % self.device)
+        return "#%d(%s)" % (self.index, ' '.join(fields) or "unpinned")
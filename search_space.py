@@ -0,0 +1,197 @@
+import random
+
+class Product:
+    """The Cartesian product of some pools of values, enumerated in the same
+    order as itertools.product. Unlike itertools.product, the pools are not
+    copied into memory but indexed whenever needed, so a pool may itself be a
+    Product and memory stays constant however large the space. Pools must
+    therefore support indexing, like lists and xranges, or unranking, like
+    Products.
+
+    Tuples are numbered in enumeration order, reading the positions of their
+    values in the pools as the digits of a mixed-radix number whose last digit
+    varies fastest, so the tuple with a given number is found directly"""
+
+    def __init__(self, *pools):
+        self.pools = pools
+
+    def size(self):
+        """The number of tuples in the product"""
+        n = 1
+        for pool in self.pools:
+            n *= pool_size(pool)
+        return n
+
+    def digits(self, index):
+        """The position in each pool of the values of the tuple with this number"""
+        if not 0 <= index < self.size():
+            raise IndexError("Index %d is outside a space of %d configurations" % (index, self.size()))
+        digits = [0] * len(self.pools)
+        for i in reversed(xrange(len(self.pools))):
+            index, digits[i] = divmod(index, pool_size(self.pools[i]))
+        return digits
+
+    def unrank(self, index):
+        """The tuple with this number"""
+        return tuple(pool_value(pool, digit) for pool, digit in zip(self.pools, self.digits(index)))
+
+    def select(self, start=0, step=1):
+        """Enumerate the tuples numbered start, start+step, start+2*step and so
+        on, together with their numbers, without visiting those in between"""
+        size = self.size()
+        if start >= size:
+            return
+        if step != 1:
+            index = start
+            while index < size:
+                yield index, self.unrank(index)
+                index += step
+            return
+        # Advance like an odometer, looking up only the values whose digit changed
+        radices = [pool_size(pool) for pool in self.pools]
+        digits  = self.digits(start)
+        values  = [pool_value(pool, digit) for pool, digit in zip(self.pools, digits)]
+        index   = start
+        while True:
+            yield index, tuple(values)
+            index += 1
+            for i in reversed(xrange(len(self.pools))):
+                digits[i] += 1
+                if digits[i] < radices[i]:
+                    values[i] = pool_value(self.pools[i], digits[i])
+                    break
+                digits[i] = 0
+                values[i] = pool_value(self.pools[i], 0)
+            else:
+                return
+
+    def sample(self, k, rng=random):
+        """Draw k distinct tuples uniformly at random, with their numbers"""
+        for index in sample_indices(self.size(), k, rng):
+            yield index, self.unrank(index)
+
+    def __iter__(self):
+        for index, values in self.select():
+            yield values
+
+def sample_indices(size, k, rng=random):
+    """Draw k distinct numbers from range(size) in random order. Memory is
+    proportional to k, not to size, so size may be astronomically large"""
+    if k >= size:
+        indices = list(xrange(size))
+        rng.shuffle(indices)
+        return indices
+    chosen  = set()
+    indices = []
+    while len(indices) < k:
+        index = rng.randrange(size)
+        if index not in chosen:
+            chosen.add(index)
+            indices.append(index)
+    return indices
+
+def pool_size(pool):
+    if hasattr(pool, "size"):
+        return pool.size()
+    return len(pool)
+
+def pool_value(pool, digit):
+    if hasattr(pool, "unrank"):
+        return pool.unrank(digit)
+    return pool[digit]
+
+class TileBlockSpace:
+    """The legal pairs of tile and block sizes, constructed directly rather
+    than by filtering every pair: in each dimension the tile size must be a
+    multiple of the block size, the product of the block sizes (the work-group
+    size) must lie within bounds, and so must the product of the tile-to-block
+    ratios. Dimensions in which only a tile size or only a block size is given
+    are unconstrained except for the work-group size"""
+
+    def __init__(self, tile_values, tile_dimensions, block_values, block_dimensions,
+                 min_work_group_size, max_work_group_size, max_ratio):
+        self.min_work_group_size = min_work_group_size
+        self.max_work_group_size = max_work_group_size
+        self.max_ratio           = max_ratio
+        self.tile_dimensions     = tile_dimensions
+        self.block_dimensions    = block_dimensions
+        tile_set = set(tile_values) or set([0])
+        # Each dimension offers choices (tile, block, work-group factor, ratio)
+        paired = []
+        for block in sorted(set(block_values)):
+            for ratio in xrange(1, min(max_ratio, max(tile_set) / block) + 1):
+                if block * ratio in tile_set:
+                    paired.append((block * ratio, block, block, ratio))
+        paired.sort()
+        tile_only  = [(tile, None, 1, 1) for tile in sorted(tile_set)]
+        block_only = [(None, block, block, 1) for block in sorted(set(block_values))]
+        self.choices = []
+        for dimension in xrange(max(tile_dimensions, block_dimensions)):
+            if dimension < min(tile_dimensions, block_dimensions):
+                self.choices.append(paired)
+            elif dimension < tile_dimensions:
+                self.choices.append(tile_only)
+            else:
+                self.choices.append(block_only)
+        self.completions = {}
+
+    def count(self, dimension, work_group_size, ratio):
+        """The number of ways to complete a partial choice of sizes which has used
+        up the given work-group size and ratio"""
+        if dimension == len(self.choices):
+            return 1 if work_group_size >= self.min_work_group_size else 0
+        state = (dimension, work_group_size, ratio)
+        if state not in self.completions:
+            n = 0
+            for choice in self.legal_choices(dimension, work_group_size, ratio):
+                n += self.count(dimension+1, work_group_size * choice[2], ratio * choice[3])
+            self.completions[state] = n
+        return self.completions[state]
+
+    def legal_choices(self, dimension, work_group_size, ratio):
+        for choice in self.choices[dimension]:
+            if work_group_size * choice[2] <= self.max_work_group_size \
+            and ratio * choice[3] <= self.max_ratio:
+                yield choice
+
+    def size(self):
+        return self.count(0, 1, 1)
+
+    def sizes(self, chosen):
+        tile  = tuple(choice[0] for choice in chosen if choice[0] is not None)
+        block = tuple(choice[1] for choice in chosen if choice[1] is not None)
+        return (tile, block)
+
+    def unrank(self, index):
+        """The pair of tile and block sizes that is enumerated index-th, found by
+        skipping over whole subtrees of choices using their counts"""
+        if not 0 <= index < self.size():
+            raise IndexError("Index %d is outside a space of %d tile and block sizes" % (index, self.size()))
+        chosen          = []
+        work_group_size = 1
+        ratio           = 1
+        for dimension in xrange(len(self.choices)):
+            for choice in self.legal_choices(dimension, work_group_size, ratio):
+                n = self.count(dimension+1, work_group_size * choice[2], ratio * choice[3])
+                if index < n:
+                    break
+                index -= n
+            chosen.append(choice)
+            work_group_size *= choice[2]
+            ratio           *= choice[3]
+        return self.sizes(chosen)
+
+    def __iter__(self):
+        for chosen in self.extend([], 1, 1):
+            yield self.sizes(chosen)
+
+    def extend(self, chosen, work_group_size, ratio):
+        dimension = len(chosen)
+        if dimension == len(self.choices):
+            yield chosen
+            return
+        for choice in self.legal_choices(dimension, work_group_size, ratio):
+            # Never descend into a partial choice that cannot be completed
+            if self.count(dimension+1, work_group_size * choice[2], ratio * choice[3]):
+                for complete in self.extend(chosen + [choice], work_group_size * choice[2], ratio * choice[3]):
+                    yield complete
@@ -0,0 +1,168 @@
+import json
+import collections
+import config
+import compiler_flags
+import constraints
+import individual
+import kernel_discovery
+import search_space
+
+# The search space given with --space-spec, or None
+spec = None
+
+SIZE_PARTS = ["tile", "block", "grid"]
+
+# The key under which the parameters shared by all kernels are given
+DEFAULT_KERNEL = "default"
+
+def open_spec(file_name):
+    global spec
+    with open(file_name, 'r') as spec_file:
+        try:
+            description = json.load(spec_file)
+        except ValueError as e:
+            raise ValueError("'%s' is not valid JSON: %s" % (file_name, e))
+    spec = SpaceSpec(description)
+    return spec
+
+class SpaceSpec:
+    """A search space described in JSON rather than by the position of lists in
+    explore-params.py. The parameters are given under "kernels", keyed by
+    kernel number or by "default" for every kernel without parameters of its
+    own, which it otherwise extends:
+
+        {"kernels": {"default": {"tile":  {"range": [1, 64], "ladder": "powers-of-two"},
+                                 "block": {"values": [1, 2, 4, 8, 16, 32]},
+                                 "grid":  {"tuples": [[256, 256], [1024, 1024]]},
+                                 "flags": {"--no-shared-memory": [true, false]}},
+                     "1":       {"tile":  {"range": [8, 64], "step": 8, "dimensions": 3}}},
+         "conditions": ["product(block) <= 1024"]}
+
+    Each dimension of a size takes the listed "values", or those of a "range",
+    inclusive, by "step" or along a "ladder" of --tile-size-ladder and friends.
+    The number of "dimensions" defaults to those of the kernel. Alternatively
+    whole "tuples" are listed. The "flags" are any PPCG or isl flags with the
+    values to try. The "conditions" are expressions as for --constraint, given
+    for all kernels or for one, and configurations that break them are skipped.
+
+    Nothing is enumerated up front: the space of a kernel is a Product which
+    is counted, indexed and sampled like the spaces built from the command line"""
+
+    def __init__(self, description):
+        if not isinstance(description, dict) or not isinstance(description.get("kernels"), dict):
+            raise ValueError("The space specification needs an object of \"kernels\"")
+        self.kernels = {}
+        for key, parameters in description["kernels"].iteritems():
+            if key != DEFAULT_KERNEL:
+                try:
+                    key = int(key)
+                except ValueError:
+                    raise ValueError("Kernels are given by number or as \"%s\", not '%s'" % (DEFAULT_KERNEL, key))
+            self.kernels[key] = parameters
+        self.compiled   = {}
+        self.conditions = self.compile_conditions(description.get("conditions", []))
+        for key in self.kernels:
+            # Check every kernel's parameters now rather than when it is reached
+            self.parameters(key)
+
+    def compile_conditions(self, texts):
+        conditions = []
+        for text in texts:
+            try:
+                conditions.append(constraints.Expression(text))
+            except SyntaxError as e:
+                raise ValueError("The condition '%s' is not a Python expression: %s" % (text, e))
+        return conditions
+
+    def parameters(self, kernel):
+        """The parameters of a kernel, extending the default ones"""
+        if kernel not in self.compiled:
+            self.compiled[kernel] = self.compile_parameters(kernel)
+        return self.compiled[kernel]
+
+    def compile_parameters(self, kernel):
+        parameters = dict(self.kernels.get(DEFAULT_KERNEL, {}))
+        parameters.update(self.kernels.get(kernel, {}))
+        for part in SIZE_PARTS:
+            if part not in parameters:
+                raise ValueError("No %s size is given for kernel %s" % (part, kernel))
+        flags = collections.OrderedDict()
+        for name, values in sorted(parameters.get("flags", {}).iteritems()):
+            the_flag = compiler_flags.PPCG.flag_map.get(name) or compiler_flags.PPCG.isl_flag_map.get(name)
+            if the_flag is None:
+                raise ValueError("PPCG flag '%s' not recognised" % name)
+            if not values:
+                raise ValueError("No values are given for flag '%s'" % name)
+            flags[the_flag] = values
+        parameters["flags"]      = flags
+        parameters["conditions"] = self.conditions + self.compile_conditions(parameters.get("conditions", []))
+        return parameters
+
+    def size_pool(self, kernel, part, part_spec):
+        """The tuples that one part of the sizes of a kernel may take"""
+        if "tuples" in part_spec:
+            return [tuple(the_tuple) for the_tuple in part_spec["tuples"]]
+        dimensions = part_spec.get("dimensions", kernel_discovery.dimensions(kernel)[SIZE_PARTS.index(part)])
+        if "values" in part_spec:
+            values = part_spec["values"]
+        elif "range" in part_spec:
+            lower, upper = part_spec["range"]
+            if "ladder" in part_spec:
+                values = compiler_flags.make_ladder(part_spec["ladder"], (lower, upper+1), config.Arguments.warp_size)
+            else:
+                values = xrange(lower, upper+1, part_spec.get("step", 1))
+        else:
+            raise ValueError("The %s size of kernel %s needs \"values\", a \"range\" or \"tuples\"" % (part, kernel))
+        if not len(values):
+            raise ValueError("The %s size of kernel %s has no values" % (part, kernel))
+        return search_space.Product(*[values] * dimensions)
+
+    def kernel_key(self, kernel):
+        return kernel if kernel in self.kernels else DEFAULT_KERNEL
+
+    def sizes_space(self, kernel):
+        """The tile, block and grid sizes of a kernel"""
+        parameters = self.parameters(self.kernel_key(kernel))
+        return search_space.Product(*[self.size_pool(kernel, part, parameters[part]) for part in SIZE_PARTS])
+
+    def space(self, kernel):
+        """The configurations of a kernel: its tile, block and grid sizes
+        followed by the values of its flags"""
+        parameters = self.parameters(self.kernel_key(kernel))
+        pools      = [self.size_pool(kernel, part, parameters[part]) for part in SIZE_PARTS]
+        return search_space.Product(*(pools + parameters["flags"].values()))
+
+    def flags(self, kernel):
+        return self.parameters(self.kernel_key(kernel))["flags"].keys()
+
+    def admits(self, conf, kernel):
+        """Whether a configuration of the space of a kernel, or just its sizes,
+        satisfies the conditions. Flags missing from the configuration are None"""
+        parameters = self.parameters(self.kernel_key(kernel))
+        values     = dict((constraints.flag_variable(flag), None) for flag in compiler_flags.registry.all_flags)
+        values.update(zip(SIZE_PARTS, conf[:len(SIZE_PARTS)]))
+        for flag, value in zip(parameters["flags"].keys(), conf[len(SIZE_PARTS):]):
+            values[constraints.flag_variable(flag)] = value
+        values["kernel"] = kernel
+        return all(condition.satisfied(values) for condition in parameters["conditions"])
+
+    def create_test_case(self, conf, kernel):
+        testcase            = individual.Individual()
+        testcase.kernel_num = kernel
+        sizes_flag          = compiler_flags.registry.lookup(compiler_flags.PPCG.sizes, compiler_flags.FlagRegistry.ppcg)
+        testcase.ppcg_flags[sizes_flag] = collections.OrderedDict([(kernel, compiler_flags.SizeTuple(*conf[:len(SIZE_PARTS)]))])
+        for flag, value in zip(self.flags(kernel), conf[len(SIZE_PARTS):]):
+            testcase.ppcg_flags[flag] = value
+        return testcase
+
+    def unknown_variables(self):
+        """The names in the conditions that are neither helpers, sizes nor flags"""
+        known   = set(constraints.Expression.HELPERS) | constraints.SIZE_VARIABLES \
+                | set(constraints.flag_variable(flag) for flag in compiler_flags.registry.all_flags)
+        unknown = set()
+        for key in self.kernels:
+            parameters = self.parameters(key)
+            known     |= set(constraints.flag_variable(flag) for flag in parameters["flags"])
+            for condition in parameters["conditions"]:
+                unknown |= condition.variables
+        return sorted(unknown - known)
@@ -0,0 +1,72 @@
+import sys
+import random
+import unittest
+import collections
+import compiler_flags
+import constraints
+import individual
+import main
+
+class TestExpression(unittest.TestCase):
+    def setUp(self):
+        self.values = {"kernel": 0, "tile": (4, 8), "block": (2, 4), "grid": (16, 16), "no_shared_memory": None}
+
+    def test_simple(self):
+        self.assertTrue(constraints.Expression("product(block) <= 8").satisfied(self.values))
+        self.assertFalse(constraints.Expression("product(block) < 8").satisfied(self.values))
+
+    def test_generator_expression_sees_helpers(self):
+        self.assertTrue(constraints.Expression("all(t <= 4*len(block) for t in tile)").satisfied(self.values))
+        self.assertFalse(constraints.Expression("all(t <= 2*len(block) for t in tile)").satisfied(self.values))
+
+    def test_generator_expression_sees_variables(self):
+        self.assertTrue(constraints.Expression("all(x <= grid[0] for x in tile)").satisfied(self.values))
+        self.assertFalse(constraints.Expression("any(x > grid[0] for x in tile)").satisfied(self.values))
+
+    def test_comprehension(self):
+        self.assertTrue(constraints.Expression("max([t/b for t, b in zip(tile, block)]) <= 2").satisfied(self.values))
+
+    def test_variables_inside_generator_expressions(self):
+        expression = constraints.Expression("all(x <= grid[0] and unknown for x in tile)")
+        self.assertTrue(set(["tile", "grid", "unknown"]) <= expression.variables)
+
+    def test_no_builtins(self):
+        self.assertRaises(NameError, constraints.Expression("open('x')").satisfied, self.values)
+
+class TestRepair(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The default options, under which random block sizes almost never make
+        # a legal work group
+        argv     = sys.argv
+        sys.argv = ["main.py", "--ppcg-cmd", "ppcg", "--build-cmd", "cc", "--tile-dimensions", "3", "--block-dimensions", "3", "--size-constraints", "random"]
+        try:
+            main.the_command_line()
+        finally:
+            sys.argv = argv
+        main.setup_PPCG_flags()
+
+    def setUp(self):
+        random.seed(0)
+        self.checker = constraints.open_checker(constraints.size_rules())
+
+    def tearDown(self):
+        constraints.checker = None
+
+    def test_repaired_individuals_satisfy_the_size_rules(self):
+        for i in xrange(50):
+            testcase = individual.create_random()
+            self.assertEqual(self.checker.violation(testcase), None)
+        self.assertEqual(sum(self.checker.rejected.values()), 0)
+
+    def test_repair_keeps_the_grid_size(self):
+        testcase = individual.create_random()
+        flag     = compiler_flags.registry.lookup(compiler_flags.PPCG.sizes, compiler_flags.FlagRegistry.ppcg)
+        kernel, size_tuple = testcase.ppcg_flags[flag].items()[0]
+        broken   = compiler_flags.SizeTuple(size_tuple.tile_size, (1024, 1024, 1024), size_tuple.grid_size)
+        testcase.ppcg_flags[flag] = collections.OrderedDict([(kernel, broken)])
+        self.assertTrue(self.checker.repair(testcase))
+        self.assertEqual(testcase.ppcg_flags[flag][kernel].grid_size, size_tuple.grid_size)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import compiler_flags
+import space_spec
+
+class TestSpaceSpec(unittest.TestCase):
+    def setUp(self):
+        compiler_flags.open_registry()
+        self.spec = space_spec.SpaceSpec({"kernels": {"default": {"tile":  {"values": [1, 2, 4, 8], "dimensions": 2},
+                                                                  "block": {"values": [1, 2], "dimensions": 2},
+                                                                  "grid":  {"tuples": [[4, 4]]}},
+                                                      "1":       {"conditions": ["all(t <= len(block) for t in tile)"]}},
+                                          "conditions": ["all(t % b == 0 for t, b in zip(tile, block))",
+                                                         "all(x <= grid[0] for x in tile)"]})
+
+    def admitted(self, kernel):
+        return [conf for conf in self.spec.sizes_space(kernel) if self.spec.admits(conf, kernel)]
+
+    def test_generator_expression_conditions(self):
+        admitted = self.admitted(0)
+        self.assertTrue(admitted)
+        for tile, block, grid in admitted:
+            self.assertTrue(all(t % b == 0 and t <= 4 for t, b in zip(tile, block)))
+        self.assertTrue(((4, 4), (2, 2), (4, 4)) in admitted)
+        self.assertFalse(((8, 4), (2, 2), (4, 4)) in admitted)
+
+    def test_kernel_conditions_extend_the_shared_ones(self):
+        admitted = self.admitted(1)
+        self.assertTrue(admitted)
+        self.assertTrue(set(admitted) < set(self.admitted(0)))
+        for tile, block, grid in admitted:
+            self.assertTrue(all(t <= 2 for t in tile))
+
+    def test_no_unknown_variables(self):
+        self.assertEqual(self.spec.unknown_variables(), [])
+
+if __name__ == '__main__':
+    unittest.main()